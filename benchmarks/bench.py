@@ -0,0 +1,284 @@
+"""Benchmark harness for improving-pdf.
+
+Times the conversion pipeline, stage by stage (see improving_pdf_tool.profiling),
+over the fixtures in test/
+and over synthetic documents (see synthetic.py), and saves the results as
+JSON so that releases can be compared::
+
+    python benchmarks/bench.py --json before.json
+    # ...change things...
+    python benchmarks/bench.py --json after.json --compare before.json
+
+Each case runs a warm-up conversion and then --repeat timed ones in a single
+RenderSession, so the numbers describe the steady state of a warm browser;
+browser launch is reported separately. Mermaid diagrams are rendered afresh
+in every iteration unless --warm-cache is given.
+
+Each case runs in a fresh process, so its peak RSS figures (of the Python
+process, and of the largest browser process) are its own rather than the
+high-water mark of every case before it.
+
+For machines without network access, point --mermaid-js at a local
+mermaid.min.js (unless the package already bundles one) and pass --offline
+to fail fast instead of timing out on the CDN.
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "src"))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from synthetic import PRESETS, DocumentShape, generate, parse_shape  # noqa: E402
+
+FIXTURES = {
+    "sample-input": ROOT / "test" / "sample-input.md",
+    "large-diagrams": ROOT / "test" / "large-diagrams-test.md",
+    "test-input-html": ROOT / "test" / "test-input.html",
+}
+
+
+def _peak_rss_mb() -> dict:
+    """High-water RSS of this process and of its largest reaped child, in MB.
+
+    Both are per process and never go down, hence one process per case.
+    """
+    if resource is None:
+        return {"python": None, "browser": None}
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS.
+    scale = 1 if sys.platform == "darwin" else 1024
+
+    def _mb(who: int) -> float:
+        return round(resource.getrusage(who).ru_maxrss * scale / 2**20, 1)
+
+    return {
+        "python": _mb(resource.RUSAGE_SELF),
+        "browser": _mb(resource.RUSAGE_CHILDREN),
+    }
+
+
+def _summary(samples: list[float]) -> dict:
+    """Median, p90 and extremes of *samples*, in seconds."""
+    ordered = sorted(samples)
+    p90 = ordered[min(len(ordered) - 1, round(0.9 * (len(ordered) - 1)))]
+    return {
+        "median": round(statistics.median(ordered), 4),
+        "p90": round(p90, 4),
+        "min": round(ordered[0], 4),
+        "max": round(ordered[-1], 4),
+    }
+
+
+def _convert(path: Path, out: Path, session, stages: dict) -> int:
+    """Convert *path* under a profile, adding its stage times to *stages*.
+
+    Returns:
+        The size of the PDF in bytes.
+    """
+    from improving_pdf_tool.generator import convert_file
+    from improving_pdf_tool.profiling import profile
+
+    with profile() as prof:
+        convert_file(str(path), str(out), session=session)
+    for stage, seconds in prof.totals().items():
+        stages.setdefault(stage, []).append(seconds)
+    return out.stat().st_size
+
+
+def run_case(name: str, path: Path, args: argparse.Namespace, workdir: Path) -> dict:
+    """Warm up, then time args.repeat conversions of *path*."""
+    from improving_pdf_tool.generator import RenderSession
+
+    out = workdir / f"{name}.pdf"
+    session = RenderSession(
+        use_cache=False, image_dpi=args.image_dpi, inline_svg=args.inline_svg
+    )
+    try:
+        start = time.perf_counter()
+        session.browser
+        launch = time.perf_counter() - start
+
+        _convert(path, out, session, {})
+        stages: dict[str, list[float]] = {}
+        totals = []
+        for _ in range(args.repeat):
+            if not args.warm_cache:
+                session.mermaid_cache.clear()
+            start = time.perf_counter()
+            size = _convert(path, out, session, stages)
+            totals.append(time.perf_counter() - start)
+    finally:
+        session.close()
+
+    return {
+        "browser_launch_seconds": round(launch, 4),
+        "total_seconds": _summary(totals),
+        "stages": {stage: _summary(samples) for stage, samples in stages.items()},
+        "pdf_bytes": size,
+        "peak_rss_mb": _peak_rss_mb(),
+    }
+
+
+def run_case_isolated(
+    name: str, path: Path, args: argparse.Namespace, workdir: Path
+) -> dict:
+    """run_case in a freshly spawned process, so its peak RSS is its own."""
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+        return pool.submit(run_case, name, path, args, workdir).result()
+
+
+def _cases(args: argparse.Namespace, workdir: Path) -> dict[str, tuple[Path, dict]]:
+    """Every case to run: name -> (input path, description)."""
+    cases = {}
+    if not args.no_fixtures:
+        for name, path in FIXTURES.items():
+            cases[name] = (path, {"fixture": str(path.relative_to(ROOT))})
+    shapes: dict[str, DocumentShape] = {
+        f"synthetic-{name}": PRESETS[name] for name in args.preset
+    }
+    for n, spec in enumerate(args.synthetic):
+        shapes[f"synthetic-custom-{n}"] = parse_shape(spec)
+    for name, shape in shapes.items():
+        path = generate(shape, workdir / name)
+        cases[name] = (path, {"synthetic": shape.describe()})
+    if args.case:
+        unknown = set(args.case) - set(cases)
+        if unknown:
+            raise SystemExit(f"Unknown case(s): {', '.join(sorted(unknown))}")
+        cases = {name: cases[name] for name in args.case}
+    return cases
+
+
+def _environment() -> dict:
+    import improving_pdf_tool
+    from improving_pdf_tool.generator import MERMAID_VERSION, _load_mermaid_bundle
+
+    try:
+        from playwright._repo_version import version as playwright_version
+    except ImportError:
+        playwright_version = None
+    return {
+        "tool_version": improving_pdf_tool.__version__,
+        "playwright_version": playwright_version,
+        "mermaid_version": MERMAID_VERSION,
+        "mermaid_bundled": _load_mermaid_bundle() is not None,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+    }
+
+
+def _print_comparison(results: dict, baseline: dict) -> None:
+    """Per-case median change against a previous results file."""
+    print("\nChange in median total time vs baseline:")
+    for name, case in results["cases"].items():
+        old = baseline.get("cases", {}).get(name)
+        if old is None:
+            print(f"  {name:24} (not in baseline)")
+            continue
+        before = old["total_seconds"]["median"]
+        after = case["total_seconds"]["median"]
+        change = (after - before) / before * 100 if before else 0.0
+        print(f"  {name:24} {before:8.3f}s -> {after:8.3f}s  {change:+6.1f}%")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--repeat", type=int, default=5, help="Timed runs per case (default: %(default)s)."
+    )
+    parser.add_argument(
+        "--preset",
+        action="append",
+        choices=sorted(PRESETS),
+        help="Synthetic document preset to run; repeatable (default: all).",
+    )
+    parser.add_argument(
+        "--synthetic",
+        action="append",
+        default=[],
+        metavar="SHAPE",
+        help=(
+            "Extra synthetic document, e.g. "
+            "pages=30,tables=4,table_rows=100,images=8,diagrams=12."
+        ),
+    )
+    parser.add_argument("--no-fixtures", action="store_true", help="Skip the test/ fixtures.")
+    parser.add_argument("--case", action="append", help="Only run the named case(s).")
+    parser.add_argument(
+        "--image-dpi", type=int, default=None, help="Image downsampling DPI for the sessions."
+    )
+    parser.add_argument(
+        "--inline-svg", action="store_true", help="Embed diagrams as inline SVG."
+    )
+    parser.add_argument(
+        "--warm-cache",
+        action="store_true",
+        help="Keep rendered diagrams between timed runs instead of re-rendering them.",
+    )
+    parser.add_argument("--mermaid-js", help="Local mermaid.min.js to serve instead of the CDN.")
+    parser.add_argument(
+        "--offline",
+        action="store_true",
+        help="Refuse to run unless a local Mermaid build is available.",
+    )
+    parser.add_argument("--json", help="Write the results to this file.")
+    parser.add_argument("--compare", help="Previous results file to compare against.")
+    args = parser.parse_args()
+    if args.preset is None:
+        args.preset = sorted(PRESETS)
+
+    if args.mermaid_js:
+        os.environ["IMPROVING_PDF_MERMAID_JS"] = os.path.abspath(args.mermaid_js)
+    from improving_pdf_tool.generator import _load_mermaid_bundle
+
+    if args.offline and _load_mermaid_bundle() is None:
+        raise SystemExit(
+            "--offline needs a local Mermaid build: pass --mermaid-js or vendor "
+            "src/improving_pdf_tool/assets/mermaid/mermaid.min.js"
+        )
+
+    results = {"environment": _environment(), "repeat": args.repeat, "cases": {}}
+    with tempfile.TemporaryDirectory(prefix="improving-pdf-bench-") as tmp:
+        workdir = Path(tmp)
+        for name, (path, description) in _cases(args, workdir).items():
+            print(f"{name} ...", end=" ", flush=True)
+            case = run_case_isolated(name, path, args, workdir)
+            case.update(description)
+            results["cases"][name] = case
+            stages = ", ".join(
+                f"{stage} {summary['median']:.3f}s"
+                for stage, summary in case["stages"].items()
+            )
+            print(
+                f"{case['total_seconds']['median']:.3f}s median "
+                f"(p90 {case['total_seconds']['p90']:.3f}s; {stages}), "
+                f"{case['pdf_bytes'] / 1024:.0f} KiB"
+            )
+
+    if args.json:
+        Path(args.json).write_text(json.dumps(results, indent=2) + "\n", encoding="utf-8")
+        print(f"Results written to {args.json}")
+    if args.compare:
+        _print_comparison(results, json.loads(Path(args.compare).read_text(encoding="utf-8")))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+"""Synthetic Markdown documents of a chosen size, for benchmarking.
+
+Documents are deterministic for a given shape, so timings from different
+runs (and releases) convert exactly the same input. Images are written as
+real PNG files with the standard library only.
+"""
+
+import struct
+import zlib
+from dataclasses import asdict, dataclass
+from pathlib import Path
+
+
+_PARAGRAPH = (
+    "Improving builds software with a focus on **trust**, *craftsmanship* and "
+    "`measurable` outcomes. This paragraph is filler text of a realistic "
+    "length, with [a link](https://example.com) and inline formatting, so "
+    "that Markdown parsing and text layout get representative work to do. "
+)
+
+_DIAGRAMS = [
+    "flowchart LR\n    A[Request {n}] --> B{{Valid?}}\n    B -->|yes| C[Render]\n"
+    "    B -->|no| D[Reject]\n    C --> E[(Cache)]\n    E --> F[PDF {n}]\n",
+    "sequenceDiagram\n    participant C as Client {n}\n    participant S as Server\n"
+    "    C->>S: POST /render\n    S-->>C: 202 Accepted\n    S->>S: print\n"
+    "    S-->>C: application/pdf\n",
+    "classDiagram\n    class Session{n} {{\n        +browser\n        +close()\n    }}\n"
+    "    class Cache{n} {{\n        +get(key)\n        +put(key, data)\n    }}\n"
+    "    Session{n} --> Cache{n}\n",
+]
+
+
+@dataclass(frozen=True)
+class DocumentShape:
+    """How big a synthetic document is.
+
+    Attributes:
+        pages: Sections of roughly one printed page of prose each.
+        tables: Number of tables, spread across the sections.
+        table_rows: Rows in each table.
+        images: Number of distinct PNG images referenced.
+        image_width: Pixel width of each image (height is 9/16 of it).
+        diagrams: Number of distinct Mermaid diagrams.
+    """
+
+    pages: int = 5
+    tables: int = 2
+    table_rows: int = 20
+    images: int = 2
+    image_width: int = 1600
+    diagrams: int = 2
+
+    def describe(self) -> dict:
+        return asdict(self)
+
+
+PRESETS = {
+    "small": DocumentShape(pages=2, tables=1, table_rows=10, images=1, diagrams=1),
+    "medium": DocumentShape(pages=10, tables=5, table_rows=50, images=5, diagrams=5),
+    "large": DocumentShape(pages=50, tables=20, table_rows=200, images=20, diagrams=20),
+}
+
+
+def parse_shape(spec: str) -> DocumentShape:
+    """Parse ``"pages=10,diagrams=3"`` (fields of DocumentShape) into a shape.
+
+    Raises:
+        ValueError: On an unknown field or a non-integer value.
+    """
+    fields = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        name, _, value = item.partition("=")
+        if name not in DocumentShape.__dataclass_fields__:
+            raise ValueError(f"Unknown document field: {name}")
+        fields[name] = int(value)
+    return DocumentShape(**fields)
+
+
+def write_png(path: Path, width: int, height: int, seed: int) -> None:
+    """Write an RGB gradient PNG; *seed* varies the colours per image."""
+    red = bytes(x * 255 // max(1, width - 1) for x in range(width))
+    blue = bytes([seed * 91 % 256]) * width
+    rows = bytearray()
+    row = bytearray(width * 3)
+    row[0::3] = red
+    row[2::3] = blue
+    for y in range(height):
+        row[1::3] = bytes([(y * 255 // max(1, height - 1) + seed * 37) % 256]) * width
+        rows.append(0)  # filter type: none
+        rows += row
+
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        body = kind + data
+        return struct.pack(">I", len(data)) + body + struct.pack(">I", zlib.crc32(body))
+
+    header = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    path.write_bytes(
+        b"\x89PNG\r\n\x1a\n"
+        + chunk(b"IHDR", header)
+        + chunk(b"IDAT", zlib.compress(bytes(rows), 6))
+        + chunk(b"IEND", b"")
+    )
+
+
+def _table(index: int, rows: int) -> str:
+    lines = [
+        f"| Item {index} | Owner | Status | Estimate |",
+        "|---|---|:---:|---:|",
+    ]
+    for row in range(rows):
+        lines.append(
+            f"| Work item {index}.{row} | Team {row % 7} | "
+            f"{('Done', 'In progress', 'Planned')[row % 3]} | {(row * 13) % 40 + 1}d |"
+        )
+    return "\n".join(lines)
+
+
+def _spread(count: int, slots: int) -> list[int]:
+    """How many of *count* items go in each of *slots* sections."""
+    return [count // slots + (1 if n < count % slots else 0) for n in range(slots)]
+
+
+def generate(shape: DocumentShape, directory: Path) -> Path:
+    """Write a document of *shape* (and its images) into *directory*.
+
+    Returns:
+        The path of the generated Markdown file.
+    """
+    directory.mkdir(parents=True, exist_ok=True)
+    image_dir = directory / "images"
+    if shape.images:
+        image_dir.mkdir(exist_ok=True)
+    height = max(1, shape.image_width * 9 // 16)
+    for n in range(shape.images):
+        write_png(image_dir / f"figure-{n}.png", shape.image_width, height, n)
+
+    sections = max(1, shape.pages)
+    tables = iter(range(shape.tables))
+    images = iter(range(shape.images))
+    diagrams = iter(range(shape.diagrams))
+    parts = ["# Synthetic Benchmark Document", "## Generated for performance testing"]
+    for section, (n_tables, n_images, n_diagrams) in enumerate(zip(
+        _spread(shape.tables, sections),
+        _spread(shape.images, sections),
+        _spread(shape.diagrams, sections),
+    )):
+        parts.append(f"## Section {section + 1}")
+        # About a page of prose: six paragraphs of ~75 words.
+        parts.extend(_PARAGRAPH * 2 for _ in range(6))
+        parts.append(f"### Details {section + 1}")
+        parts.append("\n".join(f"- Point {section}.{k}: {_PARAGRAPH[:80]}" for k in range(5)))
+        for _ in range(n_tables):
+            parts.append(_table(next(tables), shape.table_rows))
+        for _ in range(n_images):
+            n = next(images)
+            parts.append(f"![Figure {n}](images/figure-{n}.png)")
+        for _ in range(n_diagrams):
+            n = next(diagrams)
+            source = _DIAGRAMS[n % len(_DIAGRAMS)].format(n=n)
+            parts.append(f"Diagram {n}:\n\n```mermaid\n{source}```")
+
+    path = directory / "document.md"
+    path.write_text("\n\n".join(parts) + "\n", encoding="utf-8")
+    return path
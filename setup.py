@@ -0,0 +1,81 @@
+"""Build hook that vendors the pinned Mermaid build into the package.
+
+Everything else about the package is declared in pyproject.toml. Building a
+wheel or sdist puts dist/mermaid.min.js for MERMAID_VERSION (read from
+generator.py) into src/improving_pdf_tool/assets/mermaid/, where the
+package-data glob ships it, so installed packages render diagrams without
+network access. An existing file is kept. $IMPROVING_PDF_MERMAID_JS, if set
+at build time, names a local copy to use instead of downloading one.
+
+A build that cannot obtain the bundle fails, rather than producing a package
+that silently needs the CDN; editable installs only warn, since a source
+checkout can point $IMPROVING_PDF_MERMAID_JS at a copy at run time.
+"""
+
+import os
+import re
+import shutil
+import sys
+import urllib.request
+from pathlib import Path
+
+from setuptools import setup
+from setuptools.command.build_py import build_py
+from setuptools.command.sdist import sdist
+
+ROOT = Path(__file__).parent
+PACKAGE = ROOT / "src" / "improving_pdf_tool"
+BUNDLE = PACKAGE / "assets" / "mermaid" / "mermaid.min.js"
+
+
+def _mermaid_version() -> str:
+    source = (PACKAGE / "generator.py").read_text(encoding="utf-8")
+    return re.search(r'^MERMAID_VERSION = "([^"]+)"', source, re.MULTILINE).group(1)
+
+
+def vendor_mermaid() -> None:
+    """Put the pinned mermaid.min.js in place, unless it already is."""
+    if BUNDLE.is_file():
+        return
+    local = os.environ.get("IMPROVING_PDF_MERMAID_JS")
+    if local:
+        shutil.copyfile(local, BUNDLE)
+        return
+    url = (
+        f"https://cdn.jsdelivr.net/npm/mermaid@{_mermaid_version()}"
+        "/dist/mermaid.min.js"
+    )
+    with urllib.request.urlopen(url, timeout=60) as response:
+        data = response.read()
+    tmp = BUNDLE.with_suffix(".tmp")
+    tmp.write_bytes(data)
+    os.replace(tmp, BUNDLE)
+
+
+class _VendorMermaid:
+    """Mixin running vendor_mermaid() before the wrapped command."""
+
+    def run(self) -> None:
+        try:
+            vendor_mermaid()
+        except OSError as exc:
+            message = (
+                f"Could not vendor mermaid.min.js ({exc}). Set "
+                "$IMPROVING_PDF_MERMAID_JS to a local copy of the pinned build, "
+                f"or place it at {BUNDLE.relative_to(ROOT)}."
+            )
+            if not getattr(self, "editable_mode", False):
+                raise SystemExit(message)
+            print(f"warning: {message}", file=sys.stderr)
+        super().run()
+
+
+class BuildPy(_VendorMermaid, build_py):
+    pass
+
+
+class Sdist(_VendorMermaid, sdist):
+    pass
+
+
+setup(cmdclass={"build_py": BuildPy, "sdist": Sdist})
@@ -0,0 +1,562 @@
+"""Asyncio counterparts of the generator API, built on playwright.async_api.
+
+The Markdown parsing, Mermaid extraction and templating stages are the
+pure-Python functions from generator.py; only the browser work differs.
+Many conversions can be interleaved on one event loop and one browser::
+
+    async with AsyncRenderSession() as session:
+        await asyncio.gather(*(
+            async_markdown_to_pdf(md, md.replace(".md", ".pdf"), session=session)
+            for md in files
+        ))
+"""
+
+import asyncio
+import os
+from collections.abc import Iterator
+from contextlib import asynccontextmanager
+from pathlib import Path
+
+from playwright.async_api import (
+    Error as PlaywrightError,
+    TimeoutError as PlaywrightTimeoutError,
+    async_playwright,
+)
+
+from improving_pdf_tool.generator import (
+    DEFAULT_DIAGRAM_TIMEOUT,
+    DOCUMENT_ORIGIN,
+    MERMAID_CDN_URL,
+    PDF_OPTIONS,
+    _MERMAID_PAGE_STATE,
+    _MERMAID_RENDER_PAGE,
+    _READY_SCRIPT,
+    _RUNTIME_MERMAID_DONE,
+    _RUNTIME_MERMAID_TIMEOUT,
+    _assemble_document,
+    _assemble_shards,
+    _build_key,
+    _cache_root,
+    _cached_build,
+    _cached_svgs,
+    _diagram_error,
+    _document_url,
+    _embeddable_svg,
+    _ensure_chromium_installed,
+    _load_mermaid_bundle,
+    _merge_shards,
+    _mermaid_unavailable,
+    _open_mermaid_cache,
+    _prepare_markdown,
+    _rebase_file_urls,
+    _serve_profiled,
+    _skip_oversized,
+    _store_build,
+    _store_svgs,
+    _write_pdf,
+)
+from improving_pdf_tool.build_cache import open_build_cache
+from improving_pdf_tool.image_assets import open_image_processor
+from improving_pdf_tool.profiling import current_profile, stage
+
+
+class AsyncRenderSession:
+    """Asyncio version of generator.RenderSession.
+
+    Takes the same options. The browser is launched on first use, and a lock
+    keeps concurrent first uses from launching it twice. The lock covers the
+    launch only: render pages load outside it, so a slow page load never
+    holds up another coroutine's print.
+
+    Mermaid render pages form a pool of up to *mermaid_concurrency* pages
+    shared by every coroutine using the session. Each diagram gets a page to
+    itself for the length of its render, so one document's slow diagram
+    never eats into another's diagram_timeout, and replacing a page that
+    overran cannot disturb a render in progress elsewhere.
+    """
+
+    def __init__(
+        self,
+        cache_dir: str | None = None,
+        use_cache: bool = True,
+        mermaid_concurrency: int = 4,
+        image_dpi: int | None = None,
+        diagram_timeout: float | None = DEFAULT_DIAGRAM_TIMEOUT,
+        max_diagram_bytes: int | None = None,
+        inline_svg: bool = False,
+        build_cache: bool = False,
+        asset_root: str | None = None,
+        shard_concurrency: int = 2,
+    ) -> None:
+        self._playwright = None
+        self._browser = None
+        self._mermaid_pages = []
+        self._idle_pages = []
+        # Pool pages loaded or loading, so the pool never outgrows its cap.
+        self._reserved_pages = 0
+        # Set (and replaced) whenever a page goes idle or a reservation ends.
+        self._pool_changed = asyncio.Event()
+        self._lock = asyncio.Lock()
+        self.mermaid_concurrency = max(1, mermaid_concurrency)
+        self._page_slots = asyncio.Semaphore(self.mermaid_concurrency)
+        self.shard_concurrency = max(1, shard_concurrency)
+        self.diagram_timeout = diagram_timeout
+        self.max_diagram_bytes = max_diagram_bytes
+        self.inline_svg = inline_svg
+        cache_root = _cache_root(cache_dir, use_cache)
+        self.mermaid_cache = _open_mermaid_cache(cache_root)
+        self.images = open_image_processor(image_dpi, cache_root)
+        self.build_cache = open_build_cache(cache_root) if build_cache else None
+        self.asset_root = asset_root
+
+    async def __aenter__(self) -> "AsyncRenderSession":
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.close()
+
+    async def browser(self):
+        """Return the shared Chromium browser, launching it on first call."""
+        async with self._lock:
+            if self._browser is None:
+                with stage("browser_launch"):
+                    # The install check may spawn a subprocess; keep the loop free.
+                    await asyncio.to_thread(_ensure_chromium_installed)
+                    self._playwright = await async_playwright().start()
+                    self._browser = await self._playwright.chromium.launch()
+            return self._browser
+
+    def _notify_pool(self) -> None:
+        """Wake every coroutine waiting in acquire_mermaid_page()."""
+        self._pool_changed.set()
+        self._pool_changed = asyncio.Event()
+
+    async def _load_reserved_page(self):
+        """Load a page for a reservation already counted in _reserved_pages.
+
+        If loading fails, the reservation is given back.
+        """
+        try:
+            page = await self._new_mermaid_page()
+        except BaseException:
+            self._reserved_pages -= 1
+            self._notify_pool()
+            raise
+        self._mermaid_pages.append(page)
+        return page
+
+    async def mermaid_pages(self, count: int) -> None:
+        """Load Mermaid render pages until *count* of them exist.
+
+        *count* is capped at mermaid_concurrency; pages still loading for
+        other coroutines count towards it. The pages join the pool that
+        acquire_mermaid_page() hands out.
+        """
+        count = max(1, min(count, self.mermaid_concurrency))
+        missing = count - self._reserved_pages
+        if missing <= 0:
+            return
+        self._reserved_pages += missing
+        with stage("mermaid_pages", pages=missing):
+            for loaded in range(missing):
+                try:
+                    page = await self._load_reserved_page()
+                except BaseException:
+                    # Give back the reservations of the pages not yet loaded.
+                    self._reserved_pages -= missing - loaded - 1
+                    self._notify_pool()
+                    raise
+                self._idle_pages.append(page)
+                self._notify_pool()
+
+    async def acquire_mermaid_page(self):
+        """Take a render page for the caller's exclusive use.
+
+        Waits while every page is busy, possibly with other coroutines'
+        diagrams, or still loading. Hand the page (or its replacement) back
+        with release_mermaid_page().
+        """
+        await self._page_slots.acquire()
+        try:
+            while not self._idle_pages and (
+                self._reserved_pages >= self.mermaid_concurrency
+            ):
+                await self._pool_changed.wait()
+            if self._idle_pages:
+                return self._idle_pages.pop()
+            self._reserved_pages += 1
+            with stage("mermaid_pages", pages=1):
+                return await self._load_reserved_page()
+        except BaseException:
+            self._page_slots.release()
+            raise
+
+    def release_mermaid_page(self, page) -> None:
+        """Return a page taken with acquire_mermaid_page() to the pool."""
+        # A page replaced or dropped by close() in the meantime is not reused.
+        if page in self._mermaid_pages:
+            self._idle_pages.append(page)
+            self._notify_pool()
+        self._page_slots.release()
+
+    async def replace_mermaid_page(self, page):
+        """Close an acquired render page that overran or crashed.
+
+        Returns:
+            A fresh page, which takes over the old one's place (and its
+            acquisition) in the pool.
+        """
+        if page in self._mermaid_pages:
+            self._mermaid_pages.remove(page)
+        try:
+            await page.close()
+        except PlaywrightError:
+            pass  # crashed, or closed with the browser
+        with stage("mermaid_pages", pages=1):
+            return await self._load_reserved_page()
+
+    async def _new_mermaid_page(self):
+        """Load a Mermaid render page and wait until it can render."""
+        browser = await self.browser()
+        page = await browser.new_page()
+        bundle = _load_mermaid_bundle()
+        if bundle is not None:
+            async def _serve_bundle(route, body=bundle):
+                await route.fulfill(body=body, content_type="application/javascript")
+
+            await page.route(MERMAID_CDN_URL, _serve_bundle)
+        await page.set_content(_MERMAID_RENDER_PAGE)
+        state = await page.wait_for_function(_MERMAID_PAGE_STATE, timeout=15000)
+        if await state.json_value() == "failed":
+            await page.close()
+            raise _mermaid_unavailable()
+        return page
+
+    @asynccontextmanager
+    async def new_page(self):
+        """Yield a page in a fresh browser context, closed on exit."""
+        browser = await self.browser()
+        context = await browser.new_context()
+        try:
+            yield await context.new_page()
+        finally:
+            await context.close()
+
+    async def close(self) -> None:
+        """Close the browser and stop Playwright. Safe to call repeatedly."""
+        if self._browser is not None:
+            await self._browser.close()
+            self._browser = None
+        if self._playwright is not None:
+            await self._playwright.stop()
+            self._playwright = None
+        self._mermaid_pages = []
+        self._idle_pages = []
+        self._reserved_pages = 0
+        self._notify_pool()
+
+
+@asynccontextmanager
+async def _session_scope(session: AsyncRenderSession | None):
+    """Yield *session*, or a temporary one that is closed afterwards."""
+    if session is not None:
+        yield session
+        return
+    async with AsyncRenderSession() as owned:
+        yield owned
+
+
+async def async_prerender_mermaid_to_svgs(
+    diagrams: list[str], session: AsyncRenderSession | None = None
+) -> list[str]:
+    """Async version of generator._prerender_mermaid_to_svgs.
+
+    Diagrams render concurrently, on as many pool pages as the session
+    allows, alongside any other coroutine sharing the event loop. Each is
+    sent on its own, to a page held only for it, under the session's
+    diagram_timeout.
+    """
+    if not diagrams:
+        return []
+
+    async with _session_scope(session) as active:
+        svgs = _cached_svgs(active.mermaid_cache, diagrams)
+        cached = sum(svg is not None for svg in svgs)
+        oversized = _skip_oversized(diagrams, svgs, active.max_diagram_bytes)
+        pending = [i for i, svg in enumerate(svgs) if svg is None]
+        if pending:
+            await active.mermaid_pages(len(pending))
+        with stage(
+            "mermaid", diagrams=len(diagrams), cached=cached, oversized=oversized
+        ) as detail:
+            if pending:
+                detail["render_ms"] = {}
+                # Shared by the workers, so each diagram is taken exactly once.
+                queue = iter(pending)
+                workers = min(len(pending), active.mermaid_concurrency)
+                await asyncio.gather(*(
+                    _render_pending(active, queue, diagrams, svgs, detail)
+                    for _ in range(workers)
+                ))
+
+        _store_svgs(active.mermaid_cache, diagrams, svgs, pending)
+
+    return svgs
+
+
+async def _render_pending(
+    session: AsyncRenderSession,
+    pending: Iterator[int],
+    diagrams: list[str],
+    svgs: list[str | None],
+    detail: dict,
+) -> None:
+    """Render diagrams taken from *pending* until none are left.
+
+    Each diagram gets a pool page to itself for one evaluate call. A diagram
+    that overruns the session's diagram_timeout, or takes its page down,
+    gets an error placeholder, and the page is replaced.
+    """
+    timeout = session.diagram_timeout
+    for i in pending:
+        page = await session.acquire_mermaid_page()
+        try:
+            [(svg, ms, _)] = await asyncio.wait_for(
+                page.evaluate(
+                    "(jobs) => window.renderDiagrams(jobs)",
+                    [[f"mermaid-pre-{i}", diagrams[i]]],
+                ),
+                timeout,
+            )
+        except (asyncio.TimeoutError, PlaywrightError) as exc:
+            if isinstance(exc, asyncio.TimeoutError):
+                message = f"rendering took longer than {timeout:g}s"
+            else:
+                message = "the render page crashed"
+            svgs[i] = _diagram_error(message)
+            detail.setdefault("abandoned", []).append(i)
+            page = await session.replace_mermaid_page(page)
+            continue
+        finally:
+            session.release_mermaid_page(page)
+        svgs[i] = _embeddable_svg(svg, detail)
+        detail["render_ms"][i] = round(ms, 1)
+
+
+async def async_markdown_to_pdf(
+    md_path: str,
+    pdf_path: str,
+    session: AsyncRenderSession | None = None,
+    shards: int = 1,
+) -> str:
+    """Async version of generator.markdown_to_pdf.
+
+    Returns:
+        The absolute path to the generated PDF file.
+    """
+    md_path = str(Path(md_path).resolve())
+    if not os.path.isfile(md_path):
+        raise FileNotFoundError(f"Markdown file not found: {md_path}")
+
+    with stage("read"), open(md_path, "r", encoding="utf-8") as f:
+        markdown_text = f.read()
+
+    pdf = await async_markdown_to_pdf_bytes(
+        markdown_text, base_dir=str(Path(md_path).parent), session=session, shards=shards
+    )
+    return _write_pdf(pdf, pdf_path)
+
+
+async def async_markdown_to_pdf_bytes(
+    markdown_text: str,
+    base_dir: str | None = None,
+    session: AsyncRenderSession | None = None,
+    shards: int = 1,
+) -> bytes:
+    """Async version of generator.markdown_to_pdf_bytes.
+
+    With *shards*, up to the session's shard_concurrency shards are loaded
+    and printed concurrently.
+    """
+    if shards < 1:
+        raise ValueError(f"shards must be at least 1, got {shards}")
+
+    key = _build_key(session, "markdown", markdown_text, base_dir, shards=shards)
+    pdf = _cached_build(session, key)
+    if pdf is not None:
+        return pdf
+
+    with stage("markdown"):
+        html_content, mermaid_sources, title = _prepare_markdown(markdown_text)
+
+    async with _session_scope(session) as active:
+        svgs = await async_prerender_mermaid_to_svgs(mermaid_sources, session=active)
+        if shards > 1:
+            with stage("assemble"):
+                contents, documents = _assemble_shards(
+                    html_content, title, svgs, shards, inline_svgs=active.inline_svg
+                )
+        else:
+            with stage("assemble"):
+                documents = [
+                    _assemble_document(
+                        html_content, title, svgs, inline_svgs=active.inline_svg
+                    )
+                ]
+        if len(documents) > 1:
+            pdfs = await _print_shards(documents, base_dir, active)
+            # Merging is CPU-bound; keep the loop free.
+            pdf = await asyncio.to_thread(_merge_shards, pdfs, contents)
+        else:
+            pdf = await async_html_to_pdf_bytes(
+                documents[0], base_dir=base_dir, session=active
+            )
+
+    if all(svg.startswith("<svg") for svg in svgs):
+        _store_build(session, key, pdf)
+    return pdf
+
+
+async def _print_page(page, url: str) -> tuple[bytes, bool]:
+    """Async version of generator._print_page."""
+    profile = current_profile()
+    tracing = profile is not None and profile.trace_path is not None
+    if tracing:
+        await page.context.browser.start_tracing(page=page, path=profile.trace_path)
+    try:
+        with stage("load") as detail:
+            # Lay out for print from the start, so print-only resources (brand
+            # backgrounds) are fetched as part of the load the readiness
+            # check awaits.
+            await page.emulate_media(media="print")
+            await page.goto(url, wait_until="load")
+            ready = await _wait_until_ready(page)
+            if not ready:
+                detail["runtime_mermaid"] = "timed out"
+        return await _save_pdf(page), ready
+    finally:
+        if tracing:
+            await page.context.browser.stop_tracing()
+
+
+async def _wait_until_ready(page) -> bool:
+    """Async version of generator._wait_until_ready."""
+    await page.evaluate(_READY_SCRIPT)
+    try:
+        await page.wait_for_function(
+            _RUNTIME_MERMAID_DONE, timeout=_RUNTIME_MERMAID_TIMEOUT
+        )
+    except PlaywrightTimeoutError:
+        return False
+    return True
+
+
+async def _save_pdf(page, **detail) -> bytes:
+    """Async version of generator._save_pdf."""
+    with stage("pdf", **detail) as recorded:
+        pdf = await page.pdf(**PDF_OPTIONS)
+        recorded["bytes"] = len(pdf)
+    return pdf
+
+
+async def _print_shards(
+    documents: list[str], base_dir: str | None, session: AsyncRenderSession
+) -> list[bytes]:
+    """Async version of generator._print_shards.
+
+    Shards load and print concurrently, up to session.shard_concurrency at
+    a time.
+    """
+    profile = current_profile()
+    tracing = profile is not None and profile.trace_path is not None
+    browser = await session.browser()
+    slots = asyncio.Semaphore(session.shard_concurrency)
+
+    async def _print_shard(n: int, html: str) -> bytes:
+        async with slots, session.new_page() as page:
+            await _route_document(
+                page, html, base_dir, session.images, profile, session.asset_root
+            )
+            with stage("load", shard=n) as detail:
+                # Print media from the start, as in _print_page.
+                await page.emulate_media(media="print")
+                await page.goto(_document_url(base_dir), wait_until="load")
+                if not await _wait_until_ready(page):
+                    detail["runtime_mermaid"] = "timed out"
+            return await _save_pdf(page, shard=n)
+
+    if tracing:
+        await browser.start_tracing(path=profile.trace_path)
+    try:
+        return list(await asyncio.gather(*(
+            _print_shard(n, html) for n, html in enumerate(documents)
+        )))
+    finally:
+        if tracing:
+            await browser.stop_tracing()
+
+
+async def _route_document(
+    page, html: str, base_dir: str | None, images, profile, asset_root: str | None = None
+) -> None:
+    """Async version of generator._route_document.
+
+    With *images*, responses are prepared in a worker thread: reading,
+    hashing and resizing a large image would otherwise stall every other
+    conversion on the event loop.
+    """
+    html = _rebase_file_urls(html)
+
+    async def _serve(route):
+        args = (route.request.url, html, base_dir, images, profile, asset_root)
+        if images is not None:
+            response = await asyncio.to_thread(_serve_profiled, *args)
+        else:
+            response = _serve_profiled(*args)
+        await route.fulfill(**response)
+
+    await page.route(DOCUMENT_ORIGIN + "**", _serve)
+
+
+async def async_html_to_pdf_bytes(
+    html: str, base_dir: str | None = None, session: AsyncRenderSession | None = None
+) -> bytes:
+    """Async version of generator.html_to_pdf_bytes."""
+    profile = current_profile()
+
+    async with _session_scope(session) as active, active.new_page() as page:
+        await _route_document(
+            page, html, base_dir, active.images, profile, active.asset_root
+        )
+        pdf, _ = await _print_page(page, _document_url(base_dir))
+        return pdf
+
+
+async def async_html_to_pdf(
+    html_path: str, pdf_path: str, session: AsyncRenderSession | None = None
+) -> str:
+    """Async version of generator.html_to_pdf.
+
+    Returns:
+        The absolute path to the generated PDF file.
+    """
+    html_path = str(Path(html_path).resolve())
+
+    if not os.path.isfile(html_path):
+        raise FileNotFoundError(f"HTML file not found: {html_path}")
+
+    path = Path(html_path)
+    key = None
+    if session is not None and session.build_cache is not None:
+        key = _build_key(
+            session, "html", path.read_text(encoding="utf-8"), str(path.parent)
+        )
+    pdf = _cached_build(session, key)
+    if pdf is None:
+        async with _session_scope(session) as active, active.new_page() as page:
+            pdf, ready = await _print_page(page, path.as_uri())
+        # Runtime Mermaid that timed out (CDN unreachable) may work next time.
+        if ready:
+            _store_build(session, key, pdf)
+
+    return _write_pdf(pdf, pdf_path)
@@ -0,0 +1,206 @@
+"""Concurrent batch conversion of many documents into an output directory."""
+
+import glob
+import os
+import queue
+import threading
+import time
+from collections.abc import Iterator
+from dataclasses import dataclass
+from pathlib import Path
+
+from improving_pdf_tool.generator import (
+    HTML_EXTENSIONS,
+    MARKDOWN_EXTENSIONS,
+    RenderSession,
+    convert_file,
+)
+
+
+@dataclass
+class BatchResult:
+    """Outcome of converting one input file in a batch."""
+
+    input_path: str
+    output_path: str
+    error: str | None = None
+    seconds: float = 0.0
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+def _glob_root(pattern: str) -> str:
+    """The leading directories of *pattern* that contain no wildcards."""
+    parts = Path(pattern).parts
+    for n, part in enumerate(parts):
+        if glob.has_magic(part):
+            return str(Path(*parts[:n])) if n else "."
+    return str(Path(pattern).parent)
+
+
+def collect_inputs(patterns: list[str]) -> list[tuple[str, str]]:
+    """Expand files, directories and glob patterns into a sorted input list.
+
+    Directories are searched recursively, and glob patterns expanded, for
+    files with supported input extensions. Patterns that match nothing are kept as-is so the missing file is
+    reported as a per-file failure rather than silently dropped.
+
+    Returns:
+        (input path, output name) pairs, sorted by input path. The output
+        name is the input's path relative to the directory (or the glob's
+        fixed leading directories) it was found under, with a .pdf suffix,
+        so a docs tree keeps its layout in the output directory.
+    """
+    extensions = HTML_EXTENSIONS + MARKDOWN_EXTENSIONS
+    found: list[tuple[str, str]] = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            for root, _dirs, files in os.walk(pattern):
+                found.extend(
+                    (path, os.path.relpath(path, pattern))
+                    for path in (os.path.join(root, name) for name in files)
+                    if path.endswith(extensions)
+                )
+        elif glob.has_magic(pattern):
+            root = _glob_root(pattern)
+            found.extend(
+                (path, os.path.relpath(path, root))
+                for path in glob.glob(pattern, recursive=True)
+                if os.path.isfile(path) and path.endswith(extensions)
+            )
+        else:
+            found.append((pattern, os.path.basename(pattern)))
+
+    seen = set()
+    unique = []
+    for path, relative in found:
+        key = os.path.abspath(path)
+        if key not in seen:
+            seen.add(key)
+            unique.append((path, str(Path(relative).with_suffix(".pdf"))))
+    return sorted(unique)
+
+
+def _output_paths(
+    inputs: list[str | tuple[str, str]], output_dir: str
+) -> tuple[list[tuple[str, str]], dict[int, str]]:
+    """Map each input to its path under *output_dir*.
+
+    Plain paths go to ``<output_dir>/<stem>.pdf``; (path, output name)
+    pairs from collect_inputs to ``<output_dir>/<output name>``.
+
+    Returns:
+        A tuple of the (input, output) pairs and, by index, the error of
+        each input whose output another, earlier input already claims.
+    """
+    pairs = []
+    collisions: dict[int, str] = {}
+    owners: dict[str, str] = {}
+    for index, item in enumerate(inputs):
+        src, name = (item, f"{Path(item).stem}.pdf") if isinstance(item, str) else item
+        out = str(Path(output_dir) / name)
+        key = os.path.normcase(os.path.abspath(out))
+        if key in owners:
+            collisions[index] = f"{owners[key]} is also written to {out}"
+        else:
+            owners[key] = src
+        pairs.append((src, out))
+    return pairs, collisions
+
+
+def _drain(jobs: "queue.Queue[int]") -> Iterator[int]:
+    """Take job indices from *jobs* until it is empty."""
+    while True:
+        try:
+            yield jobs.get_nowait()
+        except queue.Empty:
+            return
+
+
+def _worker(jobs: "queue.Queue[int]", pairs: list[tuple[str, str]],
+            results: list[BatchResult | None], session_options: dict) -> None:
+    """Drain *jobs* using one RenderSession (one Chromium) for this thread.
+
+    If the session cannot be created (bad options, a missing optional
+    dependency), the jobs this thread takes fail with that error instead.
+    """
+    try:
+        session = RenderSession(**session_options)
+    except Exception as exc:
+        error = f"{type(exc).__name__}: {exc}"
+        for index in _drain(jobs):
+            results[index] = BatchResult(*pairs[index], error)
+        return
+    with session:
+        for index in _drain(jobs):
+            src, out = pairs[index]
+            start = time.perf_counter()
+            try:
+                convert_file(src, out, session=session)
+                error = None
+            except Exception as exc:
+                error = f"{type(exc).__name__}: {exc}"
+            results[index] = BatchResult(
+                src, out, error, time.perf_counter() - start
+            )
+
+
+def convert_batch(
+    inputs: list[str | tuple[str, str]],
+    output_dir: str,
+    workers: int | None = None,
+    session_options: dict | None = None,
+) -> list[BatchResult]:
+    """Convert many files into *output_dir*, several at a time.
+
+    Each worker thread owns a RenderSession, i.e. its own warm Chromium, and
+    pulls files from a shared queue until none are left. Playwright's sync
+    API is bound to the thread that started it, so browsers are never shared
+    between workers. A failing file is recorded in its result and does not
+    stop the rest of the batch; neither does an input whose output path an
+    earlier input already takes, which is recorded as failed unconverted.
+
+    Args:
+        inputs: Input file paths, written to ``<stem>.pdf``, or the
+            (path, output name) pairs returned by collect_inputs.
+        output_dir: Directory for the generated PDFs; created if missing.
+        workers: Number of concurrent browsers. Defaults to the CPU count,
+            capped at the number of inputs.
+        session_options: Keyword arguments for each worker's RenderSession,
+            e.g. ``{"use_cache": False}``.
+
+    Returns:
+        One BatchResult per input, in input order.
+    """
+    if not inputs:
+        return []
+
+    os.makedirs(output_dir, exist_ok=True)
+    pairs, collisions = _output_paths(inputs, output_dir)
+    results: list[BatchResult | None] = [None] * len(pairs)
+    for index, error in collisions.items():
+        src, out = pairs[index]
+        results[index] = BatchResult(src, out, error)
+
+    jobs: "queue.Queue[int]" = queue.Queue()
+    for index in range(len(pairs)):
+        if index not in collisions:
+            jobs.put(index)
+    workers = max(1, min(workers or os.cpu_count() or 1, jobs.qsize()))
+
+    threads = [
+        threading.Thread(target=_worker, args=(jobs, pairs, results, session_options or {}), daemon=True)
+        for _ in range(workers)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # A worker whose browser failed to launch leaves its claimed job unset.
+    return [
+        result or BatchResult(src, out, "Worker failed before converting this file")
+        for result, (src, out) in zip(results, pairs)
+    ]
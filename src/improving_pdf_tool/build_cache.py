@@ -0,0 +1,113 @@
+"""Opt-in cache of finished PDFs, so unchanged documents skip the browser.
+
+A build is keyed by everything that goes into the PDF:
+
+- the input text, and the content hash of every local file it references
+  (or the fact that a referenced file is missing);
+- the template, brand images, Mermaid and Playwright versions and the
+  tool version (the environment fingerprint, computed by the generator);
+- the render options that change the output, and the current year, which
+  the footer prints.
+
+On a hit the stored PDF is returned without parsing the input or starting
+Chromium. Entries live in the cache directory next to the diagram and image
+caches, in their own size-bounded DiskCache with LRU eviction.
+
+Only direct references are followed: an image used by a stylesheet that the
+document links to is not part of the key.
+"""
+
+import hashlib
+import os
+import re
+import urllib.parse
+from pathlib import Path
+
+from improving_pdf_tool.cache import DiskCache, cache_key
+
+
+# Subdirectory of the cache root holding finished PDFs.
+BUILD_CACHE_SUBDIR = "pdf"
+
+DEFAULT_BUILD_CACHE_MAX_BYTES = 256 * 1024 * 1024
+
+# Local references in Markdown images, Markdown link reference definitions
+# (the targets of reference-style images such as ![logo][l]) and HTML
+# src/href attributes. Markdown destinations may be wrapped in <...>.
+_MARKDOWN_IMAGE_RE = re.compile(r"!\[[^\]]*\]\(\s*(?:<([^>\n]+)>|([^)\s]+))")
+_REFERENCE_DEFINITION_RE = re.compile(
+    r"^ {0,3}\[(?!\^)[^\]]+\]:\s*(?:<([^>\n]+)>|(\S+))", re.MULTILINE
+)
+_HTML_REF_RE = re.compile(r"""\b(?:src|href)\s*=\s*["']([^"']+)["']""", re.IGNORECASE)
+
+
+def local_references(text: str, base_dir: Path) -> list[Path]:
+    """Resolve the local paths that *text* references, relative to *base_dir*.
+
+    file:// URLs count as local; other remote URLs, data URIs and in-page
+    anchors are skipped. Paths are returned in order of first reference,
+    whether or not they exist.
+    """
+    # Deferred so that importing this module stays cheap (~30 ms).
+    from urllib.request import url2pathname
+
+    paths: list[Path] = []
+    matches = [
+        *_MARKDOWN_IMAGE_RE.finditer(text),
+        *_REFERENCE_DEFINITION_RE.finditer(text),
+        *_HTML_REF_RE.finditer(text),
+    ]
+    for match in matches:
+        parsed = urllib.parse.urlsplit(next(group for group in match.groups() if group))
+        if parsed.scheme == "file":
+            path = Path(url2pathname(parsed.path)).resolve()
+        elif parsed.scheme or parsed.netloc or not parsed.path:
+            continue
+        else:
+            path = (base_dir / urllib.parse.unquote(parsed.path)).resolve()
+        if path not in paths:
+            paths.append(path)
+    return paths
+
+
+def _file_digest(path: Path) -> str:
+    """sha256 of the file at *path*, or "missing" if it cannot be read."""
+    digest = hashlib.sha256()
+    try:
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+    except OSError:
+        return "missing"
+    return digest.hexdigest()
+
+
+def build_key(
+    kind: str, source: str, base_dir: str | None, fingerprint: str, options: dict
+) -> str:
+    """Cache key for converting *source* (of input *kind*) with *options*.
+
+    Args:
+        kind: The input type, e.g. "markdown" or "html".
+        source: The input text.
+        base_dir: Directory that relative references resolve against, or
+            None if they are not served.
+        fingerprint: The environment fingerprint (template, assets, versions).
+        options: JSON-serialisable render options that affect the output.
+    """
+    parts = [kind, fingerprint, repr(sorted(options.items())), source]
+    if base_dir is not None:
+        root = Path(base_dir).resolve()
+        for path in local_references(source, root):
+            parts.append(os.path.relpath(path, root))
+            parts.append(_file_digest(path))
+    return cache_key(*parts)
+
+
+def open_build_cache(cache_root: str | None) -> DiskCache | None:
+    """A session's build cache; None when caching is off."""
+    if cache_root is None:
+        return None
+    return DiskCache(
+        os.path.join(cache_root, BUILD_CACHE_SUBDIR), DEFAULT_BUILD_CACHE_MAX_BYTES
+    )
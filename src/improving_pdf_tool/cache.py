@@ -0,0 +1,171 @@
+"""Size-bounded, content-addressed on-disk cache with LRU eviction."""
+
+import hashlib
+import os
+import shutil
+import tempfile
+from collections import OrderedDict
+from pathlib import Path
+
+
+DEFAULT_MAX_BYTES = 128 * 1024 * 1024
+
+# Budget of the per-session in-memory cache used when disk caching is off.
+DEFAULT_MEMORY_MAX_BYTES = 16 * 1024 * 1024
+
+
+def default_cache_dir() -> str:
+    """Return the root cache directory for improving-pdf.
+
+    Honours $IMPROVING_PDF_CACHE_DIR, then $XDG_CACHE_HOME, and falls back to
+    ~/.cache/improving-pdf.
+    """
+    explicit = os.environ.get("IMPROVING_PDF_CACHE_DIR")
+    if explicit:
+        return explicit
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(Path.home(), ".cache")
+    return os.path.join(base, "improving-pdf")
+
+
+def cache_disabled_by_env() -> bool:
+    """True when $IMPROVING_PDF_NO_CACHE is set to a non-empty value."""
+    return bool(os.environ.get("IMPROVING_PDF_NO_CACHE"))
+
+
+def cache_key(*parts: str | bytes) -> str:
+    """Hash *parts* into a hex key; parts are length-prefixed to avoid clashes."""
+    digest = hashlib.sha256()
+    for part in parts:
+        data = part.encode("utf-8") if isinstance(part, str) else part
+        digest.update(len(data).to_bytes(8, "big"))
+        digest.update(data)
+    return digest.hexdigest()
+
+
+class DiskCache:
+    """A directory of immutable entries addressed by hex key.
+
+    Each entry is one file, written atomically. Reads refresh the entry's
+    modification time, and once the directory grows past *max_bytes* the
+    least recently used entries are deleted. Several processes may share a
+    directory; a concurrently evicted entry is simply a cache miss.
+    """
+
+    def __init__(self, directory: str, max_bytes: int = DEFAULT_MAX_BYTES) -> None:
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self._size: int | None = None
+
+    def _path(self, key: str) -> Path:
+        return self.directory / key[:2] / key
+
+    def get(self, key: str) -> bytes | None:
+        """Return the entry for *key*, or None on a miss."""
+        path = self._path(key)
+        try:
+            data = path.read_bytes()
+            os.utime(path)
+        except OSError:
+            return None
+        return data
+
+    def put(self, key: str, data: bytes) -> None:
+        """Store *data* under *key*, evicting old entries if over budget.
+
+        Write failures (read-only or full disk) are ignored; the cache is
+        an optimisation, never a reason for a render to fail.
+        """
+        path = self._path(key)
+        try:
+            replaced = path.stat().st_size
+        except OSError:
+            replaced = 0
+        tmp = None
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except OSError:
+            if tmp is not None:
+                try:
+                    os.unlink(tmp)
+                except OSError:
+                    pass
+            return
+
+        if self._size is not None:
+            self._size += len(data) - replaced
+        if self._size is None or self._size > self.max_bytes:
+            self._evict()
+
+    def _entries(self) -> list[tuple[Path, os.stat_result]]:
+        entries = []
+        if not self.directory.is_dir():
+            return entries
+        for shard in self.directory.iterdir():
+            if not shard.is_dir():
+                continue
+            for entry in shard.iterdir():
+                try:
+                    entries.append((entry, entry.stat()))
+                except OSError:
+                    continue
+        return entries
+
+    def _evict(self) -> None:
+        """Delete least recently used entries until under max_bytes."""
+        entries = self._entries()
+        total = sum(st.st_size for _, st in entries)
+        for entry, st in sorted(entries, key=lambda e: e[1].st_mtime):
+            if total <= self.max_bytes:
+                break
+            try:
+                entry.unlink()
+            except OSError:
+                continue
+            total -= st.st_size
+        self._size = total
+
+    def clear(self) -> None:
+        """Delete every entry in the cache directory."""
+        shutil.rmtree(self.directory, ignore_errors=True)
+        self._size = 0
+
+
+class MemoryCache:
+    """In-process stand-in for DiskCache, with the same get/put interface.
+
+    Used when the disk cache is disabled, so that a long-lived session
+    (watch mode, a server worker) still renders an unchanged input once.
+    Least recently used entries are dropped past *max_bytes*.
+    """
+
+    def __init__(self, max_bytes: int = DEFAULT_MEMORY_MAX_BYTES) -> None:
+        self.max_bytes = max_bytes
+        self._entries: OrderedDict[str, bytes] = OrderedDict()
+        self._size = 0
+
+    def get(self, key: str) -> bytes | None:
+        """Return the entry for *key*, or None on a miss."""
+        data = self._entries.get(key)
+        if data is not None:
+            self._entries.move_to_end(key)
+        return data
+
+    def put(self, key: str, data: bytes) -> None:
+        """Store *data* under *key*, dropping old entries if over budget."""
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._size -= len(old)
+        self._entries[key] = data
+        self._size += len(data)
+        while self._size > self.max_bytes and len(self._entries) > 1:
+            _, dropped = self._entries.popitem(last=False)
+            self._size -= len(dropped)
+
+    def clear(self) -> None:
+        """Drop every entry."""
+        self._entries.clear()
+        self._size = 0
@@ -1,44 +1,357 @@
-"""CLI entry point for the improving-pdf tool."""
+"""CLI entry point for the improving-pdf tool.
+
+The converter modules (and through them Playwright and Markdown) are
+imported only once a conversion is actually requested, so --help and
+argument errors return immediately.
+"""
 
 import argparse
 import sys
+from contextlib import nullcontext
+
+
+def _add_session_arguments(parser: argparse.ArgumentParser) -> None:
+    """Flags shared by conversions and the server that configure a session."""
+    parser.add_argument(
+        "--image-dpi",
+        type=int,
+        default=None,
+        help=(
+            "Downsample referenced PNG/JPEG/WebP images to this print "
+            "resolution for the Letter page width (e.g. 150). Requires Pillow."
+        ),
+    )
+    parser.add_argument(
+        "--diagram-timeout",
+        type=float,
+        default=None,
+        metavar="SECONDS",
+        help=(
+            "Give up on a Mermaid diagram still rendering after this long and "
+            "show an error in its place; 0 for no limit (default: 30)."
+        ),
+    )
+    parser.add_argument(
+        "--max-diagram-size",
+        type=int,
+        default=None,
+        metavar="BYTES",
+        help="Show an error instead of rendering Mermaid sources larger than this.",
+    )
+    parser.add_argument(
+        "--inline-svg",
+        action="store_true",
+        help=(
+            "Embed Mermaid diagrams as inline SVG instead of base64 images, "
+            "which makes the HTML a third smaller."
+        ),
+    )
+    parser.add_argument(
+        "--build-cache",
+        action="store_true",
+        help=(
+            "Cache finished PDFs, so that unchanged documents (same text, "
+            "referenced files and options) are not printed again."
+        ),
+    )
+    parser.add_argument(
+        "--cache-dir",
+        default=None,
+        help="Directory for cached renders (default: ~/.cache/improving-pdf).",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Neither read nor write the render cache.",
+    )
+
+
+def _session_options(args: argparse.Namespace) -> dict:
+    """RenderSession keyword arguments derived from the CLI flags."""
+    options = {
+        "cache_dir": args.cache_dir,
+        "use_cache": not args.no_cache,
+        "image_dpi": args.image_dpi,
+        "max_diagram_bytes": args.max_diagram_size,
+        "inline_svg": args.inline_svg,
+        "build_cache": args.build_cache,
+    }
+    if args.diagram_timeout is not None:
+        options["diagram_timeout"] = args.diagram_timeout or None
+    return options
+
+
+def _clear_cache(args: argparse.Namespace) -> None:
+    """Delete the improving-pdf cache entries (see generator.clear_cache).
+
+    The confirmation goes to stderr when the PDF itself is written to
+    stdout (-o -), so it cannot end up in front of the PDF bytes.
+    """
+    from improving_pdf_tool.generator import clear_cache
 
-from improving_pdf_tool.generator import html_to_pdf, markdown_to_pdf
+    stream = sys.stderr if args.output == "-" else sys.stdout
+    print(f"Cache cleared: {clear_cache(args.cache_dir)}", file=stream)
+
+
+def _run_batch(args: argparse.Namespace) -> None:
+    """Convert every input into args.output_dir and print a per-file report."""
+    from improving_pdf_tool.batch import collect_inputs, convert_batch
+
+    inputs = collect_inputs(args.inputs)
+    if not inputs:
+        print("Error: No input files found.", file=sys.stderr)
+        sys.exit(1)
+
+    results = convert_batch(
+        inputs,
+        args.output_dir,
+        workers=args.jobs,
+        session_options=_session_options(args),
+    )
+
+    failed = [r for r in results if not r.ok]
+    for r in results:
+        if r.ok:
+            print(f"ok      {r.input_path} -> {r.output_path} ({r.seconds:.1f}s)")
+        else:
+            print(f"FAILED  {r.input_path}: {r.error}", file=sys.stderr)
+    print(f"{len(results) - len(failed)} of {len(results)} PDFs generated.")
+    if failed:
+        sys.exit(1)
+
+
+def _serve(argv: list[str]) -> None:
+    """Entry point for ``improving-pdf serve``."""
+    from improving_pdf_tool.server import DEFAULT_HOST, DEFAULT_PORT
+
+    parser = argparse.ArgumentParser(
+        prog="improving-pdf serve",
+        description=(
+            "Serve PDF rendering over HTTP on localhost: POST Markdown or HTML "
+            "to /render, read counters from /metrics."
+        ),
+    )
+    parser.add_argument(
+        "--host",
+        default=DEFAULT_HOST,
+        help="Interface to bind; the server has no authentication (default: %(default)s).",
+    )
+    parser.add_argument(
+        "--port",
+        type=int,
+        default=DEFAULT_PORT,
+        help="Port to listen on, or 0 for any free port (default: %(default)s).",
+    )
+    parser.add_argument(
+        "-j", "--workers",
+        type=int,
+        default=2,
+        help="Concurrent renders, one warm Chromium each (default: %(default)s).",
+    )
+    parser.add_argument(
+        "--queue-size",
+        type=int,
+        default=16,
+        help="Requests that may wait for a worker before 503 (default: %(default)s).",
+    )
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        default=60.0,
+        help="Seconds before a queued or running request gets 504 (default: %(default)s).",
+    )
+    parser.add_argument(
+        "--recycle-after",
+        type=int,
+        default=100,
+        help="Restart a worker's browser after this many renders (default: %(default)s).",
+    )
+    parser.add_argument(
+        "--base-dir",
+        default=None,
+        help="Directory that relative image references are served from.",
+    )
+    _add_session_arguments(parser)
+    args = parser.parse_args(argv)
+
+    from improving_pdf_tool.server import serve
+
+    serve(
+        args.host,
+        args.port,
+        workers=args.workers,
+        queue_size=args.queue_size,
+        timeout=args.timeout,
+        recycle_after=args.recycle_after,
+        base_dir=args.base_dir,
+        session_options=_session_options(args),
+    )
+
+
+def _report_profile(prof, destination: str) -> None:
+    """Write the --profile breakdown to *destination*, or stderr for -."""
+    import json
+
+    report = json.dumps(prof.to_dict(), indent=2)
+    if destination == "-":
+        print(report, file=sys.stderr)
+        return
+    with open(destination, "w", encoding="utf-8") as f:
+        f.write(report + "\n")
+    print(f"Profile written: {destination}", file=sys.stderr)
 
 
 def main() -> None:
     """Main CLI entry point for improving-pdf command."""
+    if sys.argv[1:2] == ["serve"]:
+        _serve(sys.argv[2:])
+        return
+
     parser = argparse.ArgumentParser(
         prog="improving-pdf",
         description="Convert HTML (or Markdown) to a branded Improving PDF document.",
     )
     parser.add_argument(
-        "input",
-        help="Path to the input file (.html or .md).",
+        "inputs",
+        nargs="*",
+        metavar="input",
+        help=(
+            "Path to the input file (.html or .md). With --output-dir, any "
+            "number of files, directories or glob patterns."
+        ),
     )
-    parser.add_argument(
+    target = parser.add_mutually_exclusive_group()
+    target.add_argument(
         "-o", "--output",
-        required=True,
-        help="Path for the output PDF file.",
+        help="Path for the output PDF file, or - to write it to stdout.",
+    )
+    target.add_argument(
+        "-d", "--output-dir",
+        help="Batch mode: directory for one <name>.pdf per input.",
+    )
+    parser.add_argument(
+        "-j", "--jobs",
+        type=int,
+        default=None,
+        help="Batch mode: number of concurrent browsers (default: CPU count).",
+    )
+    parser.add_argument(
+        "-w", "--watch",
+        action="store_true",
+        help=(
+            "Keep running and regenerate the PDF whenever the input or an "
+            "image it references changes."
+        ),
+    )
+    parser.add_argument(
+        "--shards",
+        type=int,
+        default=1,
+        metavar="N",
+        help=(
+            "Print a long Markdown document in up to N pieces, split at "
+            "top-level sections, and merge them. Requires pypdf."
+        ),
+    )
+    parser.add_argument(
+        "--profile",
+        default=None,
+        metavar="FILE",
+        help=(
+            "Write the time spent in each conversion stage to FILE as JSON, "
+            "or to stderr with -."
+        ),
+    )
+    parser.add_argument(
+        "--trace",
+        default=None,
+        metavar="FILE",
+        help="Save a Chromium performance trace of the page load and print to FILE.",
+    )
+    _add_session_arguments(parser)
+    parser.add_argument(
+        "--clear-cache",
+        action="store_true",
+        help="Delete the render cache before converting (or on its own).",
     )
 
     args = parser.parse_args()
-    input_path: str = args.input
+
+    if args.clear_cache:
+        _clear_cache(args)
+        if not args.inputs:
+            return
+
+    if not args.inputs:
+        parser.error("the following arguments are required: input")
+    if not (args.output or args.output_dir):
+        parser.error("one of the arguments -o/--output -d/--output-dir is required")
+
+    profiling = args.profile is not None or args.trace is not None
+    if profiling and (args.output_dir or args.watch):
+        parser.error("--profile and --trace only apply to a single -o conversion")
+    if args.shards < 1:
+        parser.error("--shards must be at least 1")
+    if args.shards > 1 and (args.output_dir or args.watch):
+        parser.error("--shards only applies to a single -o conversion")
+
+    if args.output_dir:
+        if args.watch:
+            parser.error("--watch cannot be combined with -d/--output-dir")
+        _run_batch(args)
+        return
+
+    if len(args.inputs) != 1:
+        parser.error("-o/--output takes exactly one input; use -d/--output-dir for several")
+    if args.watch and args.output == "-":
+        parser.error("--watch needs an output file, not -")
+
+    from improving_pdf_tool.generator import (
+        RenderSession,
+        convert_file,
+        convert_file_to_bytes,
+    )
+
+    input_path: str = args.inputs[0]
     output_path: str = args.output
 
-    if input_path.endswith((".html", ".htm")):
-        result = html_to_pdf(input_path, output_path)
-        print(f"PDF generated: {result}")
-    elif input_path.endswith((".md", ".markdown", ".txt")):
-        result = markdown_to_pdf(input_path, output_path)
-        print(f"PDF generated: {result}")
-    else:
-        print(
-            f"Error: Unsupported file type. Expected .html, .htm, .md, .markdown, or .txt, got: {input_path}",
-            file=sys.stderr,
-        )
+    if args.watch:
+        from improving_pdf_tool.watch import watch
+
+        with RenderSession(**_session_options(args)) as session:
+            try:
+                watch(input_path, output_path, session)
+            except KeyboardInterrupt:
+                pass
+        return
+
+    from improving_pdf_tool.profiling import profile
+
+    measure = profile(trace_path=args.trace) if profiling else nullcontext()
+    try:
+        with measure as prof, RenderSession(**_session_options(args)) as session:
+            if output_path == "-":
+                pdf = convert_file_to_bytes(
+                    input_path, session=session, shards=args.shards
+                )
+            else:
+                result = convert_file(
+                    input_path, output_path, session=session, shards=args.shards
+                )
+    except ValueError as exc:
+        print(f"Error: {exc}", file=sys.stderr)
         sys.exit(1)
 
+    if output_path == "-":
+        sys.stdout.buffer.write(pdf)
+        sys.stdout.buffer.flush()
+    else:
+        print(f"PDF generated: {result}")
+    if args.profile is not None:
+        _report_profile(prof, args.profile)
+    if args.trace is not None:
+        print(f"Trace written: {args.trace}", file=sys.stderr)
+
 
 if __name__ == "__main__":
     main()
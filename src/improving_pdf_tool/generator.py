@@ -1,133 +1,756 @@
 """Core HTML-to-PDF generation logic using Playwright's headless Chromium."""
 
 import base64
+import functools
+import hashlib
 import importlib.resources
+import json
 import os
 import re
-import shutil
 import subprocess
 import sys
-import tempfile
+import threading
+import time
+import urllib.parse
+from collections import deque
+from contextlib import contextmanager
 from datetime import datetime
+from html import escape
 from pathlib import Path
 
-from playwright.sync_api import sync_playwright
+from improving_pdf_tool.build_cache import (
+    BUILD_CACHE_SUBDIR,
+    build_key,
+    open_build_cache,
+)
+from improving_pdf_tool.cache import (
+    DiskCache,
+    MemoryCache,
+    cache_disabled_by_env,
+    cache_key,
+    default_cache_dir,
+)
+from improving_pdf_tool.image_assets import (
+    IMAGE_CACHE_SUBDIR,
+    ImageProcessor,
+    open_image_processor,
+)
+from improving_pdf_tool.profiling import current_profile, stage
+from improving_pdf_tool.svg_assets import OPTIMIZER_VERSION, optimize_svg, scope_ids
+
+
+# Pinned Mermaid release. Its single-file build ships as package data
+# (assets/mermaid/mermaid.min.js, fetched by setup.py when the package is
+# built) and is served to the render page in place of the CDN URL, so
+# installed packages render without network access. A source checkout has
+# no copy until built; it loads the CDN unless $IMPROVING_PDF_MERMAID_JS
+# names a local file (see _load_mermaid_bundle).
+MERMAID_VERSION = "11.4.1"
+MERMAID_CDN_URL = f"https://cdn.jsdelivr.net/npm/mermaid@{MERMAID_VERSION}/dist/mermaid.min.js"
+
+# Options passed to mermaid.initialize(); also part of the SVG cache key.
+MERMAID_CONFIG = {
+    "startOnLoad": False,
+    "theme": "default",
+    "securityLevel": "loose",
+    "flowchart": {"useMaxWidth": True, "htmlLabels": True},
+    "sequence": {"useMaxWidth": True},
+}
+
+# page.pdf() options: Letter, full-bleed (margins are handled by the
+# template's CSS), with a document outline and tagged structure.
+PDF_OPTIONS = {
+    "format": "Letter",
+    "print_background": True,
+    "margin": {"top": "0", "right": "0", "bottom": "0", "left": "0"},
+    "outline": True,
+    "tagged": True,
+}
+
+# Virtual origin that in-memory documents are served from. A route handler
+# answers every request under it, with the document itself or with local
+# files, so nothing touches a temp dir. URL paths under the origin mirror
+# absolute filesystem paths, and the document is served from its base
+# directory's path (see _document_url), so relative references resolve to
+# the same files they would from a file:// page.
+DOCUMENT_ORIGIN = "https://improving-pdf.invalid/"
+_DOCUMENT_NAME = "document.html"
+_DOCUMENT_URL = DOCUMENT_ORIGIN + _DOCUMENT_NAME
+
+# file:// URLs in src/href attributes; an https page may not load them, so
+# they are rewritten to the matching path under DOCUMENT_ORIGIN.
+_FILE_URL_RE = re.compile(r"""(\b(?:src|href)\s*=\s*["'])file://[^/"']*""", re.IGNORECASE)
+
+# Readiness signal, used instead of waiting for network idle: web fonts are
+# loaded and every <img> has finished (or failed) loading.
+_READY_SCRIPT = """async () => {
+    await document.fonts.ready;
+    await Promise.all(Array.from(document.images, (img) => img.complete ? null :
+        new Promise((resolve) => { img.onload = img.onerror = resolve; })));
+}"""
+
+# Hand-written HTML may still render Mermaid at runtime (<div class="mermaid">
+# plus the CDN script); mermaid marks each processed block with this attribute.
+# The wait is best-effort: if the script cannot run (no network for the CDN),
+# the page is printed as it is once the timeout (in ms) passes.
+_RUNTIME_MERMAID_DONE = "() => !document.querySelector('.mermaid:not([data-processed])')"
+_RUNTIME_MERMAID_TIMEOUT = 15000
+
+# Subdirectory of the cache root holding rendered Mermaid SVGs.
+MERMAID_CACHE_SUBDIR = "mermaid-svg"
+
+
+# Stamp file (in the cache root) recording that Chromium was found for a
+# given Playwright version, so later processes skip even the directory scan.
+_CHROMIUM_STAMP = "chromium-installed"
 
+_chromium_checked = False
 
-MERMAID_CDN_URL = "https://cdn.jsdelivr.net/npm/mermaid@11/dist/mermaid.esm.min.mjs"
 
+def _playwright_browsers_dir() -> Path:
+    """Where Playwright keeps its browsers, resolved as its driver does."""
+    explicit = os.environ.get("PLAYWRIGHT_BROWSERS_PATH")
+    if explicit == "0":
+        import playwright
 
-_chromium_checked = False
+        return Path(playwright.__file__).parent / "driver" / "package" / ".local-browsers"
+    if explicit:
+        return Path(explicit)
+    if sys.platform == "win32":
+        base = os.environ.get("LOCALAPPDATA") or Path.home() / "AppData" / "Local"
+    elif sys.platform == "darwin":
+        base = Path.home() / "Library" / "Caches"
+    else:
+        base = os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache"
+    return Path(base) / "ms-playwright"
+
+
+def _chromium_markers(version: str) -> list[Path]:
+    """The install markers of the Chromium builds this Playwright launches.
+
+    Reads the driver's browsers.json rather than asking the driver, which
+    would mean starting Node. A platform-specific revision override simply
+    makes the markers missing, and the installer then runs as before.
+    """
+    import playwright
+
+    browsers_json = Path(playwright.__file__).parent / "driver" / "package" / "browsers.json"
+    try:
+        browsers = json.loads(browsers_json.read_text(encoding="utf-8"))["browsers"]
+    except (OSError, ValueError, KeyError):
+        return []
+    root = _playwright_browsers_dir()
+    return [
+        root / f"{b['name'].replace('-', '_')}-{b['revision']}" / "INSTALLATION_COMPLETE"
+        for b in browsers
+        if b.get("name") in ("chromium", "chromium-headless-shell")
+    ]
+
+
+def _chromium_present(markers: list[Path]) -> bool:
+    return bool(markers) and all(marker.is_file() for marker in markers)
 
 
 def _ensure_chromium_installed() -> None:
     """Ensure Playwright's Chromium browser is installed.
 
-    On the first call, runs 'playwright install chromium' which is
-    idempotent — it's a no-op if already installed, and installs
-    if missing. Subsequent calls within the same process are skipped.
+    Checks for the browser's install markers first, and only runs
+    'playwright install chromium' (which starts Node and can take a second
+    or more even when there is nothing to do) if they are missing. The
+    marker paths are remembered in a stamp file tied to the Playwright
+    version, so an upgrade re-checks. Subsequent calls within the same
+    process are skipped.
     """
     global _chromium_checked
     if _chromium_checked:
         return
 
+    from playwright._repo_version import version
+
+    stamp = Path(default_cache_dir()) / _CHROMIUM_STAMP
     try:
-        subprocess.run(
-            [sys.executable, "-m", "playwright", "install", "chromium"],
-            check=True,
-            capture_output=True,
-        )
-    except subprocess.CalledProcessError as exc:
-        print(
-            f"Warning: Failed to verify/install Chromium: {exc}",
-            file=sys.stderr,
-        )
+        recorded = stamp.read_text(encoding="utf-8").splitlines()
+    except OSError:
+        recorded = []
+    if recorded[:1] == [version] and _chromium_present([Path(p) for p in recorded[1:]]):
+        _chromium_checked = True
+        return
+
+    markers = _chromium_markers(version)
+    if not _chromium_present(markers):
+        try:
+            subprocess.run(
+                [sys.executable, "-m", "playwright", "install", "chromium"],
+                check=True,
+                capture_output=True,
+            )
+        except subprocess.CalledProcessError as exc:
+            print(
+                f"Warning: Failed to verify/install Chromium: {exc}",
+                file=sys.stderr,
+            )
+
+    if _chromium_present(markers):
+        try:
+            stamp.parent.mkdir(parents=True, exist_ok=True)
+            stamp.write_text("\n".join([version, *map(str, markers)]), encoding="utf-8")
+        except OSError:
+            pass
 
     _chromium_checked = True
 
 
-def _prerender_mermaid_to_svgs(diagrams: list[str]) -> list[str]:
-    """Pre-render Mermaid diagram sources to SVG strings using Playwright.
+_mermaid_bundle: bytes | None = None
 
-    Launches a minimal HTML page with the Mermaid CDN, calls mermaid.render()
-    for each diagram, and returns the resulting SVG strings. Each SVG is cleaned
-    up to remove fixed width/height attributes so it can be scaled via CSS.
 
-    Args:
-        diagrams: List of Mermaid diagram source strings.
+def _load_mermaid_bundle() -> bytes | None:
+    """Return the vendored Mermaid build, or None if it is not available.
 
-    Returns:
-        List of SVG strings, one per input diagram. On render failure, the
-        corresponding entry contains an error placeholder.
+    $IMPROVING_PDF_MERMAID_JS may point at a local mermaid.min.js to use
+    instead of the packaged copy. Without either, the render page falls back
+    to fetching MERMAID_CDN_URL over the network.
     """
-    if not diagrams:
-        return []
+    global _mermaid_bundle
+    if _mermaid_bundle is None:
+        override = os.environ.get("IMPROVING_PDF_MERMAID_JS")
+        if override:
+            ref = Path(override)
+        else:
+            ref = (
+                importlib.resources.files("improving_pdf_tool")
+                .joinpath("assets")
+                .joinpath("mermaid")
+                .joinpath("mermaid.min.js")
+            )
+        try:
+            _mermaid_bundle = ref.read_bytes()
+        except OSError:
+            _mermaid_bundle = b""
+    return _mermaid_bundle or None
+
 
-    _ensure_chromium_installed()
+@functools.lru_cache(maxsize=None)
+def _mermaid_build_id() -> str:
+    """Identify the Mermaid build that renders diagrams, for cache keys.
 
-    render_page = f"""<!DOCTYPE html>
+    That is the hash of the bundle being served (packaged or from
+    $IMPROVING_PDF_MERMAID_JS), or the pinned version fetched from the CDN.
+    """
+    bundle = _load_mermaid_bundle()
+    if bundle is None:
+        return MERMAID_VERSION
+    return "sha256:" + hashlib.sha256(bundle).hexdigest()
+
+
+_MERMAID_RENDER_PAGE = f"""<!DOCTYPE html>
 <html><head><meta charset="UTF-8"></head><body>
-<script type="module">
-import mermaid from '{MERMAID_CDN_URL}';
-mermaid.initialize({{ startOnLoad: false, theme: 'default', securityLevel: 'loose',
-    flowchart: {{ useMaxWidth: true, htmlLabels: true }}, sequence: {{ useMaxWidth: true }} }});
+<script src="{MERMAID_CDN_URL}" onerror="window.__mermaidLoadFailed = true"></script>
+<script>
+mermaid.initialize({json.dumps(MERMAID_CONFIG)});
 window.renderDiagram = async function(id, source) {{
     try {{
         const {{ svg }} = await mermaid.render(id, source);
         return svg;
     }} catch (e) {{
-        return '<div style="color:red;">Diagram error: ' + e.message + '</div>';
+        return '<div style="color:red;">Diagram error: ' + escapeHtml(e.message) + '</div>';
+    }}
+}};
+// The placeholder is embedded as HTML, and parse errors quote the diagram
+// source; escape it as _diagram_error does.
+function escapeHtml(text) {{
+    const entities = {{"&": "&amp;", "<": "&lt;", ">": "&gt;", '"': "&quot;", "'": "&#x27;"}};
+    return String(text ?? "").replace(/[&<>"']/g, (c) => entities[c]);
+}}
+// Render a list of [id, source] pairs in order, pushing an
+// [svg, ms, finished_at] triple (finished_at in ms since the epoch) onto
+// results as each one finishes. mermaid.render() is not re-entrant, so one
+// page renders serially; parallelism comes from pages.
+window.renderDiagrams = async function(jobs, results = []) {{
+    for (const [id, source] of jobs) {{
+        const start = performance.now();
+        const svg = await window.renderDiagram(id, source);
+        results.push([svg, performance.now() - start, Date.now()]);
     }}
+    return results;
 }};
 window.__mermaidReady = true;
 </script></body></html>"""
 
-    svgs = []
-    with sync_playwright() as p:
-        browser = p.chromium.launch()
-        page = browser.new_page()
-        page.set_content(render_page)
-        page.wait_for_function("() => window.__mermaidReady === true", timeout=15000)
-
-        for i, source in enumerate(diagrams):
-            svg = page.evaluate(
-                "([id, src]) => window.renderDiagram(id, src)",
-                [f"mermaid-pre-{i}", source],
+
+# Resolves once a render page can render ("ready") or its Mermaid script
+# failed to load ("failed": no bundle and the CDN is unreachable).
+_MERMAID_PAGE_STATE = """() => window.__mermaidReady === true ? "ready"
+    : window.__mermaidLoadFailed === true ? "failed" : false"""
+
+
+def _mermaid_unavailable() -> RuntimeError:
+    """The error raised when a render page cannot load Mermaid at all."""
+    return RuntimeError(
+        f"Mermaid could not be loaded: this installation has no bundled "
+        f"mermaid.min.js and {MERMAID_CDN_URL} is unreachable. For offline "
+        "rendering, set $IMPROVING_PDF_MERMAID_JS to a local copy of "
+        f"Mermaid {MERMAID_VERSION}, or install a built package."
+    )
+
+
+# Starts a batch on a render page without waiting for it, returning its start
+# time in ms since the epoch. Rendering only begins once the evaluate call has
+# returned, so a diagram that blocks the page cannot block the call.
+_START_BATCH = """(jobs) => {
+    window.__results = [];
+    setTimeout(() => window.renderDiagrams(jobs, window.__results), 0);
+    return Date.now();
+}"""
+
+# Resolves to the k-th result of the running batch once it is available.
+_BATCH_RESULT = "(k) => window.__results.length > k && window.__results[k]"
+
+# Seconds a single diagram may render before it is abandoned.
+DEFAULT_DIAGRAM_TIMEOUT = 30.0
+
+
+def _diagram_error(message: str) -> str:
+    """The error placeholder shown instead of a diagram, as rendered in the page."""
+    return f'<div style="color:red;">Diagram error: {escape(message)}</div>'
+
+
+def _cache_root(cache_dir: str | None, use_cache: bool) -> str | None:
+    """Return a session's cache root directory, or None when disabled."""
+    if not use_cache or cache_disabled_by_env():
+        return None
+    return cache_dir or default_cache_dir()
+
+
+def _open_mermaid_cache(cache_root: str | None) -> DiskCache | MemoryCache:
+    """Return the Mermaid SVG cache under *cache_root*.
+
+    With disk caching off, the session still memoizes its own renders in
+    memory, so re-converting an edited document only renders the diagrams
+    whose source changed.
+    """
+    if cache_root is None:
+        return MemoryCache()
+    return DiskCache(os.path.join(cache_root, MERMAID_CACHE_SUBDIR))
+
+
+def clear_cache(cache_dir: str | None = None) -> str:
+    """Delete everything improving-pdf keeps in its cache directory.
+
+    Only the tool's own entries go: the diagram, image and PDF caches and
+    the Chromium stamp. Anything else in *cache_dir* (which may be any
+    directory the user pointed --cache-dir at) is left alone.
+
+    Returns:
+        The cache directory that was cleared.
+    """
+    root = Path(cache_dir or default_cache_dir())
+    for subdir in (MERMAID_CACHE_SUBDIR, IMAGE_CACHE_SUBDIR, BUILD_CACHE_SUBDIR):
+        DiskCache(str(root / subdir)).clear()
+    try:
+        (root / _CHROMIUM_STAMP).unlink(missing_ok=True)
+    except OSError:
+        pass
+    return str(root)
+
+
+class RenderSession:
+    """A warm headless Chromium shared across any number of renders.
+
+    Chromium is launched once, on first use, and reused for every Mermaid
+    pre-render and PDF print until the session is closed. Up to
+    *mermaid_concurrency* Mermaid render pages are loaded on demand and kept
+    alive, each in its own browser context (and renderer process) so a
+    document's diagrams render in parallel. Each PDF gets its own fresh
+    browser context so documents cannot leak state into one another.
+
+    Rendered Mermaid SVGs are kept in an on-disk cache (see cache.py) keyed
+    by diagram source, Mermaid version and config, so unchanged diagrams
+    never touch the browser. Pass ``use_cache=False`` to disable it (the
+    session then keeps its renders in memory only), or ``cache_dir`` to
+    relocate it; $IMPROVING_PDF_NO_CACHE and $IMPROVING_PDF_CACHE_DIR do the
+    same from the environment.
+
+    With *image_dpi* set, referenced raster images wider than the printable
+    width at that resolution are downsampled before Chromium sees them (see
+    image_assets.py; requires Pillow).
+
+    Diagrams are embedded as base64 <img> data URIs, or with *inline_svg*
+    as inline <svg> elements, which keeps the HTML a third smaller.
+
+    With *build_cache*, finished PDFs are cached too, keyed by the input,
+    the files it references, the template and versions, and the options
+    (see build_cache.py). An unchanged document is then returned without
+    starting Chromium. Like the diagram cache, it is off with use_cache=False.
+
+    A diagram still rendering after *diagram_timeout* seconds (None for no
+    limit), or one whose source is over *max_diagram_bytes*, is replaced by
+    an error placeholder; a render page that overran or crashed is replaced
+    by a fresh one.
+
+    Documents rendered from strings may reference any local file, as a
+    file:// page could; with *asset_root*, only files inside that directory
+    are served.
+
+    A sharded render (see markdown_to_pdf_bytes) keeps up to
+    *shard_concurrency* shards loaded at once.
+
+    Usage::
+
+        with RenderSession() as session:
+            for md in files:
+                markdown_to_pdf(md, md.replace(".md", ".pdf"), session=session)
+    """
+
+    def __init__(
+        self,
+        cache_dir: str | None = None,
+        use_cache: bool = True,
+        mermaid_concurrency: int = 4,
+        image_dpi: int | None = None,
+        diagram_timeout: float | None = DEFAULT_DIAGRAM_TIMEOUT,
+        max_diagram_bytes: int | None = None,
+        inline_svg: bool = False,
+        build_cache: bool = False,
+        asset_root: str | None = None,
+        shard_concurrency: int = 2,
+    ) -> None:
+        self._playwright = None
+        self._browser = None
+        self._mermaid_pages = []
+        self.mermaid_concurrency = max(1, mermaid_concurrency)
+        self.shard_concurrency = max(1, shard_concurrency)
+        self.diagram_timeout = diagram_timeout
+        self.max_diagram_bytes = max_diagram_bytes
+        self.inline_svg = inline_svg
+        cache_root = _cache_root(cache_dir, use_cache)
+        self.mermaid_cache = _open_mermaid_cache(cache_root)
+        self.images = open_image_processor(image_dpi, cache_root)
+        self.build_cache = open_build_cache(cache_root) if build_cache else None
+        self.asset_root = asset_root
+
+    def __enter__(self) -> "RenderSession":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    @property
+    def browser(self):
+        """The shared Chromium browser, launched on first access."""
+        if self._browser is None:
+            from playwright.sync_api import sync_playwright
+
+            with stage("browser_launch"):
+                _ensure_chromium_installed()
+                self._playwright = sync_playwright().start()
+                self._browser = self._playwright.chromium.launch()
+        return self._browser
+
+    def mermaid_pages(self, count: int) -> list:
+        """Return *count* warm Mermaid render pages, loading any missing ones.
+
+        *count* is capped at mermaid_concurrency. Pages persist for the
+        lifetime of the session, so the Mermaid bundle is parsed once per page.
+        """
+        count = max(1, min(count, self.mermaid_concurrency))
+        if len(self._mermaid_pages) >= count:
+            return self._mermaid_pages[:count]
+        with stage("mermaid_pages", pages=count - len(self._mermaid_pages)):
+            while len(self._mermaid_pages) < count:
+                self._mermaid_pages.append(self._new_mermaid_page())
+        return self._mermaid_pages[:count]
+
+    def replace_mermaid_page(self, page):
+        """Close a render page that overran or crashed; return a fresh one.
+
+        The new page takes the old one's place among the session's pages.
+        """
+        from playwright.sync_api import Error as PlaywrightError
+
+        slot = self._mermaid_pages.index(page)
+        del self._mermaid_pages[slot]
+        try:
+            page.close()
+        except PlaywrightError:
+            pass  # crashed, or closed with the browser
+        with stage("mermaid_pages", pages=1):
+            fresh = self._new_mermaid_page()
+        self._mermaid_pages.insert(slot, fresh)
+        return fresh
+
+    def _new_mermaid_page(self):
+        """Load a Mermaid render page and wait until it can render."""
+        # browser.new_page() gives every render page its own context.
+        page = self.browser.new_page()
+        bundle = _load_mermaid_bundle()
+        if bundle is not None:
+            page.route(
+                MERMAID_CDN_URL,
+                lambda route: route.fulfill(
+                    body=bundle, content_type="application/javascript"
+                ),
             )
-            # Clean SVG: remove fixed width/height, ensure viewBox is present
-            svg = _clean_svg_for_embedding(svg)
-            svgs.append(svg)
+        page.set_content(_MERMAID_RENDER_PAGE)
+        state = page.wait_for_function(_MERMAID_PAGE_STATE, timeout=15000).json_value()
+        if state == "failed":
+            page.close()
+            raise _mermaid_unavailable()
+        return page
+
+    @contextmanager
+    def new_page(self):
+        """Yield a page in a fresh browser context, closed on exit."""
+        context = self.browser.new_context()
+        try:
+            yield context.new_page()
+        finally:
+            context.close()
+
+    def close(self) -> None:
+        """Close the browser and stop Playwright. Safe to call repeatedly."""
+        if self._browser is not None:
+            self._browser.close()
+            self._browser = None
+        if self._playwright is not None:
+            self._playwright.stop()
+            self._playwright = None
+        self._mermaid_pages = []
+
+
+@contextmanager
+def _session_scope(session: RenderSession | None):
+    """Yield *session*, or a temporary one that is closed afterwards."""
+    if session is not None:
+        yield session
+        return
+    with RenderSession() as owned:
+        yield owned
+
+
+def _mermaid_cache_key(source: str) -> str:
+    """Cache key for a diagram: its source, the Mermaid build and config,
+    and the version of the SVG optimisation applied to it."""
+    return cache_key(
+        _mermaid_build_id(),
+        json.dumps(MERMAID_CONFIG, sort_keys=True),
+        OPTIMIZER_VERSION,
+        source,
+    )
+
+
+# Stand-in for the per-document diagram id inside cached SVGs. Mermaid
+# bakes the id into the <svg> element, its CSS selectors and marker ids, so
+# a cached diagram has to be re-stamped with the id of its new position.
+_CACHED_ID_TOKEN = "mermaid-cached-id"
 
-        browser.close()
+
+def _id_pattern(diagram_id: str) -> "re.Pattern[str]":
+    return re.compile(re.escape(diagram_id) + r"(?!\d)")
+
+
+def _cached_svgs(
+    cache: DiskCache | MemoryCache | None, diagrams: list[str]
+) -> list[str | None]:
+    """Look every diagram up in *cache*; misses (or no cache) give None."""
+    svgs: list[str | None] = [None] * len(diagrams)
+    if cache is None:
+        return svgs
+    for i, source in enumerate(diagrams):
+        cached = cache.get(_mermaid_cache_key(source))
+        if cached is not None:
+            svgs[i] = cached.decode("utf-8").replace(
+                _CACHED_ID_TOKEN, f"mermaid-pre-{i}"
+            )
+    return svgs
+
+
+def _store_svgs(
+    cache: DiskCache | MemoryCache | None,
+    diagrams: list[str],
+    svgs: list[str],
+    indices: list[int],
+) -> None:
+    """Add the freshly rendered diagrams at *indices* to *cache*."""
+    if cache is None:
+        return
+    for i in indices:
+        # Only successful renders are cached; errors may be transient.
+        if svgs[i].startswith("<svg"):
+            normalized = _id_pattern(f"mermaid-pre-{i}").sub(_CACHED_ID_TOKEN, svgs[i])
+            cache.put(_mermaid_cache_key(diagrams[i]), normalized.encode("utf-8"))
+
+
+def _skip_oversized(
+    diagrams: list[str], svgs: list[str | None], max_bytes: int | None
+) -> int:
+    """Put error placeholders in *svgs* for unrendered diagrams over *max_bytes*.
+
+    Returns:
+        The number of diagrams skipped.
+    """
+    if max_bytes is None:
+        return 0
+    skipped = 0
+    for i, source in enumerate(diagrams):
+        size = len(source.encode("utf-8"))
+        if svgs[i] is None and size > max_bytes:
+            svgs[i] = _diagram_error(
+                f"source is {size} bytes, over the {max_bytes}-byte limit"
+            )
+            skipped += 1
+    return skipped
+
+
+def _overrun_message(exc: Exception, timeout: float | None) -> str:
+    """Why a diagram was abandoned, from the Playwright error that ended it."""
+    from playwright.sync_api import TimeoutError as PlaywrightTimeoutError
+
+    if isinstance(exc, PlaywrightTimeoutError):
+        return f"rendering took longer than {timeout:g}s"
+    return "the render page crashed"
+
+
+def _collect_batch(
+    session: RenderSession,
+    page,
+    started: float,
+    share: list[int],
+    diagrams: list[str],
+    svgs: list[str | None],
+    detail: dict,
+) -> None:
+    """Collect the results of a render page's batch as they come in.
+
+    Each diagram gets session.diagram_timeout seconds from the moment the
+    one before it finished. One that overruns, or takes its page down, gets
+    an error placeholder; the page is replaced and the rest of the batch
+    starts again on the fresh page.
+    """
+    from playwright.sync_api import Error as PlaywrightError
+
+    timeout = session.diagram_timeout
+    k = 0
+    while k < len(share):
+        i = share[k]
+        if timeout is None:
+            wait_ms = 0  # no limit
+        else:
+            # Never less than a short grace period, so a result that is
+            # already in is not missed.
+            wait_ms = max(100.0, started + timeout * 1000 - time.time() * 1000)
+        try:
+            svg, ms, started = page.wait_for_function(
+                _BATCH_RESULT, arg=k, timeout=wait_ms
+            ).json_value()
+        except PlaywrightError as exc:
+            svgs[i] = _diagram_error(_overrun_message(exc, timeout))
+            detail.setdefault("abandoned", []).append(i)
+            page = session.replace_mermaid_page(page)
+            share, k = share[k + 1:], 0
+            if share:
+                started = _start_batch(page, share, diagrams)
+            continue
+        svgs[i] = _embeddable_svg(svg, detail)
+        detail["render_ms"][i] = round(ms, 1)
+        k += 1
+
+
+def _start_batch(page, share: list[int], diagrams: list[str]) -> float:
+    """Start rendering the diagrams at *share* on *page*; return the start time."""
+    return page.evaluate(
+        _START_BATCH, [[f"mermaid-pre-{i}", diagrams[i]] for i in share]
+    )
+
+
+def _prerender_mermaid_to_svgs(
+    diagrams: list[str], session: RenderSession | None = None
+) -> list[str]:
+    """Pre-render Mermaid diagram sources to SVG strings using Playwright.
+
+    Uses the session's warm Mermaid render pages, calls mermaid.render()
+    for each diagram, and returns the resulting SVG strings. Each SVG is cleaned
+    up to remove fixed width/height attributes so it can be scaled via CSS.
+    Diagrams found in the session's SVG cache are returned without starting
+    the browser; freshly rendered ones are added to it.
+
+    Uncached diagrams are dealt round-robin across up to the session's
+    mermaid_concurrency render pages. Each page receives its whole share in
+    a single evaluate call; all pages are started before any result is
+    awaited, so the pages render concurrently. Results are then collected
+    one diagram at a time, which lets a diagram that overruns the session's
+    diagram_timeout be abandoned without losing the rest (see _collect_batch).
+
+    Args:
+        diagrams: List of Mermaid diagram source strings.
+        session: Optional shared RenderSession. When omitted, a temporary
+            browser is launched for this call only.
+
+    Returns:
+        List of SVG strings, one per input diagram. On render failure,
+        timeout or an oversized source, the corresponding entry contains an
+        error placeholder.
+    """
+    if not diagrams:
+        return []
+
+    with _session_scope(session) as active:
+        svgs = _cached_svgs(active.mermaid_cache, diagrams)
+        cached = sum(svg is not None for svg in svgs)
+        oversized = _skip_oversized(diagrams, svgs, active.max_diagram_bytes)
+        pending = [i for i, svg in enumerate(svgs) if svg is None]
+        if pending:
+            pages = active.mermaid_pages(len(pending))
+        with stage(
+            "mermaid", diagrams=len(diagrams), cached=cached, oversized=oversized
+        ) as detail:
+            if pending:
+                shares = [pending[n::len(pages)] for n in range(len(pages))]
+                # Start every page's batch without waiting, then collect them.
+                starts = [
+                    _start_batch(page, share, diagrams)
+                    for page, share in zip(pages, shares)
+                ]
+                detail["render_ms"] = {}
+                for page, share, started in zip(pages, shares, starts):
+                    _collect_batch(active, page, started, share, diagrams, svgs, detail)
+
+        _store_svgs(active.mermaid_cache, diagrams, svgs, pending)
 
     return svgs
 
 
 def _clean_svg_for_embedding(svg: str) -> str:
-    """Remove fixed width/height attributes from an SVG so it scales via CSS.
+    """Make a rendered SVG scale via CSS, then optimise it for embedding.
 
-    Preserves the viewBox attribute for proper aspect-ratio scaling. If no
-    viewBox exists, attempts to create one from the width/height values.
+    Removes the fixed width/height and inline style of the root <svg>,
+    keeping (or, failing that, creating) its viewBox for aspect-ratio
+    scaling, and shrinks the rest (see svg_assets.optimize_svg).
     """
-    if not svg.strip().startswith("<svg"):
+    root = re.match(r"\s*<svg\b[^>]*>", svg)
+    if root is None:
         return svg  # error placeholder, leave as-is
+    tag = root.group(0).strip()
 
-    # Extract width/height before removing them (for viewBox fallback)
-    w_match = re.search(r'\bwidth="([\d.]+)', svg)
-    h_match = re.search(r'\bheight="([\d.]+)', svg)
-
-    # Add viewBox if missing
-    if 'viewBox' not in svg and w_match and h_match:
+    # Add viewBox if missing, from the width/height about to be removed
+    w_match = re.search(r'\swidth="([\d.]+)"', tag)
+    h_match = re.search(r'\sheight="([\d.]+)"', tag)
+    if "viewBox" not in tag and w_match and h_match:
         w, h = w_match.group(1), h_match.group(1)
-        svg = svg.replace("<svg", f'<svg viewBox="0 0 {w} {h}"', 1)
+        tag = tag.replace("<svg", f'<svg viewBox="0 0 {w} {h}"', 1)
+
+    # Remove fixed width/height attributes so CSS controls sizing, and the
+    # max-width style mermaid adds
+    tag = re.sub(r'\s(?:width|height|style)="[^"]*"', "", tag)
 
-    # Remove fixed width/height attributes so CSS controls sizing
-    svg = re.sub(r'\s*width="[^"]*"', '', svg, count=1)
-    svg = re.sub(r'\s*height="[^"]*"', '', svg, count=1)
-    # Remove style width/height if present (mermaid sometimes adds these)
-    svg = re.sub(r'style="[^"]*"', '', svg, count=1)
+    return optimize_svg(tag + svg[root.end():])
 
-    return svg
+
+def _embeddable_svg(svg: str, detail: dict) -> str:
+    """_clean_svg_for_embedding, counting the bytes saved in *detail*."""
+    cleaned = _clean_svg_for_embedding(svg)
+    saved = len(svg.encode("utf-8")) - len(cleaned.encode("utf-8"))
+    detail["svg_bytes_saved"] = detail.get("svg_bytes_saved", 0) + saved
+    return cleaned
 
 
 def _load_template() -> str:
@@ -136,215 +759,200 @@ def _load_template() -> str:
     return ref.read_text(encoding="utf-8")
 
 
-def _render_template(html_content: str, title: str = "Document") -> str:
-    """Render the branded HTML template with the given content.
+# Brand image slots in the template, and the name each is served under
+# from DOCUMENT_ORIGIN (see _document_response).
+_BRAND_ASSETS = {
+    "HEADER_IMG": "header.png",
+    "FOOTER_IMG": "footer.png",
+    "H2_BACKGROUND_IMG": "h2-background.png",
+    "BG_DECORATION_IMG": "bg-decoration.png",
+}
+_BRAND_PATH = "_brand/"
 
-    Replaces all {{PLACEHOLDER}} tokens in the template with actual values:
-    brand images (base64), content, title, etc.
-    """
-    from improving_pdf_tool.assets.images import (
-        BG_DECORATION_IMG,
-        FOOTER_IMG,
-        H2_BACKGROUND_IMG,
-        HEADER_IMG,
-    )
+_SLOT_RE = re.compile(r"\{\{([A-Z0-9_]+)\}\}")
 
-    template = _load_template()
 
-    result = template.replace("{{TITLE}}", title)
-    result = result.replace("{{YEAR}}", str(datetime.now().year))
-    result = result.replace("{{CONTENT}}", html_content)
-    result = result.replace("{{HEADER_IMG}}", HEADER_IMG)
-    result = result.replace("{{FOOTER_IMG}}", FOOTER_IMG)
-    result = result.replace("{{H2_BACKGROUND_IMG}}", H2_BACKGROUND_IMG)
-    result = result.replace("{{BG_DECORATION_IMG}}", BG_DECORATION_IMG)
-    result = result.replace("{{MERMAID_SCRIPT}}", "")
+@functools.lru_cache(maxsize=None)
+def _brand_data_uris() -> dict[str, str]:
+    """Brand image data URIs by template slot, imported on first use."""
+    from improving_pdf_tool.assets import images
 
-    return result
+    return {slot: getattr(images, slot) for slot in _BRAND_ASSETS}
 
 
-def _extract_mermaid_blocks(html: str) -> tuple[str, list[str]]:
-    """Extract fenced mermaid code blocks from HTML, replacing with placeholders.
+@functools.lru_cache(maxsize=None)
+def _brand_asset(name: str) -> bytes | None:
+    """Decoded PNG bytes of the brand image served as *name*, if any."""
+    for slot, asset_name in _BRAND_ASSETS.items():
+        if asset_name == name:
+            uri = _brand_data_uris()[slot]
+            return base64.b64decode(uri.split(",", 1)[1])
+    return None
 
-    The markdown library renders ```mermaid blocks as
-    <pre><code class="language-mermaid">...</code></pre>.
-    This function extracts the diagram source and replaces each block with a
-    numbered placeholder for later substitution with rendered SVGs.
 
-    Returns:
-        A tuple of (html_with_placeholders, list_of_diagram_sources).
-    """
-    diagrams = []
-
-    def _replace(match):
-        code = match.group(1)
-        # Unescape HTML entities that the markdown library may have applied
-        code = code.replace("&lt;", "<").replace("&gt;", ">")
-        code = code.replace("&amp;", "&").replace("&quot;", '"')
-        idx = len(diagrams)
-        diagrams.append(code)
-        return f'{{{{MERMAID_PLACEHOLDER_{idx}}}}}'
-
-    html_with_placeholders = re.sub(
-        r'<pre><code class="language-mermaid">(.*?)</code></pre>',
-        _replace,
-        html,
-        flags=re.DOTALL,
-    )
+@functools.lru_cache(maxsize=None)
+def _compiled_template() -> tuple[tuple[str, ...], tuple[str, ...]]:
+    """Parse the template once into literal segments and per-document slots.
+
+    Brand image URLs (and the unused Mermaid script slot) are substituted
+    here, once per process. The result is (segments, slots) with one more
+    segment than slots: segments[0], value of slots[0], segments[1], ...
+    """
+    static = {
+        slot: DOCUMENT_ORIGIN + _BRAND_PATH + name
+        for slot, name in _BRAND_ASSETS.items()
+    }
+    static["MERMAID_SCRIPT"] = ""
+
+    parts = _SLOT_RE.split(_load_template())
+    segments = [parts[0]]
+    slots = []
+    for name, literal in zip(parts[1::2], parts[2::2]):
+        if name in static:
+            segments[-1] += static[name] + literal
+        else:
+            slots.append(name)
+            segments.append(literal)
+    return tuple(segments), tuple(slots)
 
-    return html_with_placeholders, diagrams
 
+def _render_template(
+    html_content: str,
+    title: str = "Document",
+    print_content: str | None = None,
+) -> str:
+    """Render the branded HTML template with the given content.
 
-def _embed_mermaid_svgs(html: str, svgs: list[str]) -> str:
+    Fills the TITLE, YEAR, CONTENT (screen preview) and PRINT_CONTENT slots
+    of the compiled template with a single join. *print_content* defaults
+    to *html_content*; it differs when the two copies need distinct ids (see
+    _embed_mermaid_svgs). The brand images are not embedded but served
+    from DOCUMENT_ORIGIN, which keeps the document small but means it only
+    renders through html_to_pdf_bytes.
+    """
+    segments, slots = _compiled_template()
+    values = {
+        "TITLE": title,
+        "YEAR": str(datetime.now().year),
+        "CONTENT": html_content,
+        "PRINT_CONTENT": html_content if print_content is None else print_content,
+    }
+    pieces = [segments[0]]
+    for slot, segment in zip(slots, segments[1:]):
+        pieces.append(values[slot])
+        pieces.append(segment)
+    return "".join(pieces)
+
+
+def _embed_mermaid_svgs(
+    html: str, svgs: list[str], inline: bool = False, id_prefix: str = "mermaid-pre"
+) -> str:
     """Replace mermaid placeholders with pre-rendered SVG images.
 
     Each SVG is base64-encoded and embedded as an <img> tag with sizing
-    constraints to prevent overflow in both dimensions.
+    constraints to prevent overflow in both dimensions, or with
+    ``inline=True`` placed in the document as it is, which avoids the
+    base64 overhead. All placeholders are substituted in a single pass
+    over the document; one without a matching SVG is left as it is.
+
+    Inline SVGs share the document's id space, and the template holds the
+    content twice (screen and print), so each copy is embedded with its own
+    *id_prefix* for the diagram ids, marker ids and CSS scopes.
     """
-    for i, svg in enumerate(svgs):
-        placeholder = f'{{{{MERMAID_PLACEHOLDER_{i}}}}}'
-        svg_b64 = base64.b64encode(svg.encode("utf-8")).decode("ascii")
-        img_tag = (
+    from improving_pdf_tool.markdown_ext import MERMAID_PLACEHOLDER_RE
+
+    def _img_tag(match: re.Match) -> str:
+        i = int(match.group(1))
+        if i >= len(svgs):
+            return match.group(0)
+        if not svgs[i].startswith("<svg"):
+            return svgs[i]  # error placeholder, shown as it is
+        if inline:
+            return _inline_svg(svgs[i], i, id_prefix)
+        svg_b64 = base64.b64encode(svgs[i].encode("utf-8")).decode("ascii")
+        return (
             f'<img class="mermaid-img" '
             f'src="data:image/svg+xml;base64,{svg_b64}" '
             f'alt="Diagram {i + 1}">'
         )
-        html = html.replace(placeholder, img_tag)
-    return html
 
+    return MERMAID_PLACEHOLDER_RE.sub(_img_tag, html)
 
-def _wrap_mermaid_with_headings(html: str) -> str:
-    """Wrap each mermaid <img> and its immediately preceding context in a .mermaid-figure.
 
-    This keeps the heading/label and diagram together as a single unit for
-    page-break-inside: avoid, preventing orphaned headings or labels.
+_converters = threading.local()
 
-    Splits the HTML into block-level chunks, then for each mermaid img chunk,
-    looks at the immediately preceding chunk and wraps them together if it is
-    a heading or paragraph.
-    """
-    # Split HTML into block-level chunks while preserving separators.
-    # This splits on boundaries between block elements (before opening tags
-    # of h1-h6, p, div, ul, ol, table, blockquote, hr, pre, img).
-    block_tag = re.compile(
-        r'(?=<(?:h[1-6]|p|div|ul|ol|table|blockquote|hr|pre|img)[\s>])'
-    )
-    chunks = block_tag.split(html)
-
-    # Process chunks: find mermaid img chunks and merge with preceding context
-    result = []
-    i = 0
-    while i < len(chunks):
-        chunk = chunks[i]
-
-        if '<img class="mermaid-img"' in chunk:
-            # Look back at the previous chunk to see if it should be wrapped together
-            if result:
-                prev = result[-1]
-                prev_stripped = prev.strip()
-                # Wrap with preceding chunk if it's a heading or a short <p> (label)
-                is_heading = bool(re.match(r'<h[1-6][\s>]', prev_stripped))
-                is_paragraph = bool(re.match(r'<p[\s>]', prev_stripped))
-
-                if is_heading or is_paragraph:
-                    result.pop()
-                    result.append(
-                        f'<div class="mermaid-figure">{prev}{chunk}</div>'
-                    )
-                else:
-                    result.append(
-                        f'<div class="mermaid-figure">{chunk}</div>'
-                    )
-            else:
-                result.append(f'<div class="mermaid-figure">{chunk}</div>')
-        else:
-            result.append(chunk)
 
-        i += 1
+def _inline_svg(svg: str, index: int, id_prefix: str = "mermaid-pre") -> str:
+    """Prepare diagram *index*'s SVG for inlining.
 
-    return ''.join(result)
+    Re-stamps its ids with *id_prefix*, scopes any ids Mermaid did not
+    prefix (see svg_assets.scope_ids), and adds the mermaid-img class
+    (sizing) to its root.
+    """
+    scope = f"{id_prefix}-{index}"
+    if id_prefix != "mermaid-pre":
+        svg = _id_pattern(f"mermaid-pre-{index}").sub(scope, svg)
+    svg = scope_ids(svg, scope)
+    root_end = svg.index(">")
+    root = svg[:root_end]
+    if re.search(r'\sclass="', root):
+        root = re.sub(r'\sclass="', ' class="mermaid-img ', root, count=1)
+    else:
+        root += ' class="mermaid-img"'
+    return root + svg[root_end:]
+
+
+def _markdown_to_html(markdown_text: str) -> tuple[str, list[str], str | None]:
+    """Convert Markdown text to HTML using the 'markdown' library.
 
+    Besides the tables, fenced_code and toc extensions, this applies the
+    Improving conventions (see markdown_ext.ImprovingExtension). The
+    converter is built once per thread and reset between documents.
 
-def _markdown_to_html(markdown_text: str) -> str:
-    """Convert Markdown text to HTML using the 'markdown' library.
+    Returns:
+        A tuple of (html_with_mermaid_placeholders, diagram_sources, title).
 
     Raises ImportError if the 'markdown' package is not installed.
     """
-    try:
-        import markdown
-    except ImportError:
-        raise ImportError(
-            "The 'markdown' package is required for .md input. "
-            "Install it with: pip install markdown"
-        )
-
-    return markdown.markdown(
-        markdown_text,
-        extensions=["tables", "fenced_code", "toc"],
-    )
-
-
-def _copy_images_to_temp(html: str, base_dir: str, temp_dir: str) -> None:
-    """Copy images referenced in HTML into the temp directory.
-
-    Finds all <img src="..."> tags with relative paths, resolves them
-    against *base_dir* (the original markdown file's directory), and
-    copies each file into *temp_dir* preserving the relative directory
-    structure so the HTML references remain valid.
-
-    Args:
-        html: HTML string potentially containing <img> tags with relative paths.
-        base_dir: The directory to resolve relative paths against.
-        temp_dir: The temporary directory where the HTML will be written.
-    """
-    for match in re.finditer(r'src="([^"]*)"', html):
-        src = match.group(1)
-        # Skip absolute URIs (http, https, data, file)
-        if re.match(r'(https?://|data:|file://)', src):
-            continue
-        src_path = Path(base_dir) / src
-        if src_path.is_file():
-            dest_path = Path(temp_dir) / src
-            dest_path.parent.mkdir(parents=True, exist_ok=True)
-            shutil.copy2(str(src_path), str(dest_path))
-
-
-def _apply_heading_classes(html: str) -> str:
-    """Apply doc-title and doc-subtitle classes to the first H1 and first H2.
-
-    Mirrors the heading classification logic from the original pdf-creation.html:
-    - First <h1> gets class="doc-title"
-    - First <h2> immediately after the first <h1> gets class="doc-subtitle"
-    """
-    # Add doc-title to the first h1 (may have attributes like id from toc extension)
-    html = re.sub(
-        r"<h1([^>]*)>(.*?)</h1>",
-        r'<h1\1 class="doc-title">\2</h1>',
-        html,
-        count=1,
-    )
+    md = getattr(_converters, "markdown", None)
+    if md is None:
+        try:
+            import markdown
+        except ImportError:
+            raise ImportError(
+                "The 'markdown' package is required for .md input. "
+                "Install it with: pip install markdown"
+            )
+        from improving_pdf_tool.markdown_ext import ImprovingExtension
 
-    # Add doc-subtitle to the first h2 that immediately follows the doc-title h1
-    html = re.sub(
-        r'(<h1[^>]*class="doc-title"[^>]*>.*?</h1>\s*)<h2([^>]*)>(.*?)</h2>',
-        r'\1<h2\2 class="doc-subtitle">\3</h2>',
-        html,
-        count=1,
-        flags=re.DOTALL,
-    )
+        md = markdown.Markdown(
+            extensions=["tables", "fenced_code", "toc", ImprovingExtension()],
+        )
+        _converters.markdown = md
 
-    return html
+    md.reset()
+    html = md.convert(markdown_text)
+    return html, list(md.mermaid_sources), md.title
 
 
-def markdown_to_pdf(md_path: str, pdf_path: str) -> str:
+def markdown_to_pdf(
+    md_path: str,
+    pdf_path: str,
+    session: RenderSession | None = None,
+    shards: int = 1,
+) -> str:
     """Convert a Markdown file to a branded PDF.
 
     Reads the Markdown file, converts to HTML, injects into the branded
-    template, writes a temporary HTML file, and renders to PDF.
+    template, and renders to PDF in memory (see markdown_to_pdf_bytes).
 
     Args:
         md_path: Path to the input Markdown file.
         pdf_path: Path where the output PDF will be written.
+        session: Optional shared RenderSession. When omitted, a single
+            temporary browser serves both Mermaid pre-rendering and printing.
+        shards: Print the document in up to this many pieces and merge
+            them (see markdown_to_pdf_bytes).
 
     Returns:
         The absolute path to the generated PDF file.
@@ -353,83 +961,607 @@ def markdown_to_pdf(md_path: str, pdf_path: str) -> str:
     if not os.path.isfile(md_path):
         raise FileNotFoundError(f"Markdown file not found: {md_path}")
 
-    with open(md_path, "r", encoding="utf-8") as f:
+    with stage("read"), open(md_path, "r", encoding="utf-8") as f:
         markdown_text = f.read()
 
+    pdf = markdown_to_pdf_bytes(
+        markdown_text, base_dir=str(Path(md_path).parent), session=session, shards=shards
+    )
+    return _write_pdf(pdf, pdf_path)
+
+
+def markdown_to_pdf_bytes(
+    markdown_text: str,
+    base_dir: str | None = None,
+    session: RenderSession | None = None,
+    shards: int = 1,
+) -> bytes:
+    """Convert Markdown text to a branded PDF, entirely in memory.
+
+    Args:
+        markdown_text: The Markdown source.
+        base_dir: Directory that relative image paths are resolved against.
+            When omitted, local references are not served.
+        session: Optional shared RenderSession. When omitted, a single
+            temporary browser serves both Mermaid pre-rendering and printing.
+        shards: Split the document at top-level sections into up to this
+            many pieces, print each on its own page and merge the PDFs (see
+            sharding.py; requires pypdf). Bounds the memory of each renderer
+            process by the largest piece, and of the print by the session's
+            shard_concurrency pieces, for very long documents.
+
+    Returns:
+        The PDF document as bytes.
+
+    Raises:
+        ValueError: If *shards* is less than 1.
+    """
+    if shards < 1:
+        raise ValueError(f"shards must be at least 1, got {shards}")
+
+    key = _build_key(session, "markdown", markdown_text, base_dir, shards=shards)
+    pdf = _cached_build(session, key)
+    if pdf is not None:
+        return pdf
+
+    with stage("markdown"):
+        html_content, mermaid_sources, title = _prepare_markdown(markdown_text)
+
+    with _session_scope(session) as active:
+        svgs = _prerender_mermaid_to_svgs(mermaid_sources, session=active)
+        if shards > 1:
+            with stage("assemble"):
+                contents, documents = _assemble_shards(
+                    html_content, title, svgs, shards, inline_svgs=active.inline_svg
+                )
+        else:
+            with stage("assemble"):
+                documents = [
+                    _assemble_document(
+                        html_content, title, svgs, inline_svgs=active.inline_svg
+                    )
+                ]
+        if len(documents) > 1:
+            pdf = _merge_shards(_print_shards(documents, base_dir, active), contents)
+        else:
+            pdf = html_to_pdf_bytes(documents[0], base_dir=base_dir, session=active)
+
+    # A diagram that failed (or timed out) may render next time.
+    if all(svg.startswith("<svg") for svg in svgs):
+        _store_build(session, key, pdf)
+    return pdf
+
+
+@functools.lru_cache(maxsize=None)
+def _environment_fingerprint() -> str:
+    """Hash of everything besides the input and options that shapes a PDF.
+
+    Covers the tool and Playwright versions, the Mermaid build, the Mermaid,
+    SVG and page.pdf() settings, the template and the brand images.
+    """
+    from improving_pdf_tool import __version__
+
+    try:
+        from playwright._repo_version import version as playwright_version
+    except ImportError:
+        playwright_version = ""
+    return cache_key(
+        __version__,
+        playwright_version,
+        _mermaid_build_id(),
+        json.dumps(MERMAID_CONFIG, sort_keys=True),
+        OPTIMIZER_VERSION,
+        json.dumps(PDF_OPTIONS, sort_keys=True),
+        _load_template(),
+        *(_brand_data_uris()[slot] for slot in sorted(_BRAND_ASSETS)),
+    )
+
+
+def _build_key(
+    session: RenderSession | None,
+    kind: str,
+    source: str,
+    base_dir: str | None,
+    **options,
+) -> str | None:
+    """Build cache key for *source*; None if *session* has no build cache."""
+    if session is None or session.build_cache is None:
+        return None
+    options.update(
+        image_dpi=session.images.dpi if session.images is not None else None,
+        inline_svg=session.inline_svg,
+        asset_root=session.asset_root,
+        # The footer prints the current year.
+        year=datetime.now().year,
+    )
+    return build_key(kind, source, base_dir, _environment_fingerprint(), options)
+
+
+def _cached_build(session: RenderSession | None, key: str | None) -> bytes | None:
+    """The PDF stored under *key*, if any, as the ``build_cache`` stage."""
+    if key is None:
+        return None
+    with stage("build_cache") as detail:
+        pdf = session.build_cache.get(key)
+        detail["hit"] = pdf is not None
+    return pdf
+
+
+def _store_build(session: RenderSession | None, key: str | None, pdf: bytes) -> None:
+    if key is not None:
+        session.build_cache.put(key, pdf)
+
+
+def _prepare_markdown(markdown_text: str) -> tuple[str, list[str], str | None]:
+    """First, browser-free half of the Markdown pipeline.
+
+    Strips HTML comments and converts to HTML. Heading classes, diagram
+    figures and the title are handled during conversion.
+
+    Returns:
+        A tuple of (html_with_placeholders, diagram_sources, title).
+    """
     # Strip HTML comments
     markdown_text = re.sub(r"<!--[\s\S]*?-->", "", markdown_text)
 
-    # Convert markdown to HTML
-    html_content = _markdown_to_html(markdown_text)
+    return _markdown_to_html(markdown_text)
+
+
+def _assemble_document(
+    html_content: str, title: str | None, svgs: list[str], inline_svgs: bool = False
+) -> str:
+    """Second, browser-free half of the Markdown pipeline.
+
+    Embeds the rendered diagrams (inline, or as base64 images; see
+    _embed_mermaid_svgs) and wraps the result in the branded template.
+
+    Returns:
+        The full HTML document, ready to print.
+    """
+    screen, printed = _embed_copies(html_content, svgs, inline_svgs)
+
+    # Render into branded template; brand images are served, not inlined
+    return _render_template(screen, title=title or "Document", print_content=printed)
 
-    # Extract mermaid blocks and pre-render to SVG
-    html_content, mermaid_sources = _extract_mermaid_blocks(html_content)
-    if mermaid_sources:
-        svgs = _prerender_mermaid_to_svgs(mermaid_sources)
-        html_content = _embed_mermaid_svgs(html_content, svgs)
 
-    html_content = _apply_heading_classes(html_content)
+# Diagram id prefix of the print copy of inlined SVGs; the screen copy
+# keeps the rendered "mermaid-pre".
+_PRINT_ID_PREFIX = "mermaid-print"
 
-    # Wrap mermaid diagrams with their headings for page-break control
-    if mermaid_sources:
-        html_content = _wrap_mermaid_with_headings(html_content)
 
-    # Extract title from first H1 if present
-    title_match = re.search(r'<h1[^>]*>(.*?)</h1>', html_content)
-    title = title_match.group(1) if title_match else "Document"
+def _embed_copies(
+    html_content: str, svgs: list[str], inline_svgs: bool
+) -> tuple[str, str | None]:
+    """Embed the diagrams for the template's screen and print copies.
 
-    # Render into branded template
-    full_html = _render_template(html_content, title=title)
+    Returns:
+        A tuple of (screen content, print content). The print content is
+        None, meaning the same as the screen's, unless SVGs are inlined.
+    """
+    if not svgs:
+        return html_content, None
+    screen = _embed_mermaid_svgs(html_content, svgs, inline=inline_svgs)
+    if not inline_svgs:
+        return screen, None
+    printed = _embed_mermaid_svgs(
+        html_content, svgs, inline=True, id_prefix=_PRINT_ID_PREFIX
+    )
+    return screen, printed
+
+
+def _assemble_shards(
+    html_content: str,
+    title: str | None,
+    svgs: list[str],
+    shards: int,
+    inline_svgs: bool = False,
+) -> tuple[list[str], list[str]]:
+    """_assemble_document, cut at section boundaries into up to *shards* documents.
+
+    Every piece is wrapped in the full template, so each keeps the
+    repeating header and footer.
+
+    Returns:
+        A tuple of (each shard's content, each shard's full HTML document).
+
+    Raises ImportError if the 'pypdf' package, needed to merge the shards,
+    is not installed.
+    """
+    from improving_pdf_tool.sharding import require_pypdf, section_groups, split_sections
+
+    # Fail before any printing, not at the merge.
+    require_pypdf()
+    # Diagram figures never straddle a section boundary, so splitting before
+    # embedding gives the same sections; each copy is then embedded per section.
+    copies = [
+        _embed_copies(section, svgs, inline_svgs)
+        for section in split_sections(html_content)
+    ]
+    contents = []
+    documents = []
+    for start, end in section_groups([len(screen) for screen, _ in copies], shards):
+        content = "".join(screen for screen, _ in copies[start:end])
+        printed = None
+        if inline_svgs:
+            printed = "".join(p or s for s, p in copies[start:end])
+        contents.append(content)
+        documents.append(_render_template(
+            content, title=title or "Document", print_content=printed
+        ))
+    return contents, documents
+
+
+def _merge_shards(pdfs: list[bytes], contents: list[str]) -> bytes:
+    """Merge the shards' PDFs, as the ``merge`` stage."""
+    from improving_pdf_tool.sharding import merge_pdfs
+
+    with stage("merge", shards=len(pdfs)) as detail:
+        pdf = merge_pdfs(pdfs, contents)
+        detail["bytes"] = len(pdf)
+    return pdf
+
+
+def _document_url(base_dir: str | None) -> str:
+    """The URL a document with *base_dir* is served at.
+
+    That is the directory's absolute path under DOCUMENT_ORIGIN, so that
+    ``../images/a.png`` and ``/abs/a.png`` keep pointing at the files they
+    name. Without a base directory, the document sits at the origin's root.
+    """
+    if base_dir is None:
+        return _DOCUMENT_URL
+    path = Path(base_dir).resolve().as_uri()[len("file://"):].rstrip("/")
+    return f"{DOCUMENT_ORIGIN.rstrip('/')}{path}/{_DOCUMENT_NAME}"
+
+
+def _rebase_file_urls(html: str) -> str:
+    """Point file:// src/href attributes at the same paths under DOCUMENT_ORIGIN."""
+    return _FILE_URL_RE.sub(r"\1", html)
+
+
+def _resolve_asset(
+    base_dir: str | None, url: str, asset_root: str | None = None
+) -> Path | None:
+    """Map a request under DOCUMENT_ORIGIN to the local file it names.
 
-    # Write HTML to a temp directory and copy referenced images so that
-    # relative src paths resolve correctly when Chromium renders the page.
-    tmp_dir = tempfile.mkdtemp()
-    tmp_html = os.path.join(tmp_dir, "document.html")
+    Returns None when there is no base directory, the file does not exist,
+    or it lies outside *asset_root* (when given).
+    """
+    if base_dir is None:
+        return None
+    # Imported here: urllib.request is slow to import and only needed now.
+    from urllib.request import url2pathname
+
+    path = urllib.parse.urlsplit(url).path
+    candidate = Path(url2pathname(path)).resolve()
+    if asset_root is not None and not candidate.is_relative_to(Path(asset_root).resolve()):
+        return None
+    if not candidate.is_file():
+        return None
+    return candidate
+
+
+def _document_response(
+    url: str,
+    html: str,
+    base_dir: str | None,
+    images: ImageProcessor | None = None,
+    asset_root: str | None = None,
+) -> dict:
+    """Return route.fulfill() arguments for a request under DOCUMENT_ORIGIN.
+
+    Local raster images go through *images*, when given, and are served
+    downsampled if that makes them smaller.
+    """
+    if url == _document_url(base_dir):
+        return {"body": html, "content_type": "text/html; charset=utf-8"}
+    if url.startswith(DOCUMENT_ORIGIN + _BRAND_PATH):
+        brand = _brand_asset(url[len(DOCUMENT_ORIGIN + _BRAND_PATH):])
+        if brand is not None:
+            return {"body": brand, "content_type": "image/png"}
+    asset = _resolve_asset(base_dir, url, asset_root)
+    if asset is None:
+        return {"status": 404, "body": ""}
+    processed = images.process(asset) if images is not None else None
+    if processed is not None:
+        body, content_type = processed
+        return {"body": body, "content_type": content_type}
+    return {"path": str(asset)}
+
+
+def _print_page(page, url: str) -> tuple[bytes, bool]:
+    """Load *url*, wait for the readiness signal and print it to PDF bytes.
+
+    When the active profile asks for a trace, Chromium's tracing covers
+    the load and the print.
 
+    Returns:
+        A tuple of (pdf, ready); ready is False if the page was printed
+        without its runtime Mermaid (see _wait_until_ready).
+    """
+    profile = current_profile()
+    tracing = profile is not None and profile.trace_path is not None
+    if tracing:
+        page.context.browser.start_tracing(page=page, path=profile.trace_path)
     try:
-        md_dir = str(Path(md_path).parent)
-        _copy_images_to_temp(full_html, md_dir, tmp_dir)
+        with stage("load") as detail:
+            # Lay out for print from the start, so print-only resources (brand
+            # backgrounds) are fetched as part of the load the readiness
+            # check awaits.
+            page.emulate_media(media="print")
+            page.goto(url, wait_until="load")
+            ready = _wait_until_ready(page)
+            if not ready:
+                detail["runtime_mermaid"] = "timed out"
+        return _save_pdf(page), ready
+    finally:
+        if tracing:
+            page.context.browser.stop_tracing()
+
 
-        with open(tmp_html, "w", encoding="utf-8") as f:
-            f.write(full_html)
+def _wait_until_ready(page) -> bool:
+    """Wait for fonts, images and any runtime Mermaid of a loaded page.
 
-        return html_to_pdf(tmp_html, pdf_path)
+    Returns:
+        False if runtime Mermaid did not finish within the timeout; the page
+        is then printed as it is.
+    """
+    from playwright.sync_api import TimeoutError as PlaywrightTimeoutError
+
+    page.evaluate(_READY_SCRIPT)
+    try:
+        page.wait_for_function(_RUNTIME_MERMAID_DONE, timeout=_RUNTIME_MERMAID_TIMEOUT)
+    except PlaywrightTimeoutError:
+        return False
+    return True
+
+
+def _save_pdf(page, **detail) -> bytes:
+    """Print a ready page to PDF bytes, as a ``pdf`` stage."""
+    with stage("pdf", **detail) as recorded:
+        pdf = page.pdf(**PDF_OPTIONS)
+        recorded["bytes"] = len(pdf)
+    return pdf
+
+
+def _print_shards(
+    documents: list[str], base_dir: str | None, session: RenderSession
+) -> list[bytes]:
+    """Print each shard document on its own page, in its own browser context.
+
+    Up to session.shard_concurrency shards load at once, each in its own
+    renderer process, so peak memory is about that many of the largest
+    shard rather than the whole document. They are printed in order; as
+    each is printed its context is closed and the next shard starts
+    loading. A trace, when asked for, covers the whole browser.
+    """
+    profile = current_profile()
+    tracing = profile is not None and profile.trace_path is not None
+    browser = session.browser
+    # Contexts of the shards loading or awaiting print, in shard order.
+    loading = deque()
+    started = 0
+    pdfs = []
+    if tracing:
+        browser.start_tracing(path=profile.trace_path)
+    try:
+        for n in range(len(documents)):
+            while started < len(documents) and len(loading) < session.shard_concurrency:
+                html = documents[started]
+                started += 1
+                context = browser.new_context()
+                loading.append(context)
+                page = context.new_page()
+                _route_document(
+                    page, html, base_dir, session.images, profile, session.asset_root
+                )
+                # Print media from the start, as in _print_page.
+                page.emulate_media(media="print")
+                page.goto(_document_url(base_dir), wait_until="commit")
+            context = loading[0]
+            page = context.pages[0]
+            with stage("load", shard=n) as detail:
+                page.wait_for_load_state("load")
+                if not _wait_until_ready(page):
+                    detail["runtime_mermaid"] = "timed out"
+            pdfs.append(_save_pdf(page, shard=n))
+            loading.popleft().close()
     finally:
-        shutil.rmtree(tmp_dir, ignore_errors=True)
+        for context in loading:
+            context.close()
+        if tracing:
+            browser.stop_tracing()
+    return pdfs
+
+
+def _serve_profiled(
+    url: str,
+    html: str,
+    base_dir: str | None,
+    images: ImageProcessor | None,
+    profile,
+    asset_root: str | None = None,
+) -> dict:
+    """_document_response, recorded as a ``serve`` stage of *profile*.
+
+    Route handlers may run outside the caller's context (Playwright's sync
+    API dispatches them on separate greenlets), so the profile is passed in.
+    """
+    if profile is None:
+        return _document_response(url, html, base_dir, images, asset_root)
+    start = time.perf_counter()
+    response = _document_response(url, html, base_dir, images, asset_root)
+    seconds = time.perf_counter() - start
+    if "path" in response:
+        size = os.path.getsize(response["path"])
+    else:
+        size = len(response["body"])
+    profile.add(
+        "serve",
+        seconds,
+        url=url[len(DOCUMENT_ORIGIN):],
+        status=response.get("status", 200),
+        bytes=size,
+    )
+    return response
+
+
+def _route_document(
+    page,
+    html: str,
+    base_dir: str | None,
+    images: ImageProcessor | None,
+    profile,
+    asset_root: str | None = None,
+) -> None:
+    """Answer every request of *page* under DOCUMENT_ORIGIN (see _document_response)."""
+    html = _rebase_file_urls(html)
+    page.route(
+        DOCUMENT_ORIGIN + "**",
+        lambda route: route.fulfill(
+            **_serve_profiled(
+                route.request.url, html, base_dir, images, profile, asset_root
+            )
+        ),
+    )
+
+
+def _write_pdf(pdf: bytes, pdf_path: str) -> str:
+    """Write *pdf* to *pdf_path* (creating directories); return the absolute path."""
+    path = Path(pdf_path).resolve()
+    with stage("write"):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(pdf)
+    return str(path)
+
 
+def html_to_pdf_bytes(
+    html: str, base_dir: str | None = None, session: RenderSession | None = None
+) -> bytes:
+    """Convert an HTML string to PDF, entirely in memory.
 
-def html_to_pdf(html_path: str, pdf_path: str) -> str:
+    The document is served to Chromium from DOCUMENT_ORIGIN through request
+    interception, at a URL that mirrors *base_dir*, so local references
+    (relative, root-relative or file://) load the files they name.
+
+    Args:
+        html: The complete HTML document.
+        base_dir: Directory that relative asset URLs are resolved against.
+            When omitted, local references are not served.
+        session: Optional shared RenderSession. When omitted, a temporary
+            browser is launched for this call only.
+
+    Returns:
+        The PDF document as bytes.
+    """
+    profile = current_profile()
+    with _session_scope(session) as active, active.new_page() as page:
+        _route_document(page, html, base_dir, active.images, profile, active.asset_root)
+        pdf, _ = _print_page(page, _document_url(base_dir))
+        return pdf
+
+
+def html_to_pdf(
+    html_path: str, pdf_path: str, session: RenderSession | None = None
+) -> str:
     """Convert an HTML file to PDF using headless Chromium.
 
+    The file is loaded from disk so that any relative or file:// references
+    it contains keep working.
+
     Args:
         html_path: Path to the input HTML file.
         pdf_path: Path where the output PDF will be written.
+        session: Optional shared RenderSession. When omitted, a temporary
+            browser is launched for this call only.
 
     Returns:
         The absolute path to the generated PDF file.
     """
     html_path = str(Path(html_path).resolve())
-    pdf_path = str(Path(pdf_path).resolve())
 
     if not os.path.isfile(html_path):
         raise FileNotFoundError(f"HTML file not found: {html_path}")
 
-    file_url = Path(html_path).as_uri()
-
-    _ensure_chromium_installed()
-
-    with sync_playwright() as p:
-        browser = p.chromium.launch()
-        page = browser.new_page()
-        page.goto(file_url, wait_until="networkidle")
-        page.pdf(
-            path=pdf_path,
-            format="Letter",
-            print_background=True,
-            margin={"top": "0", "right": "0", "bottom": "0", "left": "0"},
-            outline=True,
-            tagged=True,
+    return _write_pdf(_html_file_to_pdf_bytes(Path(html_path), session), pdf_path)
+
+
+def _html_file_to_pdf_bytes(path: Path, session: RenderSession | None) -> bytes:
+    """Print the HTML file at (absolute) *path*, going through the build cache."""
+    key = None
+    if session is not None and session.build_cache is not None:
+        key = _build_key(
+            session, "html", path.read_text(encoding="utf-8"), str(path.parent)
         )
-        browser.close()
+    pdf = _cached_build(session, key)
+    if pdf is None:
+        with _session_scope(session) as active, active.new_page() as page:
+            pdf, ready = _print_page(page, path.as_uri())
+        # Runtime Mermaid that timed out (CDN unreachable) may work next time.
+        if ready:
+            _store_build(session, key, pdf)
+    return pdf
+
 
-    return pdf_path
+HTML_EXTENSIONS = (".html", ".htm")
+MARKDOWN_EXTENSIONS = (".md", ".markdown", ".txt")
+
+
+def _check_shards(input_path: str, shards: int) -> None:
+    """Reject sharding of HTML input, whose section structure is unknown."""
+    if shards > 1 and input_path.endswith(HTML_EXTENSIONS):
+        raise ValueError(f"Sharded rendering needs Markdown input, got: {input_path}")
+
+
+def convert_file(
+    input_path: str,
+    pdf_path: str,
+    session: RenderSession | None = None,
+    shards: int = 1,
+) -> str:
+    """Convert an HTML or Markdown file to PDF, dispatching on its extension.
+
+    *shards* applies to Markdown input only (see markdown_to_pdf_bytes).
+
+    Raises:
+        ValueError: If the file extension is not a supported input type, or
+            if *shards* is given for HTML input.
+    """
+    _check_shards(input_path, shards)
+    if input_path.endswith(HTML_EXTENSIONS):
+        return html_to_pdf(input_path, pdf_path, session=session)
+    if input_path.endswith(MARKDOWN_EXTENSIONS):
+        return markdown_to_pdf(input_path, pdf_path, session=session, shards=shards)
+    raise ValueError(
+        "Unsupported file type. Expected .html, .htm, .md, .markdown, or .txt, "
+        f"got: {input_path}"
+    )
+
+
+def convert_file_to_bytes(
+    input_path: str, session: RenderSession | None = None, shards: int = 1
+) -> bytes:
+    """Like convert_file, but return the PDF as bytes instead of writing it.
+
+    Raises:
+        FileNotFoundError: If the input file does not exist.
+        ValueError: If the file extension is not a supported input type, or
+            if *shards* is given for HTML input.
+    """
+    path = Path(input_path).resolve()
+    if not path.is_file():
+        raise FileNotFoundError(f"Input file not found: {path}")
+    _check_shards(input_path, shards)
+    if input_path.endswith(HTML_EXTENSIONS):
+        return _html_file_to_pdf_bytes(path, session)
+    if input_path.endswith(MARKDOWN_EXTENSIONS):
+        return markdown_to_pdf_bytes(
+            path.read_text(encoding="utf-8"),
+            base_dir=str(path.parent),
+            session=session,
+            shards=shards,
+        )
+    raise ValueError(
+        "Unsupported file type. Expected .html, .htm, .md, .markdown, or .txt, "
+        f"got: {input_path}"
+    )
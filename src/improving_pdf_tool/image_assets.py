@@ -0,0 +1,175 @@
+"""Opt-in downsampling of the raster images a document references.
+
+Screenshots are often several times larger than anything a Letter page can
+show. With an ImageProcessor attached to a RenderSession, every referenced
+PNG/JPEG/WebP wider than the printable width at the requested DPI is
+downscaled before it reaches Chromium. The result is cached on disk, keyed
+by the file's content hash and the target width, so repeated builds reuse
+it. Requires Pillow (``pip install improving-pdf-tool[images]``).
+"""
+
+import hashlib
+import io
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+from improving_pdf_tool.cache import DEFAULT_MEMORY_MAX_BYTES, DiskCache, cache_key
+
+
+# Width of the template's content column on a Letter page: 8.5in minus the
+# 2.5rem (~0.42in) left and right padding of the print content cell.
+PRINTABLE_WIDTH_IN = 7.67
+
+# Subdirectory of the cache root holding downsampled images.
+IMAGE_CACHE_SUBDIR = "images"
+
+# Bumped whenever the resampling or encoding below changes.
+_PIPELINE_VERSION = "1"
+
+_FORMATS = {
+    ".png": ("PNG", "image/png"),
+    ".jpg": ("JPEG", "image/jpeg"),
+    ".jpeg": ("JPEG", "image/jpeg"),
+    ".webp": ("WEBP", "image/webp"),
+}
+
+
+class ImageProcessor:
+    """Downscale referenced images to the printable width at *dpi*.
+
+    Each distinct file (by path, size and modification time) is processed at
+    most once per processor; a processor lives as long as its RenderSession.
+    Results are remembered for the latest version of each path only, and
+    least recently used ones are dropped past *memo_bytes*, so long-lived
+    sessions (watch mode, server workers) do not grow without bound.
+
+    process() may be called from several threads at once (the async API
+    runs it off the event loop); the memo is guarded by a lock, which is
+    not held while an image is processed.
+    """
+
+    def __init__(
+        self,
+        dpi: int,
+        cache: DiskCache | None = None,
+        memo_bytes: int = DEFAULT_MEMORY_MAX_BYTES,
+    ) -> None:
+        try:
+            import PIL
+        except ImportError:
+            raise ImportError(
+                "The 'Pillow' package is required for image downsampling. "
+                "Install it with: pip install Pillow"
+            )
+        self.dpi = dpi
+        self.max_width = round(PRINTABLE_WIDTH_IN * dpi)
+        self.cache = cache
+        self.memo_bytes = memo_bytes
+        # path -> ((size, mtime_ns), result), least recently used first.
+        self._seen: OrderedDict[
+            Path, tuple[tuple[int, int], tuple[bytes, str] | None]
+        ] = OrderedDict()
+        self._seen_bytes = 0
+        self._lock = threading.Lock()
+
+    def process(self, path: Path) -> tuple[bytes, str] | None:
+        """Return (image_bytes, content_type) for *path*, or None.
+
+        None means the original file should be served unchanged: it is not
+        a supported raster format, is already small enough, or cannot be
+        decoded.
+        """
+        kind = _FORMATS.get(path.suffix.lower())
+        if kind is None:
+            return None
+        try:
+            st = path.stat()
+        except OSError:
+            return None
+        version = (st.st_size, st.st_mtime_ns)
+        with self._lock:
+            seen = self._seen.get(path)
+            if seen is not None and seen[0] == version:
+                self._seen.move_to_end(path)
+                return seen[1]
+        result = self._process(path, *kind)
+        with self._lock:
+            self._remember(path, version, result)
+        return result
+
+    def _remember(
+        self, path: Path, version: tuple[int, int], result: tuple[bytes, str] | None
+    ) -> None:
+        """Memoize *result* as the one entry for *path*, within memo_bytes.
+
+        The caller holds the lock.
+        """
+        old = self._seen.pop(path, None)
+        if old is not None:
+            self._seen_bytes -= _result_size(old[1])
+        self._seen[path] = (version, result)
+        self._seen_bytes += _result_size(result)
+        while self._seen_bytes > self.memo_bytes and len(self._seen) > 1:
+            _, (_, dropped) = self._seen.popitem(last=False)
+            self._seen_bytes -= _result_size(dropped)
+
+    def _process(
+        self, path: Path, fmt: str, content_type: str
+    ) -> tuple[bytes, str] | None:
+        data = path.read_bytes()
+        digest = hashlib.sha256(data).hexdigest()
+        entry = cache_key(_PIPELINE_VERSION, digest, str(self.max_width))
+        if self.cache is not None:
+            cached = self.cache.get(entry)
+            if cached is not None:
+                # An empty entry records "already small enough".
+                return (cached, content_type) if cached else None
+
+        resized = self._downscale(data, fmt)
+        if self.cache is not None:
+            self.cache.put(entry, resized or b"")
+        return (resized, content_type) if resized else None
+
+    def _downscale(self, data: bytes, fmt: str) -> bytes | None:
+        from PIL import Image, ImageOps
+
+        try:
+            with Image.open(io.BytesIO(data)) as img:
+                if getattr(img, "is_animated", False):
+                    return None
+                # Bake in EXIF rotation, since the metadata is not kept.
+                img = ImageOps.exif_transpose(img)
+                if img.width <= self.max_width:
+                    return None
+                height = max(1, round(img.height * self.max_width / img.width))
+                img = img.resize((self.max_width, height), Image.Resampling.LANCZOS)
+                out = io.BytesIO()
+                if fmt == "JPEG":
+                    img.save(out, fmt, quality=85, optimize=True, progressive=True)
+                elif fmt == "WEBP":
+                    img.save(out, fmt, quality=85)
+                else:
+                    img.save(out, fmt, optimize=True)
+        except (OSError, ValueError, Image.DecompressionBombError):
+            return None
+        resized = out.getvalue()
+        # Never serve a "downsampled" file that came out bigger.
+        return resized if len(resized) < len(data) else None
+
+
+def _result_size(result: tuple[bytes, str] | None) -> int:
+    return len(result[0]) if result is not None else 0
+
+
+def open_image_processor(
+    dpi: int | None, cache_root: str | None
+) -> ImageProcessor | None:
+    """Build a session's ImageProcessor; None when downsampling is off."""
+    if not dpi:
+        return None
+    cache = None
+    if cache_root is not None:
+        cache = DiskCache(os.path.join(cache_root, IMAGE_CACHE_SUBDIR))
+    return ImageProcessor(dpi, cache)
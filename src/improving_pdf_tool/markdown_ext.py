@@ -0,0 +1,139 @@
+"""Python-Markdown extension applying the Improving document conventions.
+
+Everything the generator used to do with regexes over the finished HTML is
+done here, during conversion, in one walk over the top-level elements:
+
+- ```mermaid fences are pulled out (before fenced_code sees them) and left
+  as placeholders (see mermaid_placeholder) for the pre-rendered SVGs;
+- the first <h1> gets class="doc-title" and becomes the document title, and
+  an <h2> immediately after it gets class="doc-subtitle";
+- each diagram is wrapped in a <div class="mermaid-figure"> together with
+  the heading or paragraph right before it, so they never split across pages.
+
+After ``md.convert()``, ``md.mermaid_sources`` holds the diagram sources
+and ``md.title`` the (HTML-escaped) document title, or None.
+"""
+
+import html
+import re
+import xml.etree.ElementTree as etree
+
+from markdown.extensions import Extension
+from markdown.extensions.fenced_code import FencedBlockPreprocessor
+from markdown.preprocessors import Preprocessor
+from markdown.treeprocessors import Treeprocessor
+from markdown.util import ETX, STX
+
+try:
+    from markdown.extensions.toc import render_inner_html, strip_tags
+except ImportError:  # older Markdown releases
+    from markdown.extensions.toc import stashedHTML2text
+
+    render_inner_html = strip_tags = None
+
+
+_MARKER_RE = re.compile(f"^{STX}mermaid:(\\d+){ETX}$")
+
+# Elements pulled into a diagram's figure when directly before it.
+_FIGURE_LEAD_TAGS = {"h1", "h2", "h3", "h4", "h5", "h6", "p"}
+
+
+def mermaid_placeholder(index: int) -> str:
+    """The text left in the HTML where diagram *index* is to be embedded.
+
+    Delimited by STX/ETX, which Python-Markdown strips from the source, so
+    no document text can produce (or be mistaken for) a placeholder.
+    """
+    return f"{STX}mermaid-figure:{index}{ETX}"
+
+
+MERMAID_PLACEHOLDER_RE = re.compile(f"{STX}mermaid-figure:(\\d+){ETX}")
+
+
+class MermaidFencePreprocessor(Preprocessor):
+    """Replace ```mermaid fences with marker paragraphs, keeping the source.
+
+    Fences are matched with fenced_code's own pattern so that a mermaid
+    fence shown inside another code block is left alone.
+    """
+
+    def run(self, lines: list[str]) -> list[str]:
+        def _replace(match: re.Match) -> str:
+            if match.group("lang") != "mermaid":
+                return match.group(0)
+            index = len(self.md.mermaid_sources)
+            self.md.mermaid_sources.append(match.group("code"))
+            return f"\n\n{STX}mermaid:{index}{ETX}\n\n"
+
+        text = FencedBlockPreprocessor.FENCED_BLOCK_RE.sub(_replace, "\n".join(lines))
+        return text.split("\n")
+
+
+class DocumentTreeprocessor(Treeprocessor):
+    """Heading classes, title capture and figure wrapping in a single pass."""
+
+    def run(self, root: etree.Element) -> None:
+        children = []
+        after_title = False
+        for el in root:
+            marker = _MARKER_RE.match(el.text or "") if el.tag == "p" else None
+
+            if el.tag == "h1" and self.md.title is None:
+                el.set("class", "doc-title")
+                self.md.title = self._text(el)
+                children.append(el)
+                after_title = True
+                continue
+
+            if el.tag == "h2" and after_title:
+                el.set("class", "doc-subtitle")
+            elif marker is not None and len(el) == 0:
+                el = self._figure(children, int(marker.group(1)), el.tail)
+            children.append(el)
+            after_title = False
+
+        root[:] = children
+
+    def _figure(
+        self, children: list[etree.Element], index: int, tail: str | None
+    ) -> etree.Element:
+        """Build the figure for diagram *index*, adopting a preceding lead."""
+        figure = etree.Element("div", {"class": "mermaid-figure"})
+        figure.text = "\n"
+        placeholder = mermaid_placeholder(index) + "\n"
+        if children and children[-1].tag in _FIGURE_LEAD_TAGS:
+            lead = children.pop()
+            lead.tail = "\n" + placeholder
+            figure.append(lead)
+        else:
+            figure.text += placeholder
+        figure.tail = tail
+        return figure
+
+    def _text(self, el: etree.Element) -> str:
+        """Plain text of *el*, with Markdown escapes undone, HTML-escaped."""
+        if render_inner_html is None:
+            text = stashedHTML2text("".join(el.itertext()), self.md)
+            if "unescape" in self.md.treeprocessors:
+                text = self.md.treeprocessors["unescape"].unescape(text)
+        else:
+            # The same text the toc extension names a heading by.
+            text = html.unescape(strip_tags(render_inner_html(el, self.md)))
+        return html.escape(text, quote=False)
+
+
+class ImprovingExtension(Extension):
+    """Register the Mermaid fence preprocessor and document treeprocessor."""
+
+    def extendMarkdown(self, md) -> None:
+        md.registerExtension(self)
+        self.md = md
+        self.reset()
+        # After whitespace normalisation (30), before fenced_code (25).
+        md.preprocessors.register(MermaidFencePreprocessor(md), "improving_mermaid", 27)
+        # After inline processing (20) and toc ids (5), before unescape (0).
+        md.treeprocessors.register(DocumentTreeprocessor(md), "improving_document", 4)
+
+    def reset(self) -> None:
+        self.md.mermaid_sources = []
+        self.md.title = None
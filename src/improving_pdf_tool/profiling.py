@@ -0,0 +1,135 @@
+"""Per-stage timing of conversions.
+
+Wrap any conversion (sync or async) in ``profile()`` to find out where its
+time goes::
+
+    with profile() as prof:
+        markdown_to_pdf("doc.md", "doc.pdf", session=session)
+    print(json.dumps(prof.to_dict(), indent=2))
+
+The pipeline reports its stages into the active profile:
+
+- ``browser_launch`` / ``mermaid_pages`` -- session warm-up, when it happens;
+- ``read`` -- reading the input file;
+- ``build_cache`` -- looking up the finished PDF, with ``hit``, when the
+  session has a build cache (on a hit, nothing else runs but ``write``);
+- ``markdown`` -- Markdown to HTML, including the document conventions;
+- ``mermaid`` -- diagram pre-rendering, with per-diagram browser times
+  and the bytes saved by SVG optimisation;
+- ``assemble`` -- embedding diagrams and filling the template;
+- ``serve`` -- answering one intercepted request (image downsampling
+  included), per request;
+- ``load`` -- navigation until fonts and images are ready;
+- ``pdf`` -- ``page.pdf()``;
+- ``merge`` -- joining the shards' PDFs, for sharded renders (``load``
+  and ``pdf`` then repeat per shard);
+- ``write`` -- writing the PDF file.
+
+Outside of ``profile()`` the instrumentation does nothing. A profile can
+also stream stages to a callback as they finish, and record a Chromium
+performance trace of the load and print phases.
+"""
+
+import contextvars
+import time
+from collections.abc import Callable
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+
+
+@dataclass
+class Stage:
+    """One timed step of a conversion."""
+
+    name: str
+    seconds: float
+    detail: dict = field(default_factory=dict)
+
+
+class RenderProfile:
+    """Stages recorded while the profile is active, in completion order.
+
+    Args:
+        on_stage: Called with each Stage as soon as it is recorded.
+        trace_path: When set, a Chromium trace (viewable in chrome://tracing
+            or the DevTools Performance panel) of the load and print phases
+            is written here.
+    """
+
+    def __init__(
+        self,
+        on_stage: Callable[[Stage], None] | None = None,
+        trace_path: str | None = None,
+    ) -> None:
+        self.stages: list[Stage] = []
+        self.on_stage = on_stage
+        self.trace_path = trace_path
+        self.total_seconds: float | None = None
+        self._started = time.perf_counter()
+
+    def add(self, name: str, seconds: float, **detail) -> None:
+        """Record a stage that took *seconds*."""
+        stage = Stage(name, seconds, detail)
+        self.stages.append(stage)
+        if self.on_stage is not None:
+            self.on_stage(stage)
+
+    def totals(self) -> dict[str, float]:
+        """Seconds per stage name, summed over repeated stages."""
+        totals: dict[str, float] = {}
+        for stage in self.stages:
+            totals[stage.name] = totals.get(stage.name, 0.0) + stage.seconds
+        return totals
+
+    def to_dict(self) -> dict:
+        """JSON-ready form: overall time, per-name totals and every stage."""
+        return {
+            "total_seconds": self.total_seconds,
+            "stage_totals": {name: round(s, 6) for name, s in self.totals().items()},
+            "stages": [
+                {**asdict(stage), "seconds": round(stage.seconds, 6)}
+                for stage in self.stages
+            ],
+            "trace": self.trace_path,
+        }
+
+
+_active: contextvars.ContextVar[RenderProfile | None] = contextvars.ContextVar(
+    "improving_pdf_profile", default=None
+)
+
+
+def current_profile() -> RenderProfile | None:
+    """The profile active in this context, if any."""
+    return _active.get()
+
+
+@contextmanager
+def profile(
+    on_stage: Callable[[Stage], None] | None = None, trace_path: str | None = None
+):
+    """Activate a new RenderProfile for the duration of the block."""
+    prof = RenderProfile(on_stage, trace_path)
+    token = _active.set(prof)
+    try:
+        yield prof
+    finally:
+        prof.total_seconds = round(time.perf_counter() - prof._started, 6)
+        _active.reset(token)
+
+
+@contextmanager
+def stage(name: str, **detail):
+    """Time the block as stage *name* of the active profile, if any.
+
+    Yields the stage's detail dict, so the block can add to it.
+    """
+    prof = _active.get()
+    if prof is None:
+        yield detail
+        return
+    start = time.perf_counter()
+    try:
+        yield detail
+    finally:
+        prof.add(name, time.perf_counter() - start, **detail)
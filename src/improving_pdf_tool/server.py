@@ -0,0 +1,345 @@
+"""Local render server: a warm browser pool behind a small HTTP API.
+
+``improving-pdf serve`` starts a ThreadingHTTPServer on localhost.
+Requests are put on a bounded queue and rendered by a fixed set of worker
+threads, each owning one RenderSession (one warm Chromium). A full queue is
+answered with 503 straight away rather than piling up, a request waiting
+longer than its timeout gets 504, and each worker restarts its browser
+after a number of renders to keep memory growth in check.
+
+Endpoints:
+
+- ``POST /render`` -- body is Markdown (default) or HTML (``?format=html``
+  or ``Content-Type: text/html``); responds with ``application/pdf``.
+- ``GET /metrics`` -- JSON counters: queue depth, renders in flight,
+  completed/failed/rejected/timed-out totals and latency percentiles.
+- ``GET /healthz`` -- ``ok`` while every render worker is running, 503
+  once one has stopped.
+"""
+
+import json
+import queue
+import sys
+import threading
+import time
+import urllib.parse
+from collections import deque
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from improving_pdf_tool.generator import (
+    RenderSession,
+    html_to_pdf_bytes,
+    markdown_to_pdf_bytes,
+)
+
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+
+# Request bodies larger than this are refused with 413.
+MAX_BODY_BYTES = 16 * 1024 * 1024
+
+# Number of recent renders the latency percentiles are computed over.
+_LATENCY_WINDOW = 1000
+
+
+class _Job:
+    """One queued render and the slot its result is delivered in."""
+
+    def __init__(self, source: str, kind: str) -> None:
+        self.source = source
+        self.kind = kind
+        self.enqueued = time.perf_counter()
+        self.done = threading.Event()
+        self.abandoned = False
+        self.pdf: bytes | None = None
+        self.error: str | None = None
+
+
+class _Metrics:
+    """Thread-safe counters reported by GET /metrics."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.recycled = 0
+        self._wait: deque[float] = deque(maxlen=_LATENCY_WINDOW)
+        self._render: deque[float] = deque(maxlen=_LATENCY_WINDOW)
+
+    def count(self, name: str, delta: int = 1) -> None:
+        with self._lock:
+            setattr(self, name, getattr(self, name) + delta)
+
+    def record(self, wait: float, render: float, ok: bool) -> None:
+        with self._lock:
+            self._wait.append(wait)
+            self._render.append(render)
+            if ok:
+                self.completed += 1
+            else:
+                self.failed += 1
+
+    def snapshot(self, queue_depth: int) -> dict:
+        with self._lock:
+            return {
+                "queue_depth": queue_depth,
+                "in_flight": self.in_flight,
+                "completed": self.completed,
+                "failed": self.failed,
+                "rejected": self.rejected,
+                "timed_out": self.timed_out,
+                "browsers_recycled": self.recycled,
+                "queue_wait_seconds": _percentiles(self._wait),
+                "render_seconds": _percentiles(self._render),
+            }
+
+
+def _percentiles(samples: deque[float]) -> dict:
+    """p50/p95/max of *samples*, rounded to milliseconds."""
+    if not samples:
+        return {"p50": None, "p95": None, "max": None}
+    ordered = sorted(samples)
+
+    def _at(q: float) -> float:
+        return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))], 3)
+
+    return {"p50": _at(0.5), "p95": _at(0.95), "max": _at(1.0)}
+
+
+class RenderServer(ThreadingHTTPServer):
+    """HTTP server owning the job queue and the render worker threads.
+
+    Args:
+        address: (host, port) to bind; keep the host on loopback, as the
+            server has no authentication.
+        workers: Number of worker threads, i.e. concurrent browsers.
+        queue_size: Requests allowed to wait for a worker before new ones
+            are rejected with 503.
+        timeout: Seconds a request may wait and render before getting 504.
+        recycle_after: Renders after which a worker restarts its browser.
+        base_dir: Directory relative image references are served from, or
+            None to serve none. Files outside it are never served.
+        session_options: Keyword arguments for each worker's RenderSession.
+    """
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        address: tuple[str, int] = (DEFAULT_HOST, DEFAULT_PORT),
+        workers: int = 2,
+        queue_size: int = 16,
+        timeout: float = 60.0,
+        recycle_after: int = 100,
+        base_dir: str | None = None,
+        session_options: dict | None = None,
+    ) -> None:
+        # Clients may only reach files under the configured base directory.
+        self.session_options = {"asset_root": base_dir, **(session_options or {})}
+        # Sessions are built before binding, so bad options (a missing
+        # optional dependency, say) fail here instead of in every worker.
+        sessions = [RenderSession(**self.session_options) for _ in range(max(1, workers))]
+        super().__init__(address, _Handler)
+        self.jobs: "queue.Queue[_Job | None]" = queue.Queue(maxsize=max(1, queue_size))
+        self.timeout = timeout
+        self.recycle_after = max(1, recycle_after)
+        self.base_dir = base_dir
+        self.metrics = _Metrics()
+        self._workers = [
+            threading.Thread(
+                target=self._work, args=(session,), name=f"render-{n}", daemon=True
+            )
+            for n, session in enumerate(sessions)
+        ]
+        for thread in self._workers:
+            thread.start()
+
+    def submit(self, job: _Job) -> bool:
+        """Queue *job*; False (and nothing queued) if the queue is full."""
+        try:
+            self.jobs.put_nowait(job)
+        except queue.Full:
+            self.metrics.count("rejected")
+            return False
+        return True
+
+    def stopped_workers(self) -> int:
+        """Number of worker threads that are no longer running."""
+        return sum(not thread.is_alive() for thread in self._workers)
+
+    def _work(self, session: RenderSession) -> None:
+        """Worker thread: run _render_jobs, logging why it stopped if it did."""
+        try:
+            self._render_jobs(session)
+        except Exception as exc:
+            name = threading.current_thread().name
+            print(f"{name} stopped: {type(exc).__name__}: {exc}", file=sys.stderr)
+
+    def _render_jobs(self, session: RenderSession) -> None:
+        """Render queued jobs with *session* until the None sentinel."""
+        with session:
+            renders = 0
+            while (job := self.jobs.get()) is not None:
+                if job.abandoned:
+                    continue
+                started = time.perf_counter()
+                self.metrics.count("in_flight")
+                try:
+                    if job.kind == "html":
+                        job.pdf = html_to_pdf_bytes(
+                            job.source, base_dir=self.base_dir, session=session
+                        )
+                    else:
+                        job.pdf = markdown_to_pdf_bytes(
+                            job.source, base_dir=self.base_dir, session=session
+                        )
+                except Exception as exc:
+                    job.error = f"{type(exc).__name__}: {exc}"
+                finally:
+                    self.metrics.count("in_flight", -1)
+                self.metrics.record(
+                    started - job.enqueued,
+                    time.perf_counter() - started,
+                    job.error is None,
+                )
+                job.done.set()
+
+                # Only now, with the client answered, close the browser if
+                # needed; the session relaunches it on next use. If even
+                # closing fails, the worker stops and /healthz says so.
+                renders += 1
+                if job.error is not None:
+                    # The browser may be what failed; start the next job afresh.
+                    session.close()
+                    renders = 0
+                elif renders >= self.recycle_after:
+                    session.close()
+                    self.metrics.count("recycled")
+                    renders = 0
+
+    def server_close(self) -> None:
+        """Stop the workers (after the jobs already queued) and the socket."""
+        # One sentinel per worker. A full queue drains as long as some worker
+        # is alive; once none is, nothing would take a sentinel, so stop.
+        sentinels = len(self._workers)
+        while sentinels and self.stopped_workers() < len(self._workers):
+            try:
+                self.jobs.put(None, timeout=0.1)
+            except queue.Full:
+                continue
+            sentinels -= 1
+        for thread in self._workers:
+            thread.join()
+        super().server_close()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server: RenderServer
+
+    def do_GET(self) -> None:
+        path = urllib.parse.urlsplit(self.path).path
+        if path == "/metrics":
+            body = json.dumps(self.server.metrics.snapshot(self.server.jobs.qsize()))
+            self._reply(HTTPStatus.OK, body.encode("utf-8"), "application/json")
+        elif path == "/healthz":
+            stopped = self.server.stopped_workers()
+            if stopped:
+                total = len(self.server._workers)
+                message = f"{stopped} of {total} render workers have stopped"
+                self._error(HTTPStatus.SERVICE_UNAVAILABLE, message)
+            else:
+                self._reply(HTTPStatus.OK, b"ok\n", "text/plain")
+        else:
+            self._error(HTTPStatus.NOT_FOUND, "Not found")
+
+    def do_POST(self) -> None:
+        url = urllib.parse.urlsplit(self.path)
+        if url.path != "/render":
+            self._error(HTTPStatus.NOT_FOUND, "Not found")
+            return
+
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+        except ValueError:
+            length = -1
+        if length < 0:
+            self._error(HTTPStatus.BAD_REQUEST, "Invalid Content-Length")
+            return
+        if length > MAX_BODY_BYTES:
+            self._error(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, "Request body too large")
+            return
+        try:
+            source = self.rfile.read(length).decode("utf-8")
+        except UnicodeDecodeError:
+            self._error(HTTPStatus.BAD_REQUEST, "Request body must be UTF-8")
+            return
+
+        job = _Job(source, self._kind(url.query))
+        if not self.server.submit(job):
+            self._error(HTTPStatus.SERVICE_UNAVAILABLE, "Render queue full", retry=True)
+            return
+        if not job.done.wait(self.server.timeout):
+            # A render already under way cannot be interrupted; it finishes
+            # and its result is dropped. A queued one is skipped.
+            job.abandoned = True
+            self.server.metrics.count("timed_out")
+            self._error(HTTPStatus.GATEWAY_TIMEOUT, "Render timed out")
+            return
+        if job.error is not None:
+            self._error(HTTPStatus.UNPROCESSABLE_ENTITY, job.error)
+            return
+        self._reply(HTTPStatus.OK, job.pdf, "application/pdf")
+
+    def _kind(self, query: str) -> str:
+        """'html' or 'markdown', from ?format= or else the Content-Type."""
+        fmt = urllib.parse.parse_qs(query).get("format", [""])[0].lower()
+        if fmt in ("html", "htm"):
+            return "html"
+        if fmt:
+            return "markdown"
+        content_type = self.headers.get("Content-Type", "")
+        return "html" if content_type.startswith("text/html") else "markdown"
+
+    def _reply(self, status: HTTPStatus, body: bytes, content_type: str) -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _error(self, status: HTTPStatus, message: str, retry: bool = False) -> None:
+        body = json.dumps({"error": message}).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        if retry:
+            self.send_header("Retry-After", "1")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args) -> None:
+        print(f"{self.address_string()} - {format % args}", file=sys.stderr)
+
+
+def serve(
+    host: str = DEFAULT_HOST, port: int = DEFAULT_PORT, **options
+) -> None:
+    """Run a RenderServer until interrupted.
+
+    Args:
+        host: Interface to bind; loopback by default.
+        port: TCP port to listen on (0 picks a free one).
+        **options: Further RenderServer keyword arguments.
+    """
+    with RenderServer((host, port), **options) as server:
+        bound_host, bound_port = server.server_address[:2]
+        print(f"Serving on http://{bound_host}:{bound_port} (Ctrl+C to stop)", flush=True)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
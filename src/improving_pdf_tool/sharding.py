@@ -0,0 +1,347 @@
+"""Sharded rendering: print a long document in pieces and merge the PDFs.
+
+The template starts every top-level <h2> on a new page, so a document can
+be cut before any of them without changing its pagination. Each shard is
+wrapped in the full template (so the repeating header and footer are
+unchanged), printed on its own page, and the per-shard PDFs are merged
+back into one. Every shard page lives in its own browser context, so a
+renderer process only ever holds one shard's DOM.
+
+Merging keeps the document outline, re-nesting each shard's bookmarks as
+they would have been in one print, and the tagged structure: the shards'
+structure trees are joined under one StructTreeRoot, with their parent
+tree keys renumbered. Links between sections in different shards do not
+survive, as each shard was printed as a separate page.
+
+Requires pypdf (``pip install improving-pdf-tool[sharding]``).
+"""
+
+import io
+import re
+from html.parser import HTMLParser
+
+
+# Elements that never have an end tag.
+_VOID_TAGS = {
+    "area", "base", "br", "col", "embed", "hr", "img", "input",
+    "link", "meta", "source", "track", "wbr",
+}
+
+_H1_RE = re.compile(r"<h1[\s>]", re.IGNORECASE)
+_NEWLINE_RE = re.compile("\n")
+
+
+class _SectionSplitter(HTMLParser):
+    """Find the offsets of top-level section starts in document content.
+
+    A section starts at a top-level <h2> (other than the subtitle), or at a
+    diagram figure that adopted such an <h2> as its lead.
+    """
+
+    def __init__(self) -> None:
+        super().__init__(convert_charrefs=False)
+        self.starts: list[tuple[int, int]] = []
+        self._depth = 0
+        self._figure: tuple[int, int] | None = None
+
+    def handle_starttag(self, tag: str, attrs: list) -> None:
+        classes = (dict(attrs).get("class") or "").split()
+        if self._depth == 0:
+            self._figure = None
+            if tag == "h2" and "doc-subtitle" not in classes:
+                self.starts.append(self.getpos())
+            elif tag == "div" and "mermaid-figure" in classes:
+                self._figure = self.getpos()
+        elif self._depth == 1 and self._figure is not None:
+            if tag == "h2" and "doc-subtitle" not in classes:
+                self.starts.append(self._figure)
+            self._figure = None
+        if tag not in _VOID_TAGS:
+            self._depth += 1
+
+    def handle_startendtag(self, tag: str, attrs: list) -> None:
+        if tag not in _VOID_TAGS:
+            self._depth += 1
+        self.handle_endtag(tag)
+
+    def handle_endtag(self, tag: str) -> None:
+        if tag not in _VOID_TAGS:
+            self._depth = max(0, self._depth - 1)
+
+
+def split_sections(html: str) -> list[str]:
+    """Cut document content before each top-level section heading.
+
+    The first piece holds everything before the first section (title,
+    subtitle, introduction), unless that is only whitespace. A document
+    without sections comes back as a single piece.
+    """
+    splitter = _SectionSplitter()
+    splitter.feed(html)
+    splitter.close()
+
+    # getpos() counts lines by "\n" alone; str.splitlines() would also
+    # break at \x0c, \x85, \u2028 and others.
+    line_starts = [0] + [match.end() for match in _NEWLINE_RE.finditer(html)]
+    offsets = [line_starts[line - 1] + col for line, col in splitter.starts]
+
+    pieces = []
+    previous = 0
+    for offset in offsets + [len(html)]:
+        if html[previous:offset].strip():
+            pieces.append(html[previous:offset])
+        elif pieces:
+            pieces[-1] += html[previous:offset]
+        previous = offset
+    return pieces or [html]
+
+
+def section_groups(sizes: list[int], shards: int) -> list[tuple[int, int]]:
+    """Split sections of the given *sizes* into at most *shards* runs of similar size.
+
+    Returns:
+        (start, end) index ranges of consecutive sections, one per shard.
+    """
+    shards = max(1, min(shards, len(sizes)))
+    total = sum(sizes)
+    bounds = [0]
+    done = 0
+    for n, size in enumerate(sizes):
+        # Start the next shard once this one reached its share of the total,
+        # keeping enough sections back to give every remaining shard one.
+        groups = len(bounds)
+        boundary = total * groups / shards
+        remaining = len(sizes) - n
+        if (
+            n > bounds[-1]
+            and groups < shards
+            and (done >= boundary or remaining <= shards - groups)
+        ):
+            bounds.append(n)
+        done += size
+    bounds.append(len(sizes))
+    return list(zip(bounds, bounds[1:]))
+
+
+def group_sections(sections: list[str], shards: int) -> list[str]:
+    """Join consecutive *sections* into at most *shards* shards of similar size."""
+    return [
+        "".join(sections[start:end])
+        for start, end in section_groups([len(s) for s in sections], shards)
+    ]
+
+
+def require_pypdf() -> None:
+    """Raise ImportError if the 'pypdf' package is not installed."""
+    try:
+        import pypdf  # noqa: F401
+    except ImportError:
+        raise ImportError(
+            "The 'pypdf' package is required for sharded rendering. "
+            "Install it with: pip install pypdf"
+        )
+
+
+def merge_pdfs(pdfs: list[bytes], shard_html: list[str] | None = None) -> bytes:
+    """Concatenate per-shard PDFs, keeping outline and tagged structure.
+
+    Args:
+        pdfs: The shards' PDFs, in document order.
+        shard_html: The shards' content, used to tell which outline entries
+            come from <h1> headings. Without it, bookmarks are concatenated
+            as they are.
+
+    Returns:
+        The merged PDF.
+
+    Raises ImportError if the 'pypdf' package is not installed.
+    """
+    require_pypdf()
+    from pypdf import PdfReader, PdfWriter
+
+    readers = [PdfReader(io.BytesIO(pdf)) for pdf in pdfs]
+    writer = PdfWriter()
+    offsets = []
+    for reader in readers:
+        offsets.append(len(writer.pages))
+        writer.append(reader, import_outline=False)
+
+    h1_counts = (
+        [len(_H1_RE.findall(html)) for html in shard_html]
+        if shard_html is not None
+        else [None] * len(readers)
+    )
+    _merge_outlines(writer, readers, offsets, h1_counts)
+    _merge_structure(writer, readers, offsets)
+
+    first = readers[0]
+    if first.metadata:
+        writer.add_metadata(
+            {key: value for key, value in first.metadata.items() if isinstance(value, str)}
+        )
+    for key in ("/Lang", "/PageMode", "/ViewerPreferences"):
+        if key in first.root_object:
+            writer.root_object[_name(key)] = first.root_object[key].clone(writer)
+
+    out = io.BytesIO()
+    writer.write(out)
+    return out.getvalue()
+
+
+def _name(key: str):
+    from pypdf.generic import NameObject
+
+    return NameObject(key)
+
+
+def _merge_outlines(writer, readers, offsets, h1_counts) -> None:
+    """Rebuild the shards' outlines in *writer*, nested as in one print.
+
+    A print of the whole document nests every heading under the <h1>
+    before it. A shard printed alone puts its leading headings at the top
+    level instead, so those are moved under the last <h1> bookmark of the
+    preceding shards. Top-level entries from the first <h1> of a shard on
+    are <h1> bookmarks themselves, since everything else nests under them.
+    """
+    last_h1 = None
+    for reader, offset, h1_count in zip(readers, offsets, h1_counts):
+        outline = reader.outline
+        top_level = [item for item in outline if not isinstance(item, list)]
+        if h1_count is None:
+            leading = 0
+        else:
+            leading = max(0, len(top_level) - h1_count)
+        created = _copy_outline(writer, reader, outline, offset, last_h1, leading)
+        if h1_count and created:
+            last_h1 = created[-1]
+
+
+def _copy_outline(writer, reader, items, offset, adopt_parent, adopt_count, parent=None):
+    """Copy outline *items*; the first *adopt_count* go under *adopt_parent*.
+
+    Returns the top-level items created directly under *parent*.
+    """
+    from pypdf.generic import Fit
+
+    created = []
+    last = None
+    index = 0
+    for item in items:
+        if isinstance(item, list):
+            _copy_outline(writer, reader, item, offset, None, 0, parent=last)
+            continue
+        target_parent = parent
+        if parent is None and index < adopt_count and adopt_parent is not None:
+            target_parent = adopt_parent
+        index += 1
+        page = reader.get_destination_page_number(item)
+        if item.typ == "/XYZ":
+            fit = Fit.xyz(_number(item.left), _number(item.top), _number(item.zoom))
+        else:
+            fit = Fit.fit()
+        last = writer.add_outline_item(
+            item.title, page + offset, parent=target_parent, fit=fit
+        )
+        if target_parent is parent:
+            created.append(last)
+    return created
+
+
+def _number(value):
+    """A destination coordinate as a float, or None for a null."""
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _parent_tree_entries(node) -> list:
+    """Flatten a number tree (/Nums, possibly under /Kids) to [key, value, ...]."""
+    node = node.get_object()
+    entries = list(node.get("/Nums", []))
+    for kid in node.get("/Kids", []):
+        entries.extend(_parent_tree_entries(kid))
+    return entries
+
+
+def _merge_structure(writer, readers, offsets) -> None:
+    """Join the shards' structure trees under one StructTreeRoot.
+
+    Cloning a shard's tree after append() maps its page and annotation
+    references onto the copies already in *writer*, so marked content stays
+    attached; its parent tree keys (and the pages' and annotations'
+    references to them) are shifted past those of the shards before it.
+    If any shard is untagged, the output is left untagged.
+    """
+    from pypdf.generic import (
+        ArrayObject,
+        BooleanObject,
+        DictionaryObject,
+        NumberObject,
+    )
+
+    roots = [reader.root_object.get("/StructTreeRoot") for reader in readers]
+    if not roots or any(root is None for root in roots):
+        return
+
+    merged = DictionaryObject({_name("/Type"): _name("/StructTreeRoot")})
+    merged_ref = writer._add_object(merged)
+    kids = ArrayObject()
+    nums = ArrayObject()
+    role_map = DictionaryObject()
+    class_map = DictionaryObject()
+    next_key = 0
+    page_ends = offsets[1:] + [len(writer.pages)]
+
+    for reader, root, start, end in zip(readers, roots, offsets, page_ends):
+        cloned = root.get_object().clone(writer)
+        base = next_key
+
+        entries = (
+            _parent_tree_entries(cloned["/ParentTree"]) if "/ParentTree" in cloned else []
+        )
+        for key, value in zip(entries[0::2], entries[1::2]):
+            nums.append(NumberObject(int(key) + base))
+            nums.append(value)
+            next_key = max(next_key, int(key) + base + 1)
+        next_key = max(next_key, base + int(cloned.get("/ParentTreeNextKey", 0)))
+
+        # append() drops /StructParents from the copied pages; restore it.
+        for page, original in zip(writer.pages[start:end], reader.pages):
+            if "/StructParents" in original:
+                page[_name("/StructParents")] = NumberObject(
+                    int(original["/StructParents"]) + base
+                )
+            for annot in page.get("/Annots", []):
+                annot = annot.get_object()
+                if "/StructParent" in annot:
+                    annot[_name("/StructParent")] = NumberObject(
+                        int(annot["/StructParent"]) + base
+                    )
+
+        top = cloned.get("/K")
+        top = top.get_object() if top is not None else ArrayObject()
+        for kid in top if isinstance(top, ArrayObject) else [cloned.raw_get("/K")]:
+            element = kid.get_object()
+            if isinstance(element, DictionaryObject):
+                element[_name("/P")] = merged_ref
+            kids.append(kid)
+
+        for key, target in (("/RoleMap", role_map), ("/ClassMap", class_map)):
+            for name, value in cloned.get(key, {}).items():
+                target.setdefault(_name(name), value)
+
+    merged[_name("/K")] = kids
+    merged[_name("/ParentTree")] = writer._add_object(
+        DictionaryObject({_name("/Nums"): nums})
+    )
+    merged[_name("/ParentTreeNextKey")] = NumberObject(next_key)
+    if role_map:
+        merged[_name("/RoleMap")] = role_map
+    if class_map:
+        merged[_name("/ClassMap")] = class_map
+
+    writer.root_object[_name("/StructTreeRoot")] = merged_ref
+    writer.root_object[_name("/MarkInfo")] = DictionaryObject(
+        {_name("/Marked"): BooleanObject(True)}
+    )
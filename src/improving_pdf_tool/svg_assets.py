@@ -0,0 +1,196 @@
+"""Size optimisation of the SVGs Mermaid renders, before they are embedded.
+
+Mermaid's output is verbose: coordinates carry up to 15 significant digits,
+every diagram defines all the arrow markers of its diagram type whether its
+edges use them or not, most elements get an id nothing refers to, and the
+generated stylesheet is indented. optimize_svg() trims all of that without
+changing what is drawn:
+
+- comments and the whitespace between tags are dropped, and the <style>
+  blocks are minified;
+- numbers in geometry attributes are rounded to DEFAULT_DECIMALS places
+  (a hundredth of a CSS pixel) -- except on <foreignObject>, whose exact
+  size decides where HTML labels wrap;
+- markers, gradients, filters, clip paths, masks, patterns and symbols
+  that nothing references are removed, along with then-empty <defs>;
+- ids on other elements that nothing references are removed, and so are
+  empty style attributes.
+
+The pass is regex-based and assumes Mermaid's well-formed output; it never
+touches text content.
+
+scope_ids() is separate: it gives every id of an SVG that is to be inlined
+a per-diagram prefix, since an inline SVG shares the document's id space.
+"""
+
+import re
+
+
+# Decimal places kept in geometry attributes.
+DEFAULT_DECIMALS = 2
+
+# Bumped whenever the optimisation below changes, so that cached SVGs made
+# by an older pass are not reused.
+OPTIMIZER_VERSION = "1"
+
+# Attributes whose numbers are coordinates or lengths in user units.
+_GEOMETRY_ATTRIBUTES = {
+    "d", "points", "transform", "viewBox",
+    "x", "y", "x1", "y1", "x2", "y2", "dx", "dy",
+    "cx", "cy", "r", "rx", "ry", "width", "height",
+    "refX", "refY", "markerWidth", "markerHeight",
+}
+
+# Elements that are never drawn unless referenced by id.
+_DEFINITION_TAGS = (
+    "marker", "linearGradient", "radialGradient", "filter",
+    "clipPath", "mask", "pattern", "symbol",
+)
+
+_COMMENT_RE = re.compile(r"<!--.*?-->", re.DOTALL)
+_BETWEEN_TAGS_RE = re.compile(r">\s*\n\s*<")
+_STYLE_RE = re.compile(r"(<style[^>]*>)(.*?)(</style>)", re.DOTALL)
+_CSS_COMMENT_RE = re.compile(r"/\*.*?\*/", re.DOTALL)
+_CSS_SPACE_RE = re.compile(r"\s*([{};,>])\s*")
+_START_TAG_RE = re.compile(r"<([A-Za-z][\w:-]*)(\s[^<>]*?)?(/?)>")
+_ATTRIBUTE_RE = re.compile(r'([\w:-]+)="([^"]*)"')
+_NUMBER_RE = re.compile(r"-?\d*\.\d+(?:[eE][-+]?\d+)?")
+_DEFINITION_RE = re.compile(
+    r"<(%s)\b[^>]*?\bid=\"([^\"]+)\"[^>]*?(?:/>|>.*?</\1>)" % "|".join(_DEFINITION_TAGS),
+    re.DOTALL,
+)
+_EMPTY_DEFS_RE = re.compile(r"<defs\s*(?:/>|>\s*</defs>)")
+_ID_RE = re.compile(r'\sid="([^"]+)"')
+_ARIA_REFERENCE_RE = re.compile(r'\saria-(?:labelledby|describedby)="([^"]*)"')
+_ARIA_LIST_RE = re.compile(r'(\saria-(?:labelledby|describedby)=")([^"]*)"')
+
+
+def _round_number(match: re.Match, decimals: int) -> str:
+    text = match.group(0)
+    if "e" in text or "E" in text:
+        return text
+    rounded = f"{float(text):.{decimals}f}"
+    if "." in rounded:
+        rounded = rounded.rstrip("0").rstrip(".")
+    if rounded == "-0":
+        return "0"
+    return rounded
+
+
+def _round_geometry(svg: str, decimals: int) -> str:
+    """Round the numbers in the geometry attributes of every start tag."""
+
+    def _tag(match: re.Match) -> str:
+        name, attributes, closing = match.group(1), match.group(2), match.group(3)
+        if not attributes or name == "foreignObject":
+            return match.group(0)
+
+        def _attribute(attr: re.Match) -> str:
+            if attr.group(1) not in _GEOMETRY_ATTRIBUTES:
+                return attr.group(0)
+            value = _NUMBER_RE.sub(lambda m: _round_number(m, decimals), attr.group(2))
+            return f'{attr.group(1)}="{value}"'
+
+        return f"<{name}{_ATTRIBUTE_RE.sub(_attribute, attributes)}{closing}>"
+
+    return _START_TAG_RE.sub(_tag, svg)
+
+
+def _minify_css(css: str) -> str:
+    css = _CSS_COMMENT_RE.sub("", css)
+    css = re.sub(r"\s+", " ", css)
+    css = _CSS_SPACE_RE.sub(r"\1", css)
+    css = re.sub(r":\s+", ":", css)
+    return css.replace(";}", "}").strip()
+
+
+def _is_referenced(svg: str, element_id: str) -> bool:
+    """Whether *svg* refers to *element_id*.
+
+    References are #element_id (in url(), href or a CSS selector) and the
+    id lists of aria-labelledby and aria-describedby.
+    """
+    if "#" + element_id in svg:
+        return True
+    return any(
+        element_id in match.group(1).split() for match in _ARIA_REFERENCE_RE.finditer(svg)
+    )
+
+
+def _strip_unused_definitions(svg: str) -> str:
+    # Removing a definition can orphan another one (a marker's gradient),
+    # so repeat until nothing changes.
+    while True:
+        stripped = _DEFINITION_RE.sub(
+            lambda m: m.group(0) if _is_referenced(svg, m.group(2)) else "", svg
+        )
+        if stripped == svg:
+            break
+        svg = stripped
+    return _EMPTY_DEFS_RE.sub("", svg)
+
+
+def _strip_unused_ids(svg: str) -> str:
+    """Remove ids nothing refers to, except the root's (the CSS scope)."""
+    root_end = svg.find(">") + 1
+    body = _ID_RE.sub(
+        lambda m: m.group(0) if _is_referenced(svg, m.group(1)) else "",
+        svg[root_end:],
+    )
+    return svg[:root_end] + body
+
+
+def scope_ids(svg: str, prefix: str) -> str:
+    """Prefix every id in *svg* that does not contain *prefix* already.
+
+    References to the renamed ids (#id in attributes such as url() and
+    href, and in <style> selectors, and the aria-labelledby/describedby
+    lists) are renamed with them; text content is left alone. Mermaid
+    builds most ids from the diagram id, but some diagram types use fixed
+    ids (the sequence diagram's "arrowhead" marker), which would otherwise
+    clash between inline diagrams.
+    """
+    foreign = {
+        element_id for element_id in _ID_RE.findall(svg) if prefix not in element_id
+    }
+    if not foreign:
+        return svg
+    names = "|".join(map(re.escape, sorted(foreign, key=len, reverse=True)))
+    definition_re = re.compile(f'(\\sid=")({names})(?=")')
+    reference_re = re.compile(f"(#)({names})(?![\\w.:-])")
+
+    def _rename(match: re.Match) -> str:
+        return f"{match.group(1)}{prefix}-{match.group(2)}"
+
+    def _aria(match: re.Match) -> str:
+        refs = [
+            f"{prefix}-{ref}" if ref in foreign else ref
+            for ref in match.group(2).split()
+        ]
+        return f'{match.group(1)}{" ".join(refs)}"'
+
+    def _tag(match: re.Match) -> str:
+        tag = definition_re.sub(_rename, match.group(0))
+        return _ARIA_LIST_RE.sub(_aria, reference_re.sub(_rename, tag))
+
+    svg = _START_TAG_RE.sub(_tag, svg)
+    return _STYLE_RE.sub(
+        lambda m: m.group(1) + reference_re.sub(_rename, m.group(2)) + m.group(3), svg
+    )
+
+
+def optimize_svg(svg: str, decimals: int = DEFAULT_DECIMALS) -> str:
+    """Return a smaller, equivalent version of a Mermaid *svg*.
+
+    Anything that is not an <svg> document (an error placeholder) is
+    returned unchanged.
+    """
+    if not svg.startswith("<svg"):
+        return svg
+    svg = _COMMENT_RE.sub("", svg)
+    svg = _BETWEEN_TAGS_RE.sub("><", svg)
+    svg = _STYLE_RE.sub(lambda m: m.group(1) + _minify_css(m.group(2)) + m.group(3), svg)
+    svg = _round_geometry(svg, decimals)
+    svg = _strip_unused_definitions(svg)
+    svg = svg.replace(' style=""', "")
+    return _strip_unused_ids(svg)
@@ -0,0 +1,104 @@
+"""Watch mode: regenerate a PDF whenever its source or images change.
+
+The watcher polls modification times (no extra dependencies) of the input
+file and the local files it references. One RenderSession lives for the
+whole watch, so Chromium and the Mermaid render pages stay warm and only
+diagrams whose source changed are rendered again; everything else comes
+from the session's SVG cache.
+"""
+
+import sys
+import time
+from pathlib import Path
+
+from improving_pdf_tool.build_cache import local_references
+from improving_pdf_tool.generator import RenderSession, convert_file
+
+_Snapshot = dict[Path, tuple[int, int] | None]
+
+
+def referenced_files(input_path: Path) -> list[Path]:
+    """Return *input_path* followed by the existing local files it references.
+
+    Remote URLs, data URIs and in-page anchors are skipped, as are paths
+    that do not resolve to a file.
+    """
+    try:
+        text = input_path.read_text(encoding="utf-8")
+    except (OSError, UnicodeDecodeError):
+        return [input_path]
+
+    files = [input_path]
+    for path in local_references(text, input_path.parent):
+        if path.is_file() and path not in files:
+            files.append(path)
+    return files
+
+
+def _snapshot(paths: list[Path]) -> _Snapshot:
+    """Map each path to its (mtime_ns, size), or None if it is missing."""
+    snapshot: _Snapshot = {}
+    for path in paths:
+        try:
+            st = path.stat()
+        except OSError:
+            snapshot[path] = None
+        else:
+            snapshot[path] = (st.st_mtime_ns, st.st_size)
+    return snapshot
+
+
+def _settle(input_path: Path, debounce: float) -> _Snapshot:
+    """Wait until the watched files stop changing for *debounce* seconds.
+
+    Editors often save in bursts (write, rename, touch); rendering only once
+    the files are quiet avoids converting a half-written document.
+    """
+    current = _snapshot(referenced_files(input_path))
+    while True:
+        time.sleep(debounce)
+        latest = _snapshot(referenced_files(input_path))
+        if latest == current:
+            return latest
+        current = latest
+
+
+def _render(input_path: Path, pdf_path: str, session: RenderSession) -> None:
+    """Convert once, reporting the outcome instead of raising."""
+    started = time.perf_counter()
+    try:
+        result = convert_file(str(input_path), pdf_path, session=session)
+    except Exception as exc:
+        print(f"Error: {exc}", file=sys.stderr)
+        return
+    elapsed = time.perf_counter() - started
+    print(f"PDF generated: {result} ({elapsed:.2f}s)", flush=True)
+
+
+def watch(
+    input_path: str,
+    pdf_path: str,
+    session: RenderSession,
+    interval: float = 0.25,
+    debounce: float = 0.2,
+) -> None:
+    """Convert *input_path* now and again after every change, until interrupted.
+
+    Args:
+        input_path: The Markdown or HTML file to watch.
+        pdf_path: Where to write the PDF on every build.
+        session: The warm session used for every build.
+        interval: Seconds between polls for changes.
+        debounce: Seconds the files must stay unchanged before a rebuild.
+    """
+    source = Path(input_path).resolve()
+    snapshot = _snapshot(referenced_files(source))
+    _render(source, pdf_path, session)
+    print(f"Watching {source} (Ctrl+C to stop)", flush=True)
+
+    while True:
+        time.sleep(interval)
+        if _snapshot(referenced_files(source)) == snapshot:
+            continue
+        snapshot = _settle(source, debounce)
+        _render(source, pdf_path, session)
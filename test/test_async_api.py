@@ -0,0 +1,82 @@
+"""Tests for async_api.AsyncRenderSession's render page pool."""
+
+import asyncio
+
+from improving_pdf_tool.async_api import AsyncRenderSession
+
+
+class _FakePage:
+    async def close(self):
+        pass
+
+
+def _session(concurrency: int, load_delay: float = 0.0):
+    """A session whose render pages are fakes that take *load_delay* to load."""
+    session = AsyncRenderSession(use_cache=False, mermaid_concurrency=concurrency)
+    session._browser = object()
+    session.loads = 0
+
+    async def _new_mermaid_page():
+        session.loads += 1
+        await asyncio.sleep(load_delay)
+        return _FakePage()
+
+    session._new_mermaid_page = _new_mermaid_page
+    return session
+
+
+def test_page_load_does_not_hold_up_the_browser():
+    async def main():
+        session = _session(1, load_delay=0.5)
+        page = await session.acquire_mermaid_page()
+        replacing = asyncio.create_task(session.replace_mermaid_page(page))
+        await asyncio.sleep(0)
+        # A print asking for the browser meanwhile gets it at once.
+        browser = await asyncio.wait_for(session.browser(), 0.1)
+        assert browser is session._browser
+        assert not replacing.done()
+        session.release_mermaid_page(await replacing)
+
+    asyncio.run(main())
+
+
+def test_pool_never_outgrows_its_cap():
+    async def main():
+        session = _session(2, load_delay=0.01)
+        held = []
+
+        async def render():
+            page = await session.acquire_mermaid_page()
+            held.append(page)
+            assert len(held) <= 2
+            await asyncio.sleep(0.01)
+            held.remove(page)
+            session.release_mermaid_page(page)
+
+        await asyncio.gather(session.mermaid_pages(2), *(render() for _ in range(8)))
+        assert session.loads == 2
+        assert len(session._mermaid_pages) == 2
+        assert len(session._idle_pages) == 2
+
+    asyncio.run(main())
+
+
+def test_failed_load_gives_back_its_reservation():
+    async def main():
+        session = _session(1)
+        working = session._new_mermaid_page
+
+        async def broken():
+            raise RuntimeError("crashed")
+
+        session._new_mermaid_page = broken
+        try:
+            await session.acquire_mermaid_page()
+        except RuntimeError:
+            pass
+        session._new_mermaid_page = working
+        page = await asyncio.wait_for(session.acquire_mermaid_page(), 0.1)
+        session.release_mermaid_page(page)
+        assert session._reserved_pages == 1
+
+    asyncio.run(main())
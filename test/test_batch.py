@@ -0,0 +1,87 @@
+"""Tests for batch.py: input expansion, output paths and per-file errors."""
+
+import os
+
+from improving_pdf_tool import generator
+from improving_pdf_tool.batch import _output_paths, collect_inputs, convert_batch
+
+
+def _touch(path):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text("# doc", encoding="utf-8")
+
+
+def test_collect_inputs_mirrors_directory_layout(tmp_path):
+    _touch(tmp_path / "docs" / "a" / "index.md")
+    _touch(tmp_path / "docs" / "b" / "index.md")
+    _touch(tmp_path / "docs" / "notes.png")
+    docs = str(tmp_path / "docs")
+
+    assert collect_inputs([docs]) == [
+        (os.path.join(docs, "a", "index.md"), os.path.join("a", "index.pdf")),
+        (os.path.join(docs, "b", "index.md"), os.path.join("b", "index.pdf")),
+    ]
+
+
+def test_collect_inputs_names_glob_matches_from_fixed_prefix(tmp_path):
+    _touch(tmp_path / "reports" / "2025" / "q1.md")
+    _touch(tmp_path / "reports" / "q4.md")
+    pattern = str(tmp_path / "reports" / "**" / "*.md")
+
+    assert collect_inputs([pattern]) == [
+        (str(tmp_path / "reports" / "2025" / "q1.md"), os.path.join("2025", "q1.pdf")),
+        (str(tmp_path / "reports" / "q4.md"), "q4.pdf"),
+    ]
+
+
+def test_collect_inputs_filters_glob_matches_by_extension(tmp_path):
+    _touch(tmp_path / "docs" / "a.md")
+    _touch(tmp_path / "docs" / "b.html")
+    _touch(tmp_path / "docs" / "logo.png")
+    _touch(tmp_path / "docs" / "notes.md.bak")
+
+    assert collect_inputs([str(tmp_path / "docs" / "*")]) == [
+        (str(tmp_path / "docs" / "a.md"), "a.pdf"),
+        (str(tmp_path / "docs" / "b.html"), "b.pdf"),
+    ]
+
+
+def test_collect_inputs_keeps_loose_and_missing_files(tmp_path):
+    _touch(tmp_path / "extra.html")
+    extra = str(tmp_path / "extra.html")
+    missing = str(tmp_path / "missing.md")
+
+    assert collect_inputs([extra, missing, extra]) == [
+        (extra, "extra.pdf"),
+        (missing, "missing.pdf"),
+    ]
+
+
+def test_output_paths_records_collisions_per_file(tmp_path):
+    out = str(tmp_path / "out")
+    pairs, collisions = _output_paths(
+        ["a/index.md", ("b/index.md", "b/index.pdf"), "c/index.html"], out
+    )
+
+    assert pairs == [
+        ("a/index.md", os.path.join(out, "index.pdf")),
+        ("b/index.md", os.path.join(out, "b", "index.pdf")),
+        ("c/index.html", os.path.join(out, "index.pdf")),
+    ]
+    assert list(collisions) == [2]
+    assert "a/index.md" in collisions[2]
+
+
+def test_convert_batch_reports_session_errors_per_file(tmp_path, monkeypatch):
+    def _no_pillow(dpi, cache_root):
+        raise ImportError("The 'Pillow' package is required")
+
+    monkeypatch.setattr(generator, "open_image_processor", _no_pillow)
+    inputs = [str(tmp_path / "a.md"), str(tmp_path / "b.md")]
+
+    results = convert_batch(
+        inputs, str(tmp_path / "out"), workers=2, session_options={"image_dpi": 150}
+    )
+
+    assert [r.input_path for r in results] == inputs
+    assert all(r.error == "ImportError: The 'Pillow' package is required" for r in results)
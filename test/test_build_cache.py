@@ -0,0 +1,83 @@
+"""Tests for build_cache.py: reference scanning and build keys."""
+
+from contextlib import nullcontext
+
+import pytest
+
+from improving_pdf_tool import generator
+from improving_pdf_tool.build_cache import build_key, local_references
+
+
+def test_local_references_finds_inline_and_reference_style_images(tmp_path):
+    text = (
+        "![inline](img/a.png) ![spaced](<img/b c.png> \"title\")\n"
+        "![logo][l] and ![collapsed][]\n\n"
+        "[l]: img/logo.png \"Logo\"\n"
+        "  [collapsed]: <img/d.png>\n"
+    )
+    assert local_references(text, tmp_path) == [
+        tmp_path / "img" / "a.png",
+        tmp_path / "img" / "b c.png",
+        tmp_path / "img" / "logo.png",
+        tmp_path / "img" / "d.png",
+    ]
+
+
+def test_local_references_finds_html_and_file_urls(tmp_path):
+    target = tmp_path / "abs.png"
+    text = f'<img src="pic.png"> <link href="style.css"> <img src="{target.as_uri()}">'
+    assert local_references(text, tmp_path) == [
+        tmp_path / "pic.png",
+        tmp_path / "style.css",
+        target,
+    ]
+
+
+def test_local_references_skips_remote_data_anchors_and_footnotes(tmp_path):
+    text = (
+        "![r](https://example.com/a.png) ![d](data:image/png;base64,AAAA)\n"
+        '<a href="#top">top</a>\n'
+        "Note[^1].\n\n"
+        "[^1]: a footnote\n"
+        "[site]: https://example.com/\n"
+    )
+    assert local_references(text, tmp_path) == []
+
+
+def test_build_key_changes_with_reference_style_image(tmp_path):
+    (tmp_path / "logo.png").write_bytes(b"one")
+    text = "![logo][l]\n\n[l]: logo.png\n"
+    before = build_key("markdown", text, str(tmp_path), "env", {})
+
+    (tmp_path / "logo.png").write_bytes(b"two")
+
+    assert build_key("markdown", text, str(tmp_path), "env", {}) != before
+
+
+def test_build_key_tracks_missing_files_and_options(tmp_path):
+    text = "![a](a.png)"
+    missing = build_key("markdown", text, str(tmp_path), "env", {})
+    (tmp_path / "a.png").write_bytes(b"png")
+    present = build_key("markdown", text, str(tmp_path), "env", {})
+    assert missing != present
+    assert build_key("markdown", text, str(tmp_path), "env", {"shards": 2}) != present
+    assert build_key("markdown", text, str(tmp_path), "env2", {}) != present
+    assert build_key("markdown", text, str(tmp_path), "env", {}) == present
+
+
+@pytest.mark.parametrize("ready, stored", [(True, True), (False, False)])
+def test_html_build_is_stored_only_when_page_was_ready(
+    tmp_path, monkeypatch, ready, stored
+):
+    page = tmp_path / "page.html"
+    page.write_text('<div class="mermaid">graph TD; A-->B</div>', encoding="utf-8")
+    monkeypatch.setattr(generator, "_print_page", lambda page, url: (b"pdf", ready))
+    session = generator.RenderSession(cache_dir=str(tmp_path / "cache"), build_cache=True)
+    session.new_page = lambda: nullcontext(None)
+
+    assert generator._html_file_to_pdf_bytes(page, session) == b"pdf"
+
+    key = generator._build_key(
+        session, "html", page.read_text(encoding="utf-8"), str(tmp_path)
+    )
+    assert (session.build_cache.get(key) is not None) == stored
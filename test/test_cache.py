@@ -0,0 +1,114 @@
+"""Tests for cache.py: keys, the on-disk LRU cache and its in-memory stand-in."""
+
+import os
+
+from improving_pdf_tool import cache as cache_module
+from improving_pdf_tool.cache import DiskCache, MemoryCache, cache_key
+
+
+def _key(n: int) -> str:
+    return cache_key(str(n))
+
+
+def _age(cache: DiskCache, key: str, mtime: float) -> None:
+    os.utime(cache._path(key), (mtime, mtime))
+
+
+def test_cache_key_is_length_prefixed():
+    assert cache_key("ab", "c") != cache_key("a", "bc")
+    assert cache_key("a", b"b") == cache_key(b"a", "b")
+
+
+def test_disk_cache_round_trip_and_miss(tmp_path):
+    cache = DiskCache(str(tmp_path))
+    cache.put(_key(1), b"one")
+    assert cache.get(_key(1)) == b"one"
+    assert cache.get(_key(2)) is None
+
+
+def test_disk_cache_evicts_least_recently_used_down_to_budget(tmp_path):
+    cache = DiskCache(str(tmp_path), max_bytes=100)
+    for n, mtime in zip(range(4), (300, 100, 400, 200)):
+        cache.put(_key(n), b"x" * 10)
+        _age(cache, _key(n), mtime)
+
+    cache.max_bytes = 25
+    cache._evict()
+
+    assert cache._size == 20
+    assert [cache.get(_key(n)) is not None for n in range(4)] == [True, False, True, False]
+
+
+def test_disk_cache_put_evicts_past_budget(tmp_path):
+    cache = DiskCache(str(tmp_path), max_bytes=25)
+    for n in range(3):
+        cache.put(_key(n), b"x" * 10)
+        _age(cache, _key(n), 100 + n)
+
+    assert cache.get(_key(0)) is None
+    assert cache.get(_key(1)) == cache.get(_key(2)) == b"x" * 10
+
+
+def test_disk_cache_read_refreshes_recency(tmp_path):
+    cache = DiskCache(str(tmp_path), max_bytes=20)
+    cache.put(_key(0), b"x" * 10)
+    cache.put(_key(1), b"x" * 10)
+    _age(cache, _key(0), 100)
+    _age(cache, _key(1), 200)
+
+    assert cache.get(_key(0)) is not None  # now the most recent
+    cache.put(_key(2), b"x" * 10)
+
+    assert cache.get(_key(1)) is None
+    assert cache.get(_key(0)) is not None
+
+
+def test_disk_cache_overwrite_does_not_grow_size(tmp_path, monkeypatch):
+    cache = DiskCache(str(tmp_path), max_bytes=100)
+    cache.put(_key(0), b"x" * 10)
+    scans = []
+    monkeypatch.setattr(cache, "_entries", lambda: scans.append(1) or [])
+
+    for _ in range(20):
+        cache.put(_key(0), b"y" * 10)
+
+    assert cache._size == 10
+    assert scans == []
+    assert cache.get(_key(0)) == b"y" * 10
+
+
+def test_disk_cache_removes_temp_file_when_write_fails(tmp_path, monkeypatch):
+    cache = DiskCache(str(tmp_path))
+
+    def _fail(src, dst):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(cache_module.os, "replace", _fail)
+    cache.put(_key(0), b"data")
+
+    assert [p for p in tmp_path.rglob("*") if p.is_file()] == []
+    assert cache.get(_key(0)) is None
+
+
+def test_disk_cache_clear(tmp_path):
+    cache = DiskCache(str(tmp_path / "entries"))
+    cache.put(_key(0), b"data")
+    cache.clear()
+
+    assert cache.get(_key(0)) is None
+    assert not (tmp_path / "entries").exists()
+    cache.put(_key(1), b"again")
+    assert cache.get(_key(1)) == b"again"
+
+
+def test_memory_cache_lru():
+    cache = MemoryCache(max_bytes=20)
+    cache.put("a", b"x" * 10)
+    cache.put("b", b"x" * 10)
+    cache.get("a")
+    cache.put("c", b"x" * 10)
+
+    assert cache.get("b") is None
+    assert cache.get("a") is not None and cache.get("c") is not None
+    cache.put("c", b"y" * 5)
+    assert cache._size == 15
@@ -0,0 +1,19 @@
+"""Tests for cli.py: status output around -o -."""
+
+import argparse
+
+from improving_pdf_tool.cli import _clear_cache
+
+
+def test_clear_cache_reports_on_stdout(tmp_path, capsys):
+    _clear_cache(argparse.Namespace(cache_dir=str(tmp_path), output="out.pdf"))
+    out, err = capsys.readouterr()
+    assert out == f"Cache cleared: {tmp_path}\n"
+    assert err == ""
+
+
+def test_clear_cache_keeps_stdout_clean_for_the_pdf(tmp_path, capsys):
+    _clear_cache(argparse.Namespace(cache_dir=str(tmp_path), output="-"))
+    out, err = capsys.readouterr()
+    assert out == ""
+    assert err == f"Cache cleared: {tmp_path}\n"
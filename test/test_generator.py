@@ -0,0 +1,98 @@
+"""Tests for generator.py's document assembly with embedded diagrams."""
+
+import re
+from collections import Counter
+from pathlib import Path
+
+import pytest
+
+from improving_pdf_tool.generator import (
+    DOCUMENT_ORIGIN,
+    _assemble_document,
+    _assemble_shards,
+    _clean_svg_for_embedding,
+    _document_response,
+)
+from improving_pdf_tool.markdown_ext import mermaid_placeholder
+
+FIXTURES = Path(__file__).parent
+
+
+def _svgs() -> list[str]:
+    """The flowchart and sequence fixtures, cleaned as after rendering."""
+    return [
+        _clean_svg_for_embedding((FIXTURES / name).read_text(encoding="utf-8").strip())
+        for name in ("mermaid-flowchart.svg", "mermaid-sequence.svg")
+    ]
+
+
+def _content() -> str:
+    return (
+        '<h1 class="doc-title">T</h1>\n'
+        f'<div class="mermaid-figure">\n{mermaid_placeholder(0)}\n</div>\n'
+        '<h2>Next</h2>\n'
+        f'<div class="mermaid-figure">\n{mermaid_placeholder(1)}\n</div>\n'
+    )
+
+
+def _print_part(document: str) -> str:
+    return document[document.index('<table class="print-table">'):]
+
+
+def _references(html: str) -> set[str]:
+    return set(re.findall(r'(?:url\(|href=")#([\w-]+)', html))
+
+
+def test_inline_svgs_get_unique_ids_per_copy():
+    document = _assemble_document(_content(), "T", _svgs(), inline_svgs=True)
+
+    ids = Counter(re.findall(r'\sid="([^"]+)"', document))
+    assert ids and max(ids.values()) == 1
+    assert {"mermaid-pre-0", "mermaid-print-0", "mermaid-pre-1", "mermaid-print-1"} <= set(ids)
+
+    # Every marker the printed diagrams use is defined in the printed copy.
+    printed = _print_part(document)
+    references = _references(printed)
+    assert "mermaid-print-0_flowchart-v2-pointEnd" in references
+    assert "mermaid-print-1-arrowhead" in references
+    assert references <= set(re.findall(r'\sid="([^"]+)"', printed))
+
+
+def test_base64_document_repeats_the_same_content():
+    document = _assemble_document(_content(), "T", _svgs())
+
+    assert document.count('class="mermaid-img"') == 4
+    assert "mermaid-print" not in document
+    assert not re.search(r"<svg\b", document)
+
+
+def test_brand_images_are_served_not_embedded():
+    document = _assemble_document("<p>x</p>", "T", [])
+
+    assert "data:image/png" not in document
+    assert "{{" not in document
+    urls = set(re.findall(re.escape(DOCUMENT_ORIGIN) + r"_brand/[\w.-]+", document))
+    assert len(urls) == 4
+    for url in urls:
+        response = _document_response(url, document, None)
+        assert response["content_type"] == "image/png"
+        assert response["body"].startswith(b"\x89PNG")
+
+
+def test_template_resets_paragraph_styles_in_inline_labels():
+    document = _assemble_document(_content(), "T", _svgs(), inline_svgs=True)
+    assert ".content .mermaid-img p {" in document
+
+
+def test_inline_shards_keep_ids_unique_per_copy():
+    pytest.importorskip("pypdf")
+
+    contents, documents = _assemble_shards(_content(), "T", _svgs(), 2, inline_svgs=True)
+
+    assert len(documents) == 2
+    for content, document in zip(contents, documents):
+        ids = Counter(re.findall(r'\sid="([^"]+)"', document))
+        assert max(ids.values()) == 1
+        printed = _print_part(document)
+        assert _references(printed) <= set(re.findall(r'\sid="([^"]+)"', printed))
+        assert content in document
@@ -0,0 +1,126 @@
+"""Tests for image_assets.ImageProcessor's downsampling, caching and memo."""
+
+import hashlib
+import io
+import random
+
+import pytest
+
+pytest.importorskip("PIL")
+
+from PIL import Image
+
+from improving_pdf_tool.cache import DiskCache, cache_key
+from improving_pdf_tool.image_assets import (
+    _PIPELINE_VERSION,
+    PRINTABLE_WIDTH_IN,
+    ImageProcessor,
+)
+
+DPI = 50  # printable width: round(7.67 * 50) = 384px
+
+
+def _noise_png(path, width, height, seed=0):
+    """A PNG of random pixels, which shrinks when downscaled."""
+    pixels = random.Random(seed).randbytes(width * height * 3)
+    Image.frombytes("RGB", (width, height), pixels).save(path, "PNG")
+    return path
+
+
+def _checker_png(path, width, height):
+    """A 3px checkerboard: tiny as a PNG, but not once resampled."""
+    img = Image.new("L", (width, height))
+    img.putdata(
+        [255 * ((x // 3 + y // 3) % 2) for y in range(height) for x in range(width)]
+    )
+    img.save(path, "PNG")
+    return path
+
+
+def _entry(processor, path):
+    digest = hashlib.sha256(path.read_bytes()).hexdigest()
+    return cache_key(_PIPELINE_VERSION, digest, str(processor.max_width))
+
+
+def test_downscales_to_the_printable_width(tmp_path):
+    processor = ImageProcessor(DPI)
+    path = _noise_png(tmp_path / "wide.png", 1000, 500)
+
+    data, content_type = processor.process(path)
+
+    assert content_type == "image/png"
+    assert processor.max_width == round(PRINTABLE_WIDTH_IN * DPI)
+    with Image.open(io.BytesIO(data)) as img:
+        assert img.size == (processor.max_width, 192)
+    assert len(data) < path.stat().st_size
+
+
+def test_small_image_is_left_alone_and_cached_as_such(tmp_path):
+    cache = DiskCache(str(tmp_path / "cache"))
+    processor = ImageProcessor(DPI, cache)
+    path = _noise_png(tmp_path / "small.png", 300, 100)
+
+    assert processor.process(path) is None
+    assert cache.get(_entry(processor, path)) == b""
+
+
+def test_cached_empty_entry_means_keep_the_original(tmp_path):
+    cache = DiskCache(str(tmp_path / "cache"))
+    processor = ImageProcessor(DPI, cache)
+    path = _noise_png(tmp_path / "wide.png", 1000, 500)
+    cache.put(_entry(processor, path), b"")
+
+    assert processor.process(path) is None
+
+
+def test_disk_cache_is_reused_across_processors(tmp_path):
+    cache = DiskCache(str(tmp_path / "cache"))
+    path = _noise_png(tmp_path / "wide.png", 1000, 500)
+    first = ImageProcessor(DPI, cache).process(path)
+
+    second = ImageProcessor(DPI, cache)
+    second._downscale = None  # a cache hit must not resample again
+    assert second.process(path) == first
+
+
+def test_never_serves_a_bigger_file(tmp_path):
+    processor = ImageProcessor(DPI)
+    path = _checker_png(tmp_path / "checker.png", 1000, 500)
+
+    assert processor.process(path) is None
+
+
+def test_unsupported_or_missing_files_are_served_unchanged(tmp_path):
+    processor = ImageProcessor(DPI)
+    (tmp_path / "broken.png").write_bytes(b"not a png")
+    (tmp_path / "diagram.svg").write_text("<svg/>", encoding="utf-8")
+
+    assert processor.process(tmp_path / "broken.png") is None
+    assert processor.process(tmp_path / "diagram.svg") is None
+    assert processor.process(tmp_path / "missing.png") is None
+
+
+def test_memo_keeps_one_result_per_path_within_memo_bytes(tmp_path):
+    processor = ImageProcessor(DPI, memo_bytes=1)
+    first = _noise_png(tmp_path / "a.png", 1000, 500, seed=1)
+    second = _noise_png(tmp_path / "b.png", 1000, 500, seed=2)
+
+    result = processor.process(first)
+    assert processor.process(first) is result
+    kept = processor.process(second)
+
+    assert list(processor._seen) == [second]
+    assert processor._seen_bytes == len(kept[0])
+
+
+def test_memo_replaces_the_entry_for_a_changed_file(tmp_path):
+    processor = ImageProcessor(DPI)
+    path = _noise_png(tmp_path / "a.png", 1000, 500, seed=1)
+    before = processor.process(path)
+    _noise_png(path, 1200, 500, seed=2)
+
+    after = processor.process(path)
+
+    assert after != before
+    assert list(processor._seen) == [path]
+    assert processor._seen_bytes == len(after[0])
@@ -0,0 +1,87 @@
+"""Tests for markdown_ext.py: document conventions and diagram placeholders."""
+
+from improving_pdf_tool.generator import _embed_mermaid_svgs, _markdown_to_html
+from improving_pdf_tool.markdown_ext import MERMAID_PLACEHOLDER_RE, mermaid_placeholder
+
+
+def test_title_and_subtitle_classes():
+    html, sources, title = _markdown_to_html("# The *Title*\n\n## Sub\n\n## Next\n")
+    assert html == (
+        '<h1 class="doc-title" id="the-title">The <em>Title</em></h1>\n'
+        '<h2 class="doc-subtitle" id="sub">Sub</h2>\n'
+        '<h2 id="next">Next</h2>'
+    )
+    assert sources == []
+    assert title == "The Title"
+
+
+def test_only_first_h1_is_the_title():
+    html, _, title = _markdown_to_html("Intro\n\n# A & B\n\n# Second\n\n## Not sub\n")
+    assert title == "A &amp; B"
+    assert '<h1 id="second">Second</h1>' in html
+    assert '<h2 id="not-sub">Not sub</h2>' in html
+
+
+def test_diagram_is_wrapped_with_its_lead():
+    text = "# T\n\nintro\n\n## Flow\n\n```mermaid\ngraph TD; A-->B\n```\n\nafter\n"
+    html, sources, _ = _markdown_to_html(text)
+    assert sources == ["graph TD; A-->B\n"]
+    assert html == (
+        '<h1 class="doc-title" id="t">T</h1>\n'
+        "<p>intro</p>\n"
+        '<div class="mermaid-figure">\n'
+        '<h2 id="flow">Flow</h2>\n'
+        f"{mermaid_placeholder(0)}\n"
+        "</div>\n"
+        "<p>after</p>"
+    )
+
+
+def test_diagram_without_lead_and_after_a_list():
+    html, sources, _ = _markdown_to_html(
+        "- item\n\n```mermaid\nA\n```\n\n```mermaid\nB\n```\n"
+    )
+    assert sources == ["A\n", "B\n"]
+    assert html.endswith(
+        f'<div class="mermaid-figure">\n{mermaid_placeholder(0)}\n</div>\n'
+        f'<div class="mermaid-figure">\n{mermaid_placeholder(1)}\n</div>'
+    )
+
+
+def test_mermaid_fence_inside_code_block_is_left_alone():
+    html, sources, _ = _markdown_to_html("````\n```mermaid\nA\n```\n````\n")
+    assert sources == []
+    assert "```mermaid" in html
+
+
+def test_placeholder_lookalikes_in_text_are_not_replaced():
+    text = (
+        "Mention `{{MERMAID_PLACEHOLDER_0}}` and `{{MERMAID_PLACEHOLDER_3}}`, "
+        "and \x02mermaid-figure:0\x03.\n\n```mermaid\nA\n```\n"
+    )
+    html, sources, _ = _markdown_to_html(text)
+    assert sources == ["A\n"]
+    assert len(MERMAID_PLACEHOLDER_RE.findall(html)) == 1
+
+    embedded = _embed_mermaid_svgs(html, ["<svg>a</svg>"])
+    assert "<code>{{MERMAID_PLACEHOLDER_0}}</code>" in embedded
+    assert "<code>{{MERMAID_PLACEHOLDER_3}}</code>" in embedded
+    assert embedded.count('class="mermaid-img"') == 1
+
+
+def test_embed_leaves_out_of_range_placeholders():
+    html = f"<p>a</p>{mermaid_placeholder(0)}{mermaid_placeholder(5)}"
+    assert _embed_mermaid_svgs(html, ["<div>error</div>"]) == (
+        f"<p>a</p><div>error</div>{mermaid_placeholder(5)}"
+    )
+
+
+def test_converter_is_reset_between_documents():
+    _markdown_to_html("# First\n\n```mermaid\nA\n```\n")
+    html, sources, title = _markdown_to_html("No title\n")
+    assert (html, sources, title) == ("<p>No title</p>", [], None)
+
+
+def test_title_text_drops_inline_html_and_keeps_escapes():
+    _, _, title = _markdown_to_html("# <em>Q3</em> \\*plan\\* &amp; `x<y`\n")
+    assert title == "Q3 *plan* &amp; x&lt;y"
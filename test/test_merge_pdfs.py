@@ -0,0 +1,148 @@
+"""Tests for sharding.merge_pdfs; skipped without the optional pypdf."""
+
+import io
+
+import pytest
+
+pytest.importorskip("pypdf")
+
+from pypdf import PdfReader, PdfWriter  # noqa: E402
+from pypdf.generic import (  # noqa: E402
+    ArrayObject,
+    BooleanObject,
+    DictionaryObject,
+    NameObject,
+    NumberObject,
+    TextStringObject,
+)
+
+from improving_pdf_tool.sharding import merge_pdfs  # noqa: E402
+
+
+def _shard_pdf(pages: int, outline: list, tagged: bool = True) -> bytes:
+    """A small PDF with *pages* blank pages and a tagged structure tree.
+
+    *outline* holds (title, page, children) entries; each page gets one
+    structure element, referenced from the parent tree under the page's
+    /StructParents key.
+    """
+    writer = PdfWriter()
+    for _ in range(pages):
+        writer.add_blank_page(width=612, height=792)
+
+    def _add(items, parent=None):
+        for title, page, children in items:
+            item = writer.add_outline_item(title, page, parent=parent)
+            _add(children, item)
+
+    _add(outline)
+
+    if tagged:
+        root = DictionaryObject({NameObject("/Type"): NameObject("/StructTreeRoot")})
+        root_ref = writer._add_object(root)
+        kids = ArrayObject()
+        nums = ArrayObject()
+        for n, page in enumerate(writer.pages):
+            element = DictionaryObject({
+                NameObject("/Type"): NameObject("/StructElem"),
+                NameObject("/S"): NameObject("/P"),
+                NameObject("/P"): root_ref,
+                NameObject("/Pg"): page.indirect_reference,
+                NameObject("/K"): NumberObject(0),
+            })
+            element_ref = writer._add_object(element)
+            kids.append(element_ref)
+            nums.append(NumberObject(n))
+            nums.append(ArrayObject([element_ref]))
+            page[NameObject("/StructParents")] = NumberObject(n)
+        root[NameObject("/K")] = kids
+        root[NameObject("/ParentTree")] = writer._add_object(
+            DictionaryObject({NameObject("/Nums"): nums})
+        )
+        root[NameObject("/ParentTreeNextKey")] = NumberObject(pages)
+        root[NameObject("/RoleMap")] = DictionaryObject(
+            {NameObject("/Note"): NameObject("/P")}
+        )
+        writer.root_object[NameObject("/StructTreeRoot")] = root_ref
+        writer.root_object[NameObject("/MarkInfo")] = DictionaryObject(
+            {NameObject("/Marked"): BooleanObject(True)}
+        )
+    writer.root_object[NameObject("/Lang")] = TextStringObject("en")
+
+    out = io.BytesIO()
+    writer.write(out)
+    return out.getvalue()
+
+
+def _outline_tree(reader, items=None) -> list:
+    """The outline as nested (title, page number, children) tuples."""
+    items = reader.outline if items is None else items
+    tree = []
+    for item in items:
+        if isinstance(item, list):
+            title, page, _ = tree[-1]
+            tree[-1] = (title, page, _outline_tree(reader, item))
+        else:
+            tree.append((item.title, reader.get_destination_page_number(item), []))
+    return tree
+
+
+def test_merge_pdfs_concatenates_pages_and_keeps_catalog_entries():
+    merged = PdfReader(io.BytesIO(merge_pdfs([_shard_pdf(2, []), _shard_pdf(3, [])])))
+    assert len(merged.pages) == 5
+    assert merged.root_object["/Lang"] == "en"
+
+
+def test_merge_pdfs_nests_leading_bookmarks_under_previous_h1():
+    first = _shard_pdf(2, [("Title", 0, [("Intro", 1, [])])])
+    second = _shard_pdf(2, [("Part A", 0, [("A.1", 1, [])])])
+    third = _shard_pdf(1, [("Appendix", 0, [])])
+    shard_html = ["<h1>Title</h1><h2>Intro</h2>", "<h2>Part A</h2>", "<h1>Appendix</h1>"]
+
+    merged = PdfReader(io.BytesIO(merge_pdfs([first, second, third], shard_html)))
+
+    assert _outline_tree(merged) == [
+        ("Title", 0, [
+            ("Intro", 1, []),
+            ("Part A", 2, [("A.1", 3, [])]),
+        ]),
+        ("Appendix", 4, []),
+    ]
+
+
+def test_merge_pdfs_without_shard_html_concatenates_outlines():
+    first = _shard_pdf(1, [("Title", 0, [])])
+    second = _shard_pdf(1, [("Part A", 0, [])])
+
+    merged = PdfReader(io.BytesIO(merge_pdfs([first, second])))
+
+    assert _outline_tree(merged) == [("Title", 0, []), ("Part A", 1, [])]
+
+
+def test_merge_pdfs_joins_structure_trees():
+    merged = PdfReader(io.BytesIO(merge_pdfs([_shard_pdf(2, []), _shard_pdf(3, [])])))
+
+    root = merged.root_object["/StructTreeRoot"].get_object()
+    kids = [kid.get_object() for kid in root["/K"]]
+    assert len(kids) == 5
+    assert all(kid["/P"].get_object() is root for kid in kids)
+    assert root["/ParentTreeNextKey"] == 5
+    assert root["/RoleMap"]["/Note"] == "/P"
+    assert merged.root_object["/MarkInfo"]["/Marked"] == True  # noqa: E712
+
+    nums = root["/ParentTree"].get_object()["/Nums"]
+    parents = dict(zip(nums[0::2], nums[1::2]))
+    assert sorted(parents) == [0, 1, 2, 3, 4]
+    for n, page in enumerate(merged.pages):
+        key = page["/StructParents"]
+        assert key == n
+        [element] = parents[key]
+        # Each page's marked content still points at that page's element.
+        assert element.get_object()["/Pg"].get_object() == page.get_object()
+
+
+def test_merge_pdfs_leaves_output_untagged_if_a_shard_is_untagged():
+    merged = PdfReader(
+        io.BytesIO(merge_pdfs([_shard_pdf(1, []), _shard_pdf(1, [], tagged=False)]))
+    )
+    assert "/StructTreeRoot" not in merged.root_object
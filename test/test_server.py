@@ -0,0 +1,201 @@
+"""Tests for server.py's queueing, timeouts, recycling and metrics.
+
+RenderSession and the render functions are replaced by fakes, so no
+browser is needed: a Markdown body of "block" renders only once the
+test opens the gate, and "fail" raises.
+"""
+
+import http.client
+import json
+import threading
+import time
+from contextlib import contextmanager
+
+import pytest
+
+from improving_pdf_tool import server as server_module
+from improving_pdf_tool.server import RenderServer, _Job
+
+
+class _FakeSession:
+    def __init__(self, **options):
+        self.options = options
+        self.closes = 0
+        self.close_error: Exception | None = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.closes += 1
+        if self.close_error is not None:
+            raise self.close_error
+
+
+@pytest.fixture
+def fakes(monkeypatch):
+    """Install the fakes; yields (sessions created, render gate)."""
+    sessions = []
+    gate = threading.Event()
+
+    def _session(**options):
+        session = _FakeSession(**options)
+        sessions.append(session)
+        return session
+
+    def _render(source, base_dir=None, session=None):
+        if source == "fail":
+            raise ValueError("bad document")
+        if source == "block":
+            gate.wait(5)
+        return b"%PDF-" + source.encode()
+
+    monkeypatch.setattr(server_module, "RenderSession", _session)
+    monkeypatch.setattr(server_module, "markdown_to_pdf_bytes", _render)
+    yield sessions, gate
+    gate.set()
+
+
+@contextmanager
+def _running(**options):
+    server = RenderServer(("127.0.0.1", 0), **options)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield server
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def _request(server, method, path, body=None, headers=None):
+    """(status, headers, body) of one request to *server*."""
+    conn = http.client.HTTPConnection(*server.server_address[:2], timeout=10)
+    try:
+        conn.request(method, path, body=body, headers=headers or {})
+        response = conn.getresponse()
+        return response.status, dict(response.getheaders()), response.read()
+    finally:
+        conn.close()
+
+
+def _render(server, source):
+    return _request(server, "POST", "/render", source.encode())
+
+
+def _metrics(server):
+    return json.loads(_request(server, "GET", "/metrics")[2])
+
+
+def _until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "condition not met in time"
+        time.sleep(0.01)
+
+
+def _in_background(server, source):
+    results = []
+    thread = threading.Thread(target=lambda: results.append(_render(server, source)))
+    thread.start()
+    return thread, results
+
+
+def test_render_and_metrics_counters(fakes):
+    with _running(workers=1) as server:
+        assert _render(server, "a")[::2] == (200, b"%PDF-a")
+        assert _render(server, "b")[0] == 200
+        status, _, body = _render(server, "fail")
+        assert status == 422
+        assert json.loads(body) == {"error": "ValueError: bad document"}
+
+        metrics = _metrics(server)
+    assert metrics["completed"] == 2
+    assert metrics["failed"] == 1
+    assert metrics["in_flight"] == 0
+    assert metrics["queue_depth"] == 0
+    assert metrics["render_seconds"]["p50"] is not None
+
+
+def test_full_queue_is_rejected_with_503(fakes):
+    _, gate = fakes
+    with _running(workers=1, queue_size=1) as server:
+        running, first = _in_background(server, "block")
+        _until(lambda: server.metrics.in_flight == 1)
+        queued, second = _in_background(server, "block")
+        _until(lambda: server.jobs.qsize() == 1)
+
+        status, headers, _ = _render(server, "c")
+        assert status == 503
+        assert headers["Retry-After"] == "1"
+
+        gate.set()
+        running.join()
+        queued.join()
+        assert first[0][0] == second[0][0] == 200
+        assert _metrics(server)["rejected"] == 1
+
+
+def test_slow_render_gets_504(fakes):
+    _, gate = fakes
+    with _running(workers=1, timeout=0.2) as server:
+        assert _render(server, "block")[0] == 504
+        gate.set()
+        _until(lambda: server.metrics.completed == 1)
+        assert _metrics(server)["timed_out"] == 1
+
+
+def test_browser_is_recycled_after_n_renders(fakes):
+    sessions, _ = fakes
+    with _running(workers=1, recycle_after=2) as server:
+        for source in "abc":
+            assert _render(server, source)[0] == 200
+        (session,) = sessions
+        _until(lambda: server.metrics.completed == 3)
+        assert session.closes == 1
+        assert _metrics(server)["browsers_recycled"] == 1
+
+        # A failed render closes the browser too and restarts the count.
+        assert _render(server, "fail")[0] == 422
+        assert _render(server, "d")[0] == 200
+        _until(lambda: session.closes == 2)
+        assert _metrics(server)["browsers_recycled"] == 1
+
+
+def test_session_options_are_checked_before_binding(monkeypatch):
+    def _no_pillow(**options):
+        raise ImportError("The 'Pillow' package is required")
+
+    monkeypatch.setattr(server_module, "RenderSession", _no_pillow)
+    with pytest.raises(ImportError):
+        RenderServer(("127.0.0.1", 0), session_options={"image_dpi": 150})
+
+
+def test_healthz_reports_a_stopped_worker(fakes):
+    sessions, _ = fakes
+    with _running(workers=1, queue_size=1) as server:
+        assert _request(server, "GET", "/healthz")[::2] == (200, b"ok\n")
+
+        sessions[0].close_error = RuntimeError("browser gone")
+        # The client still gets its answer before the worker gives up.
+        assert _render(server, "fail")[0] == 422
+        _until(lambda: server.stopped_workers() == 1)
+        status, _, body = _request(server, "GET", "/healthz")
+        assert status == 503
+        assert json.loads(body) == {"error": "1 of 1 render workers have stopped"}
+
+        # A full queue with no worker left must not hang server_close.
+        assert server.submit(_Job("x", "markdown"))
+
+
+@pytest.mark.parametrize("length", ["-1", "abc"])
+def test_invalid_content_length_is_rejected(fakes, length):
+    with _running(workers=1) as server:
+        status, _, body = _request(
+            server, "POST", "/render", headers={"Content-Length": length}
+        )
+    assert status == 400
+    assert json.loads(body) == {"error": "Invalid Content-Length"}
@@ -0,0 +1,167 @@
+"""Tests for sharding.py and the sharded print: splitting, grouping, printing.
+
+merge_pdfs, which needs the optional pypdf, is tested in test_merge_pdfs.py.
+"""
+
+import pytest
+
+from improving_pdf_tool.sharding import group_sections, split_sections
+
+
+# -- split_sections ------------------------------------------------------------
+
+
+def test_split_sections_cuts_before_top_level_h2():
+    html = "<h1>Title</h1><p>intro</p>\n<h2>A</h2><p>a</p>\n<h2>B</h2><p>b</p>"
+    assert split_sections(html) == [
+        "<h1>Title</h1><p>intro</p>\n",
+        "<h2>A</h2><p>a</p>\n",
+        "<h2>B</h2><p>b</p>",
+    ]
+
+
+def test_split_sections_ignores_subtitle_and_nested_h2():
+    html = (
+        '<h1>Title</h1><h2 class="doc-subtitle">Sub</h2>'
+        "<div><h2>Nested</h2></div>\n<h2>A</h2><p>a</p>"
+    )
+    assert split_sections(html) == [
+        '<h1>Title</h1><h2 class="doc-subtitle">Sub</h2><div><h2>Nested</h2></div>\n',
+        "<h2>A</h2><p>a</p>",
+    ]
+
+
+def test_split_sections_keeps_lead_heading_with_its_diagram():
+    html = (
+        "<p>intro</p>\n"
+        '<div class="mermaid-figure"><h2>Flow</h2><img src="x"></div>\n'
+        "<h2>Next</h2>"
+    )
+    assert split_sections(html) == [
+        "<p>intro</p>\n",
+        '<div class="mermaid-figure"><h2>Flow</h2><img src="x"></div>\n',
+        "<h2>Next</h2>",
+    ]
+
+
+def test_split_sections_drops_whitespace_only_preamble():
+    assert split_sections("\n  <h2>A</h2>a<h2>B</h2>b") == ["<h2>A</h2>a", "<h2>B</h2>b"]
+
+
+def test_split_sections_without_sections_returns_whole_document():
+    assert split_sections("<p>only</p>") == ["<p>only</p>"]
+    assert split_sections("") == [""]
+
+
+@pytest.mark.parametrize("separator", ["\x0b", "\x0c", "\x1c", "\x85", "\u2028", "\u2029"])
+def test_split_sections_counts_lines_by_newline_only(separator):
+    html = f"<p>intro {separator} more</p>\n<h2>A</h2><p>a{separator}</p>\n<h2>B</h2>"
+    assert split_sections(html) == [
+        f"<p>intro {separator} more</p>\n",
+        f"<h2>A</h2><p>a{separator}</p>\n",
+        "<h2>B</h2>",
+    ]
+
+
+def test_split_sections_handles_crlf():
+    html = "<p>intro</p>\r\n<h2>A</h2>\r\n<h2>B</h2>"
+    assert split_sections(html) == ["<p>intro</p>\r\n", "<h2>A</h2>\r\n", "<h2>B</h2>"]
+
+
+# -- group_sections ------------------------------------------------------------
+
+
+def test_group_sections_balances_by_size():
+    sections = ["a" * 10, "b" * 10, "c" * 10, "d" * 10]
+    assert group_sections(sections, 2) == ["a" * 10 + "b" * 10, "c" * 10 + "d" * 10]
+
+
+def test_group_sections_gives_every_shard_a_section():
+    sections = ["a" * 100, "b", "c"]
+    assert group_sections(sections, 3) == ["a" * 100, "b", "c"]
+
+
+def test_group_sections_caps_shards_at_section_count():
+    assert group_sections(["a", "b"], 5) == ["a", "b"]
+    assert group_sections(["a", "b", "c"], 1) == ["abc"]
+
+
+def test_group_sections_preserves_order_and_content():
+    sections = [str(n) * (n + 1) for n in range(9)]
+    groups = group_sections(sections, 4)
+    assert len(groups) == 4
+    assert "".join(groups) == "".join(sections)
+
+
+# -- _print_shards -------------------------------------------------------------
+
+
+class _FakeBrowser:
+    """Records how many contexts are open at once."""
+
+    def __init__(self):
+        self.open = 0
+        self.peak = 0
+        self.printed = []
+
+    def new_context(self):
+        self.open += 1
+        self.peak = max(self.peak, self.open)
+        return _FakeContext(self)
+
+
+class _FakeContext:
+    def __init__(self, browser):
+        self.browser = browser
+        self.pages = []
+
+    def new_page(self):
+        self.pages.append(_FakePage(self))
+        return self.pages[-1]
+
+    def close(self):
+        self.browser.open -= 1
+
+
+class _FakePage:
+    def __init__(self, context):
+        self.context = context
+        self.handler = None
+
+    def route(self, url, handler):
+        self.handler = handler
+
+    def emulate_media(self, media):
+        pass
+
+    def goto(self, url, wait_until):
+        pass
+
+    def wait_for_load_state(self, state):
+        pass
+
+    def evaluate(self, script):
+        pass
+
+    def wait_for_function(self, script, timeout):
+        pass
+
+    def pdf(self, **options):
+        n = len(self.context.browser.printed)
+        self.context.browser.printed.append(n)
+        return f"pdf{n}".encode()
+
+
+@pytest.mark.parametrize("limit, peak", [(1, 1), (2, 2), (10, 5)])
+def test_print_shards_bounds_open_contexts(limit, peak):
+    from improving_pdf_tool.generator import RenderSession, _print_shards
+
+    browser = _FakeBrowser()
+    session = RenderSession(use_cache=False, shard_concurrency=limit)
+    session._browser = browser
+
+    pdfs = _print_shards([f"<p>{n}</p>" for n in range(5)], None, session)
+
+    assert pdfs == [b"pdf0", b"pdf1", b"pdf2", b"pdf3", b"pdf4"]
+    assert browser.peak == peak
+    assert browser.open == 0
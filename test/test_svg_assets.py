@@ -0,0 +1,148 @@
+"""Tests for svg_assets.py, on fixtures shaped like Mermaid 11 output."""
+
+import re
+from pathlib import Path
+
+from improving_pdf_tool.svg_assets import optimize_svg, scope_ids
+
+FIXTURES = Path(__file__).parent
+
+
+def _fixture(name: str) -> str:
+    return (FIXTURES / name).read_text(encoding="utf-8").strip()
+
+
+def _ids(svg: str) -> list[str]:
+    return re.findall(r'\sid="([^"]+)"', svg)
+
+
+def _foreign_objects(svg: str) -> list[str]:
+    return re.findall(r"<foreignObject\b.*?</foreignObject>", svg, re.DOTALL)
+
+
+# -- optimize_svg --------------------------------------------------------------
+
+
+def test_optimize_keeps_referenced_markers_and_ids():
+    svg = optimize_svg(_fixture("mermaid-flowchart.svg"))
+
+    assert _ids(svg) == [
+        "mermaid-pre-0",
+        "chart-title-mermaid-pre-0",
+        "mermaid-pre-0_flowchart-v2-pointEnd",
+    ]
+    assert 'marker-end="url(#mermaid-pre-0_flowchart-v2-pointEnd)"' in svg
+    assert 'aria-labelledby="chart-title-mermaid-pre-0"' in svg
+    assert "pointStart" not in svg and "circleEnd" not in svg and "crossEnd" not in svg
+    assert ' style=""' not in svg
+
+
+def test_optimize_strips_unused_sequence_definitions():
+    svg = optimize_svg(_fixture("mermaid-sequence.svg"))
+
+    assert _ids(svg) == ["mermaid-pre-1", "arrowhead"]
+    assert 'marker-end="url(#arrowhead)"' in svg
+    assert "#mermaid-pre-1 #arrowhead path{" in svg
+    # The computer symbol, crosshead and filled-head went, with their <defs>.
+    assert svg.count("<defs>") == 1
+    assert "<symbol" not in svg and "crosshead" not in svg and "filled-head" not in svg
+
+
+def test_optimize_strips_definitions_orphaned_by_other_removals():
+    svg = (
+        '<svg id="d"><defs><linearGradient id="g"><stop offset="0"/></linearGradient>'
+        '<marker id="m"><path fill="url(#g)" d="M0 0"/></marker></defs>'
+        '<path d="M0 0"/></svg>'
+    )
+    assert optimize_svg(svg) == '<svg id="d"><path d="M0 0"/></svg>'
+
+
+def test_optimize_leaves_foreign_objects_and_text_untouched():
+    for name in ("mermaid-flowchart.svg", "mermaid-sequence.svg"):
+        original = _fixture(name)
+        svg = optimize_svg(original)
+        assert _foreign_objects(svg) == _foreign_objects(original)
+    assert '<foreignObject width="23.125" height="24">' in optimize_svg(
+        _fixture("mermaid-flowchart.svg")
+    )
+    assert ">Hi #arrowhead 0.333333<" in optimize_svg(_fixture("mermaid-sequence.svg"))
+
+
+def test_optimize_rounds_geometry_only():
+    svg = optimize_svg(_fixture("mermaid-flowchart.svg"))
+
+    assert 'd="M48.53,62L48.53,66.17C48.53,70.33,48.53,78.67,' in svg
+    assert 'transform="translate(-11.56, -12)"' in svg
+    assert 'viewBox="0 0 97.06 254"' in svg
+    assert 'refX="5"' in svg
+    # Not geometry: styles and text keep their numbers.
+    assert "stroke-width: 1; stroke-dasharray: 1, 0;" in svg
+    assert ">yes 1.23456<" in svg
+
+
+def test_optimize_rounding_edge_cases():
+    svg = '<svg id="d"><path d="M-0.001 1.004 L2.5e-7 3.10 L.5 -.25 L10.4 20"/></svg>'
+    assert optimize_svg(svg) == (
+        '<svg id="d"><path d="M0 1 L2.5e-7 3.1 L0.5 -0.25 L10.4 20"/></svg>'
+    )
+    assert optimize_svg(svg, decimals=0) == (
+        '<svg id="d"><path d="M0 1 L2.5e-7 3 L0 0 L10 20"/></svg>'
+    )
+
+
+def test_optimize_minifies_css_without_changing_selectors():
+    svg = optimize_svg(_fixture("mermaid-flowchart.svg"))
+    style = re.search(r"<style>(.*?)</style>", svg).group(1)
+
+    assert "/*" not in style and "\n" not in style
+    assert "#mermaid-pre-0 .node rect,#mermaid-pre-0 .node circle{" in style
+    assert "{fill:#552222}" in style
+    assert "background-color:rgba(232,232,232,0.8);text-align:center}" in style
+    # The descendant combinator before a pseudo-class is significant.
+    assert "#mermaid-pre-0 :root{" in style
+
+
+def test_optimize_drops_comments_and_whitespace_between_tags():
+    svg = '<svg id="d">\n  <!-- note -->\n  <g>\n    <text>a  b</text>\n  </g>\n</svg>'
+    assert optimize_svg(svg) == '<svg id="d"><g><text>a  b</text></g></svg>'
+
+
+def test_optimize_is_idempotent_and_ignores_error_placeholders():
+    svg = optimize_svg(_fixture("mermaid-sequence.svg"))
+    assert optimize_svg(svg) == svg
+    placeholder = '<div style="color:red;">Diagram error: x</div>'
+    assert optimize_svg(placeholder) == placeholder
+
+
+# -- scope_ids -----------------------------------------------------------------
+
+
+def test_scope_ids_prefixes_fixed_ids_and_their_references():
+    svg = scope_ids(_fixture("mermaid-sequence.svg"), "mermaid-pre-1")
+
+    assert "mermaid-pre-1-arrowhead" in _ids(svg)
+    assert 'marker-end="url(#mermaid-pre-1-arrowhead)"' in svg
+    assert "#mermaid-pre-1 #mermaid-pre-1-arrowhead path{" in svg
+    assert all(element_id.startswith("mermaid-pre-1") for element_id in _ids(svg))
+
+
+def test_scope_ids_leaves_text_and_scoped_ids_alone():
+    svg = scope_ids(_fixture("mermaid-sequence.svg"), "mermaid-pre-1")
+    assert ">Hi #arrowhead 0.333333<" in svg
+
+    flowchart = _fixture("mermaid-flowchart.svg")
+    scoped = scope_ids(flowchart, "mermaid-pre-0")
+    assert "chart-title-mermaid-pre-0" in _ids(scoped)
+    assert 'aria-labelledby="chart-title-mermaid-pre-0"' in scoped
+    assert 'id="mermaid-pre-0-flowchart-A-0"' in scoped
+
+
+def test_scope_ids_renames_aria_references():
+    svg = (
+        '<svg id="dia-0" aria-labelledby="t dia-0-x" aria-describedby="desc">'
+        '<title id="t">T</title><desc id="desc">D</desc></svg>'
+    )
+    assert scope_ids(svg, "dia-0") == (
+        '<svg id="dia-0" aria-labelledby="dia-0-t dia-0-x" aria-describedby="dia-0-desc">'
+        '<title id="dia-0-t">T</title><desc id="dia-0-desc">D</desc></svg>'
+    )